@@ -0,0 +1,121 @@
+import os
+import sys
+import threading
+import cv2
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+
+parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_directory)
+from utils import display_bounding_boxes
+from preprocessing import encode_image, ENCODE_FORMATS
+from scanner import result_relpath
+from metrics import RunMetrics
+from streaming_upload import read_content
+from video import annotate_video, UnreadableVideoError
+
+
+ANNOTATION_FORMATS = ENCODE_FORMATS
+DEFAULT_ANNOTATION_QUALITY = 95
+DEFAULT_ANNOTATION_WORKERS = 2
+# Images waiting for (or being) annotated per worker before detection workers block
+ANNOTATION_QUEUE_PER_WORKER = 4
+
+
+def annotated_path(results_dir, filename, output_format=None):
+    # Nested inputs are written as <subdir>/annotated_<name> so they can't collide
+    subdir, name = os.path.split(result_relpath(filename))
+    if output_format is not None:
+        name = f"{os.path.splitext(name)[0]}.{output_format}"
+    return os.path.join(results_dir, subdir, f"annotated_{name}")
+
+
+class AnnotationPipeline:
+    # Draws detections on images on its own worker pool, fed through a bounded queue
+    # Images are decoded from bytes already in memory, so each file is only read from disk once
+    def __init__(
+        self,
+        results_dir,
+        workers=DEFAULT_ANNOTATION_WORKERS,
+        output_format=None,
+        quality=DEFAULT_ANNOTATION_QUALITY,
+        metrics=None
+    ):
+        self.results_dir = results_dir
+        self.output_format = output_format
+        self.quality = quality
+        self.metrics = metrics if metrics is not None else RunMetrics('annotation')
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(workers * ANNOTATION_QUEUE_PER_WORKER)
+        self._error = None
+
+    def submit(self, filename, image_bytes, dets):
+        if self._error is not None:
+            raise self._error
+        # Blocks the caller while the queue is full, so annotation can't fall unboundedly behind
+        with self.metrics.stage('annotate_wait'):
+            self._slots.acquire()
+        try:
+            self._executor.submit(self._run, filename, image_bytes, dets)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def submit_video(self, filename, video_path, keyframe_dets):
+        # The whole video is re-decoded and written with boxes interpolated between its sampled frames
+        if self._error is not None:
+            raise self._error
+        with self.metrics.stage('annotate_wait'):
+            self._slots.acquire()
+        try:
+            self._executor.submit(self._run, filename, video_path, keyframe_dets, self.annotate_video)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _run(self, filename, source, dets, annotate=None):
+        try:
+            (annotate or self.annotate)(filename, source, dets)
+        except Exception as e:
+            self._error = self._error or e
+        finally:
+            self._slots.release()
+
+    def annotate(self, filename, image_bytes, dets):
+        with self.metrics.stage('annotate_decode'):
+            # A large streamed file nothing else decoded is only read here, on the drawing thread
+            image = cv2.imdecode(np.frombuffer(read_content(image_bytes), dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"{filename} could not be decoded for annotation")
+        with self.metrics.stage('annotate_draw'):
+            drawn_image = display_bounding_boxes(image, dets)
+        output_path = annotated_path(self.results_dir, filename, self.output_format)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        output_format = self.output_format or os.path.splitext(filename)[1].lstrip('.').lower()
+        if output_format == 'jpeg':
+            output_format = 'jpg'
+        with self.metrics.stage('annotate_write'):
+            encoded = encode_image(drawn_image, output_format, self.quality)
+            with open(output_path, 'wb') as f:
+                f.write(encoded)
+        self.metrics.add_bytes('annotated', len(encoded))
+
+    def annotate_video(self, filename, video_path, keyframe_dets):
+        output_path = annotated_path(self.results_dir, filename, 'mp4')
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with self.metrics.stage('annotate_video'):
+            try:
+                annotate_video(video_path, keyframe_dets, output_path)
+            except UnreadableVideoError as e:
+                # Its detections are already in the results; only the drawn copy is missing
+                print(f"Skipping annotation of {filename}: {e}", file=sys.stderr)
+                self.metrics.increment('unreadable_videos')
+                return
+        self.metrics.add_bytes('annotated', os.path.getsize(output_path))
+
+    def close(self):
+        # Waits for queued annotations and surfaces the first failure
+        self._executor.shutdown(wait=True)
+        if self._error is not None:
+            raise self._error
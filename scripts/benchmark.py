@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import time
+import shlex
+import tempfile
+import subprocess
+import click
+import cv2
+import numpy as np
+
+parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_directory)
+from mock_server import MockSettings, start_mock_server_thread, DEFAULT_LATENCY_MS, DEFAULT_CAPACITY
+
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_SCRIPTS = {
+    'classification': ('classification_on_collection.py', ['-f', 'configs/classifier.json']),
+    'multi_classification': ('multi_classify_on_collection.py', ['-f', 'configs/classifier.json', '-f', 'configs/alt_classifier.json']),
+    'detection': ('detection_on_collection.py', ['-f', 'configs/detector.json'])
+}
+
+
+def make_synthetic_collection(data_dir, num_images, width, height, image_format='jpg', seed=0):
+    # Writes distinct, deterministic images: a noise background with a few random rectangles
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+    rng = np.random.default_rng(seed)
+    for index in range(num_images):
+        image = rng.integers(0, 256, size=(height // 8, width // 8, 3), dtype=np.uint8)
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_LINEAR)
+        for _ in range(3):
+            x1, y1 = int(rng.integers(0, width - 2)), int(rng.integers(0, height - 2))
+            x2, y2 = int(rng.integers(x1 + 1, width)), int(rng.integers(y1 + 1, height))
+            color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+            cv2.rectangle(image, (x1, y1), (x2, y2), color, -1)
+        cv2.imwrite(os.path.join(data_dir, f"synthetic_{index:07d}.{image_format}"), image)
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    return float(np.percentile(np.asarray(values), q))
+
+def run_script(script_name, script_args, env):
+    # Runs one collection script and returns (wall seconds, peak RSS in MiB, return code)
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(SCRIPTS_DIR, script_name)] + script_args,
+        cwd=parent_directory,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE
+    )
+    stderr_lines = []
+    for line in process.stderr:
+        stderr_lines.append(line)
+        stderr_lines = stderr_lines[-20:]
+    # wait4 reports this child's own peak RSS (kilobytes on Linux)
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall_seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        sys.stderr.write(b''.join(stderr_lines).decode(errors='replace'))
+    return wall_seconds, usage.ru_maxrss / 1024, process.returncode
+
+def benchmark(server, host, scenario, data_dir, work_dir, num_images, extra_args):
+    script_name, default_args = BENCHMARK_SCRIPTS[scenario]
+    results_dir = os.path.join(work_dir, f"results_{scenario}")
+    script_args = [
+        '-h', host,
+        '-d', data_dir,
+        '-r', results_dir,
+        '--cache-dir', os.path.join(work_dir, 'cache'),
+        '--no-cache',
+        '--redeploy'
+    ] + default_args + extra_args
+    env = {**os.environ, 'DIRECTAI_CLIENT_ID': 'benchmark', 'DIRECTAI_CLIENT_SECRET': 'benchmark'}
+    server.state.reset_stats()
+    wall_seconds, peak_rss_mb, returncode = run_script(script_name, script_args, env)
+    stats = server.state.stats()
+    latencies_ms = [latency * 1000 for latency in stats['latencies']]
+    return {
+        'scenario': scenario,
+        'images': num_images,
+        'returncode': returncode,
+        'wall_seconds': wall_seconds,
+        'images_per_second': num_images / wall_seconds if wall_seconds > 0 else float('nan'),
+        'p50_ms': percentile(latencies_ms, 50),
+        'p95_ms': percentile(latencies_ms, 95),
+        'p99_ms': percentile(latencies_ms, 99),
+        'peak_rss_mb': peak_rss_mb,
+        'requests': stats['request_counts'],
+        'statuses': stats['status_counts'],
+        'bytes_received': stats['bytes_received']
+    }
+
+def print_report(rows):
+    header = f"{'scenario':<22}{'images':>8}{'img/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak MiB':>10}{'exit':>6}"
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        print(
+            f"{row['scenario']:<22}{row['images']:>8}{row['images_per_second']:>10.1f}"
+            f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}"
+            f"{row['peak_rss_mb']:>10.1f}{row['returncode']:>6}"
+        )
+
+
+@click.command()
+@click.option('-s', '--scenario', type=click.Choice(list(BENCHMARK_SCRIPTS)), multiple=True, help='Script(s) to Benchmark (defaults to all)')
+@click.option('-n', '--num-images', default=200, type=click.IntRange(min=1), help='Size of the Synthetic Collection')
+@click.option('--image-size', default='1280x720', help='Synthetic Image Size as WIDTHxHEIGHT')
+@click.option('--image-format', default='jpg', type=click.Choice(['jpg', 'png']), help='Synthetic Image Format')
+@click.option('--work-dir', default=None, help='Directory for the Synthetic Collection and Results (defaults to a temporary directory)')
+@click.option('--latency-ms', default=DEFAULT_LATENCY_MS, type=click.FloatRange(min=0), help='Simulated Inference Latency (ms)')
+@click.option('--latency-jitter-ms', default=0.0, type=click.FloatRange(min=0), help='Uniform Jitter Added to the Latency (ms)')
+@click.option('--error-rate', default=0.0, type=click.FloatRange(0, 1), help='Fraction of Inference Requests Answered with 503')
+@click.option('--throttle-rate', default=0.0, type=click.FloatRange(0, 1), help='Fraction of Inference Requests Answered with 429')
+@click.option('--bandwidth-mbps', default=None, type=click.FloatRange(min=0, min_open=True), help='Simulated Upload Bandwidth (Mbit/s)')
+@click.option('--capacity', default=DEFAULT_CAPACITY, type=click.IntRange(min=1), help='Number of Requests the Mock Server Infers at Once')
+@click.option('--script-args', default='', help='Extra Arguments Passed to Every Script (e.g. "-n 16 --max-side 640")')
+@click.option('-o', '--output-json', default=None, help='File Path to Write the Report as JSON')
+def main(scenario, num_images, image_size, image_format, work_dir, latency_ms, latency_jitter_ms, error_rate, throttle_rate, bandwidth_mbps, capacity, script_args, output_json):
+    width, height = (int(v) for v in image_size.lower().split('x'))
+    work_dir = work_dir or tempfile.mkdtemp(prefix='directai_benchmark_')
+    data_dir = os.path.join(work_dir, 'data')
+    if not os.path.exists(data_dir) or len(os.listdir(data_dir)) != num_images:
+        print(f"Generating {num_images} synthetic {width}x{height} images in {data_dir}...")
+        make_synthetic_collection(data_dir, num_images, width, height, image_format)
+
+    settings = MockSettings(
+        latency_ms=latency_ms,
+        latency_jitter_ms=latency_jitter_ms,
+        error_rate=error_rate,
+        throttle_rate=throttle_rate,
+        bandwidth_mbps=bandwidth_mbps,
+        capacity=capacity
+    )
+    server, host = start_mock_server_thread(settings)
+    rows = []
+    try:
+        for name in scenario or list(BENCHMARK_SCRIPTS):
+            print(f"Running {name}...")
+            rows.append(benchmark(server, host, name, data_dir, work_dir, num_images, shlex.split(script_args)))
+    finally:
+        server.shutdown()
+
+    print_report(rows)
+    if output_json is not None:
+        with open(output_json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == '__main__':
+    main()
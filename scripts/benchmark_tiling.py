@@ -0,0 +1,166 @@
+import os
+import sys
+import json
+import shlex
+import tempfile
+import click
+import cv2
+import numpy as np
+
+parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_directory)
+from mock_server import MockSettings, start_mock_server_thread, DEFAULT_LATENCY_MS, DEFAULT_CAPACITY, DEFAULT_MODEL_INPUT_SIZE
+from benchmark import run_script, percentile
+from tiling import DEFAULT_TILE_OVERLAP, DEFAULT_TILE_CONCURRENCY
+from nms import box_iou
+
+
+GROUND_TRUTH_FILE = 'ground_truth.json'
+RECALL_IOU = 0.5
+
+
+def make_target_collection(data_dir, num_images, width, height, num_targets, min_target, max_target, seed=0):
+    # Gray noise with distractor rectangles and pure red square targets the mock server's targets mode looks for
+    # Returns {filename: [tlbr, ...]} of the targets
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+    rng = np.random.default_rng(seed)
+    ground_truth = {}
+    for index in range(num_images):
+        noise = rng.integers(40, 216, size=(height // 16, width // 16), dtype=np.uint8)
+        image = cv2.cvtColor(cv2.resize(noise, (width, height), interpolation=cv2.INTER_LINEAR), cv2.COLOR_GRAY2BGR)
+        for _ in range(10):
+            x1, y1 = int(rng.integers(0, width - 200)), int(rng.integers(0, height - 200))
+            size = int(rng.integers(50, 200))
+            # Green and blue stay high so distractors never pass for red targets
+            color = (int(rng.integers(80, 256)), int(rng.integers(80, 256)), int(rng.integers(0, 256)))
+            cv2.rectangle(image, (x1, y1), (x1 + size, y1 + size), color, -1)
+        boxes = []
+        for _ in range(num_targets):
+            size = int(rng.integers(min_target, max_target + 1))
+            x1, y1 = int(rng.integers(0, width - size)), int(rng.integers(0, height - size))
+            cv2.rectangle(image, (x1, y1), (x1 + size - 1, y1 + size - 1), (0, 0, 255), -1)
+            boxes.append([x1, y1, x1 + size, y1 + size])
+        filename = f"targets_{index:05d}.jpg"
+        cv2.imwrite(os.path.join(data_dir, filename), image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        ground_truth[filename] = boxes
+    with open(os.path.join(os.path.dirname(data_dir), GROUND_TRUTH_FILE), 'w') as f:
+        json.dump(ground_truth, f)
+    return ground_truth
+
+def recall(ground_truth, results):
+    # Fraction of targets matched one-to-one by a detection with IoU >= RECALL_IOU
+    found = total = 0
+    for filename, boxes in ground_truth.items():
+        dets = sorted(results.get(filename, []), key=lambda det: -det['score'])
+        unmatched = list(boxes)
+        total += len(boxes)
+        for det in dets:
+            ious = [box_iou(det['tlbr'], box) for box in unmatched]
+            if ious and max(ious) >= RECALL_IOU:
+                unmatched.pop(int(np.argmax(ious)))
+                found += 1
+    return found / total if total else float('nan')
+
+def run_mode(server, host, mode, data_dir, work_dir, ground_truth, mode_args, extra_args):
+    results_dir = os.path.join(work_dir, f"results_{mode}")
+    script_args = [
+        '-h', host,
+        '-d', data_dir,
+        '-r', results_dir,
+        '-c', 'target',
+        '--cache-dir', os.path.join(work_dir, 'cache'),
+        '--no-cache'
+    ] + mode_args + extra_args
+    env = {**os.environ, 'DIRECTAI_CLIENT_ID': 'benchmark', 'DIRECTAI_CLIENT_SECRET': 'benchmark'}
+    server.state.reset_stats()
+    wall_seconds, peak_rss_mb, returncode = run_script('detection_on_collection.py', script_args, env)
+    stats = server.state.stats()
+    latencies_ms = [latency * 1000 for latency in stats['latencies']]
+    results = {}
+    if returncode == 0:
+        with open(os.path.join(results_dir, 'detection_results.json')) as f:
+            results = json.load(f)
+    return {
+        'mode': mode,
+        'images': len(ground_truth),
+        'returncode': returncode,
+        'recall': recall(ground_truth, results),
+        'detections': sum(len(dets) for dets in results.values()),
+        'requests': stats['request_counts'].get('/detect', 0),
+        'wall_seconds': wall_seconds,
+        'seconds_per_image': wall_seconds / len(ground_truth),
+        'p50_ms': percentile(latencies_ms, 50),
+        'p95_ms': percentile(latencies_ms, 95),
+        'peak_rss_mb': peak_rss_mb,
+        'bytes_received': stats['bytes_received']
+    }
+
+def print_report(rows, num_targets):
+    header = f"{'mode':<8}{'images':>8}{'recall':>9}{'dets':>8}{'requests':>10}{'s/img':>8}{'p50 ms':>9}{'p95 ms':>9}{'MB sent':>9}{'exit':>6}"
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        print(
+            f"{row['mode']:<8}{row['images']:>8}{row['recall']:>9.3f}{row['detections']:>8}{row['requests']:>10}"
+            f"{row['seconds_per_image']:>8.2f}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+            f"{row['bytes_received'] / 1e6:>9.1f}{row['returncode']:>6}"
+        )
+    print(f"({num_targets} targets per image)")
+
+
+@click.command()
+@click.option('-n', '--num-images', default=20, type=click.IntRange(min=1), help='Size of the Synthetic Collection')
+@click.option('--image-size', default='7680x4320', help='Synthetic Image Size as WIDTHxHEIGHT')
+@click.option('--targets', default=20, type=click.IntRange(min=1), help='Targets per Image')
+@click.option('--min-target', default=8, type=click.IntRange(min=2), help='Smallest Target Side (pixels)')
+@click.option('--max-target', default=48, type=click.IntRange(min=2), help='Largest Target Side (pixels)')
+@click.option('--tile-size', default=DEFAULT_MODEL_INPUT_SIZE, type=click.IntRange(min=64), help='Tile Size for the Tiled Run')
+@click.option('--tile-overlap', default=DEFAULT_TILE_OVERLAP, type=click.IntRange(min=0), help='Overlap Between Neighboring Tiles (pixels)')
+@click.option('--tile-concurrency', default=DEFAULT_TILE_CONCURRENCY, type=click.IntRange(min=1), help='Maximum Number of Concurrent Tile Requests per Image')
+@click.option('--model-input-size', default=DEFAULT_MODEL_INPUT_SIZE, type=click.IntRange(min=32), help='Long Side the Mock Server Shrinks Each Upload To')
+@click.option('--work-dir', default=None, help='Directory for the Synthetic Collection and Results (defaults to a temporary directory)')
+@click.option('--latency-ms', default=DEFAULT_LATENCY_MS, type=click.FloatRange(min=0), help='Simulated Inference Latency (ms)')
+@click.option('--bandwidth-mbps', default=None, type=click.FloatRange(min=0, min_open=True), help='Simulated Upload Bandwidth (Mbit/s)')
+@click.option('--capacity', default=DEFAULT_CAPACITY, type=click.IntRange(min=1), help='Number of Requests the Mock Server Infers at Once')
+@click.option('--script-args', default='', help='Extra Arguments Passed to Both Runs (e.g. "-n 8")')
+@click.option('-o', '--output-json', default=None, help='File Path to Write the Report as JSON')
+def main(num_images, image_size, targets, min_target, max_target, tile_size, tile_overlap, tile_concurrency, model_input_size, work_dir, latency_ms, bandwidth_mbps, capacity, script_args, output_json):
+    width, height = (int(v) for v in image_size.lower().split('x'))
+    work_dir = work_dir or tempfile.mkdtemp(prefix='directai_tiling_benchmark_')
+    data_dir = os.path.join(work_dir, 'data')
+    ground_truth_path = os.path.join(work_dir, GROUND_TRUTH_FILE)
+    if os.path.exists(ground_truth_path) and len(os.listdir(data_dir)) == num_images:
+        with open(ground_truth_path) as f:
+            ground_truth = json.load(f)
+    else:
+        print(f"Generating {num_images} synthetic {width}x{height} images with {targets} targets each in {data_dir}...")
+        ground_truth = make_target_collection(data_dir, num_images, width, height, targets, min_target, max_target)
+
+    settings = MockSettings(
+        latency_ms=latency_ms,
+        bandwidth_mbps=bandwidth_mbps,
+        capacity=capacity,
+        detect_mode='targets',
+        model_input_size=model_input_size
+    )
+    server, host = start_mock_server_thread(settings)
+    modes = [
+        ('whole', []),
+        ('tiled', ['--tile-size', str(tile_size), '--tile-overlap', str(tile_overlap), '--tile-concurrency', str(tile_concurrency)])
+    ]
+    rows = []
+    try:
+        for mode, mode_args in modes:
+            print(f"Running {mode}-image detection...")
+            rows.append(run_mode(server, host, mode, data_dir, work_dir, ground_truth, mode_args, shlex.split(script_args)))
+    finally:
+        server.shutdown()
+
+    print_report(rows, targets)
+    if output_json is not None:
+        with open(output_json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == '__main__':
+    main()
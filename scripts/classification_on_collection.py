@@ -1,21 +1,16 @@
 import os
 import sys
 import json
-import requests
 import shutil
 import click
 
-from dotenv import load_dotenv
-from tqdm import tqdm
-
 parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(parent_directory)
-from utils import get_directai_access_token, get_file_data
-
+from collection_run import CollectionRun, collection_options, folder_options
+from foldering import ResultFolderer
+from scanner import result_relpath
+from inference_cache import hash_body
 
-load_dotenv()
-DIRECTAI_CLIENT_ID = os.getenv("DIRECTAI_CLIENT_ID")
-DIRECTAI_CLIENT_SECRET = os.getenv("DIRECTAI_CLIENT_SECRET")
 
 def get_classifier_body(config_file_path, class_name=None):
     if (class_name is not None) and len(class_name) > 0:
@@ -33,15 +28,10 @@ def get_classifier_body(config_file_path, class_name=None):
     
     return body
 
-def deploy_classifier(host, body, access_token):
-    headers = {
-        'Authorization': f"Bearer {access_token}"
-    }
-    
+def deploy_classifier(client, body):
     # Deploy Classifier
-    deploy_response = requests.post(
-        f"{host}/deploy_classifier",
-        headers=headers,
+    deploy_response = client.post(
+        "/deploy_classifier",
         json=body
     )
     if deploy_response.status_code != 200:
@@ -50,69 +40,79 @@ def deploy_classifier(host, body, access_token):
     
     return deployed_classifier_id
 
-def prep_classification_results_dir(body, results_dir):
+def prep_classification_results_dir(body, results_dir, clean=False, create_class_dirs=True):
     # Prepares Results Directory
+    # Existing class folders are kept unless clean is set, so re-runs only add what changed
     if not os.path.exists(results_dir):
         os.makedirs(results_dir)
     for config in body['classifier_configs']:
         label = config['name']
         class_dir = f"{results_dir}/{label}"
-        if os.path.exists(class_dir):
+        if clean and os.path.exists(class_dir):
             shutil.rmtree(class_dir) 
-        os.makedirs(class_dir)
+        if create_class_dirs:
+            os.makedirs(class_dir, exist_ok=True)
 
 @click.command()
-@click.option('-h', '--host', default='https://api.alpha.directai.io', help='DirectAI Host')
-@click.option('-d', '--data-dir', default='data', help='Directory for Input Data')
-@click.option('-r', '--results-dir', default='results', help='Directory for Results')
+@collection_options
 @click.option('-f', '--config-file-path', default='configs/classifier.json', help='File Path for Classifier Configuration')
 @click.option('-c', '--class-name', help='Class to Predict', multiple=True)
-def main(host, data_dir, results_dir, config_file_path, class_name):
-    # Get Access Token
-    access_token = get_directai_access_token(
-        client_id=DIRECTAI_CLIENT_ID,
-        client_secret=DIRECTAI_CLIENT_SECRET,
-        auth_endpoint=host+"/token"
+@folder_options
+def main(config_file_path, class_name, folder_mode, clean_results, **options):
+    run = CollectionRun('classification', **options)
+    classifier_body = get_classifier_body(config_file_path, class_name)
+    deployment = run.deployment('classifier', classifier_body, deploy_classifier)
+    deployment.ensure()
+    prep_classification_results_dir(
+        classifier_body,
+        run.results_dir,
+        clean=clean_results and not run.resume,
+        create_class_dirs=folder_mode != 'none'
     )
+    classifier_body_hash = hash_body(classifier_body)
+    # Places predicted images into class folders
+    folderer = ResultFolderer(folder_mode)
     
-    classifier_body = get_classifier_body(config_file_path, class_name)
-    deployed_classifier_id = deploy_classifier(host, classifier_body, access_token)
-    prep_classification_results_dir(classifier_body, results_dir)
-    # Compiled Results
-    results = {}
+    def upload_file(file_data, cache_key):
+        _, result, _ = run.upload(
+            "/classify",
+            [deployment],
+            lambda deployed_ids: {'deployed_id': deployed_ids[0]},
+            file_data
+        )
+        if run.cache is not None:
+            run.cache.put(cache_key, result)
+        return result
     
-    headers = {
-        'Authorization': f"Bearer {access_token}"
-    }
+    def classify_file(item):
+        filename, frame = item
+        file_data = run.read(filename, frame)
+        result = None
+        cache_key = None
+        if run.cache is not None:
+            cache_key = run.cache_key('classify', file_data, classifier_body_hash)
+            result = run.cache_get(cache_key)
+        if result is None:
+            # A near-duplicate waits for (or reuses) its representative's prediction instead of being uploaded
+            result, duplicate = run.infer_or_reuse(filename, file_data, lambda: upload_file(file_data, cache_key))
+            if duplicate is not None:
+                # Marked in its own result too, so the JSON/.col results and merged shards keep the mapping
+                result = {**result, 'duplicate_of': {'representative': duplicate['representative'], 'distance': duplicate['distance']}}
+        if frame is not None:
+            # Frames have no file of their own to place; their predictions are in the results only
+            return result
+        prediction = result['pred']
+        with run.metrics.stage('folder'):
+            folderer.place(
+                os.path.join(run.data_dir, filename),
+                f"{run.results_dir}/{prediction}/{result_relpath(filename)}"
+            )
+        return result
     
     # Run Classification on Data Collection
-    for filename in tqdm(os.listdir(data_dir)):
-        if filename == '.DS_Store':
-            continue
-        params = {
-            'deployed_id': deployed_classifier_id
-        }
-        file_data = get_file_data(f"{data_dir}/{filename}")
-        classify_response = requests.post(
-            f"{host}/classify",
-            headers=headers, 
-            params=params,
-            files=file_data
-        )
-        if classify_response.status_code != 200:
-            raise ValueError(classify_response.json())
-        results[filename] = classify_response.json()
-        prediction = results[filename]['pred']
-        shutil.copy(
-            f"{data_dir}/{filename}",
-            f"{results_dir}/{prediction}/{filename}"
-        )
-    
+    run.run(classify_file)
     # Save Inference Results
-    with open(f"{results_dir}/classification_results.json", 'w') as f:
-        json.dump(results, f)
+    run.finish([folderer.summary()])
     
 if __name__ == '__main__':
     main()
-    
-    
\ No newline at end of file
@@ -0,0 +1,255 @@
+import os
+import sys
+import time
+import click
+
+from dotenv import load_dotenv
+
+parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_directory)
+from utils import bounded_map
+from directai_client import DirectAIClient, DEFAULT_POOL_SIZE
+from streaming_upload import DEFAULT_UPLOAD_BUDGET_MB
+from deployment_registry import Deployment, open_deployment_registry, post_to_deployments
+from preprocessing import PreprocessOptions, PreprocessStats, timed_preprocess, ENCODE_FORMATS, DEFAULT_ENCODE_QUALITY
+from results_writer import open_results_writer, compact_jsonl_to_json, DEFAULT_FLUSH_EVERY
+from columnar_results import compact_results, RESULTS_FORMATS
+from foldering import FOLDER_MODES, DEFAULT_FOLDER_MODE
+from scanner import iter_collection, count_collection, shard_option, shard_results_dir, ScanStats, SUPPORTED_IMAGE_EXTENSIONS
+from scheduler import RequestScheduler, DEFAULT_MAX_RETRIES
+from metrics import RunMetrics, metrics_paths, track_progress
+from dedup import NearDuplicateIndex, infer_or_reuse, DEFAULT_DEDUP_RADIUS
+from video import expand_videos, load_file_data, VIDEO_EXTENSIONS
+from inference_cache import open_inference_cache, make_cache_key, DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_MB
+
+
+load_dotenv()
+DIRECTAI_CLIENT_ID = os.getenv("DIRECTAI_CLIENT_ID")
+DIRECTAI_CLIENT_SECRET = os.getenv("DIRECTAI_CLIENT_SECRET")
+
+# Options every collection script takes, in --help order; each script adds its own config and output options
+COLLECTION_OPTIONS = [
+    click.option('-h', '--host', default='https://api.alpha.directai.io', help='DirectAI Host'),
+    click.option('-d', '--data-dir', default='data', help='Directory for Input Data'),
+    click.option('-r', '--results-dir', default='results', help='Directory for Results'),
+    click.option('-n', '--max-in-flight', default=4, type=click.IntRange(min=1), help='Maximum Number of Concurrent Requests'),
+    click.option('--pool-size', default=DEFAULT_POOL_SIZE, type=click.IntRange(min=1), help='Maximum Number of Keep-Alive Connections'),
+    click.option('--cache-dir', default=DEFAULT_CACHE_DIR, help='Directory for the Inference Result Cache'),
+    click.option('--cache-max-mb', default=DEFAULT_CACHE_MAX_MB, type=click.FloatRange(min=0), help='Maximum Size of the Inference Result Cache (MB)'),
+    click.option('--no-cache', is_flag=True, default=False, help='Flag to bypass the inference result cache'),
+    click.option('--clear-cache', is_flag=True, default=False, help='Flag to invalidate the inference result cache before running'),
+    click.option('--redeploy', is_flag=True, default=False, help='Flag to deploy configs fresh instead of reusing registered deployment IDs'),
+    click.option('--max-side', default=None, type=click.IntRange(min=1), help='Downscale images so their long side is at most this many pixels before upload'),
+    click.option('--encode-format', default=None, type=click.Choice(ENCODE_FORMATS), help='Re-encode images in this format before upload'),
+    click.option('--encode-quality', default=DEFAULT_ENCODE_QUALITY, type=click.IntRange(1, 100), help='JPEG Quality for Re-encoded Images'),
+    click.option('--png-to-jpeg', is_flag=True, default=False, help='Flag to convert PNG images to JPEG before upload'),
+    click.option('--resume', is_flag=True, default=False, help='Flag to skip files already recorded by a previous run in the same results directory'),
+    click.option('--flush-every', default=DEFAULT_FLUSH_EVERY, type=click.IntRange(min=1), help='Number of Results Buffered Before Each Write to Disk'),
+    click.option('--recursive', is_flag=True, default=False, help='Flag to include images in subdirectories of the data directory'),
+    click.option('--include', multiple=True, help='Glob of Files to Process (e.g. "*.png"); repeat as necessary'),
+    click.option('--exclude', multiple=True, help='Glob of Files to Skip; repeat as necessary'),
+    click.option('--manifest', default=None, help='File Listing Paths to Process, one per line ("-" for stdin)'),
+    click.option('--shard', default=None, callback=shard_option, help='Process Only Shard i of N (e.g. 2/4), Split by a Stable Hash of Each File Path'),
+    click.option('--max-retries', default=DEFAULT_MAX_RETRIES, type=click.IntRange(min=0), help='Retries per Request on 429/5xx/Connection Errors'),
+    click.option('--rate-limit', default=None, type=click.FloatRange(min=0, min_open=True), help='Maximum Requests per Second'),
+    click.option('--upload-budget-mb', default=DEFAULT_UPLOAD_BUDGET_MB, type=click.FloatRange(min=0), help='Maximum Upload Bytes in Flight Across All Requests (MB); 0 for no cap'),
+    click.option('--no-adaptive-concurrency', is_flag=True, default=False, help='Flag to keep max-in-flight requests fixed instead of backing off when the server is saturated'),
+    click.option('--dedup', is_flag=True, default=False, help='Flag to reuse the results of a near-identical image instead of uploading each copy'),
+    click.option('--dedup-radius', default=DEFAULT_DEDUP_RADIUS, type=click.IntRange(0, 32), help='Maximum Perceptual-Hash Distance (bits of 64) Between Near-Duplicates'),
+    click.option('--frame-stride', default=None, type=click.IntRange(min=1), help='Submit Every Nth Frame of Video Files'),
+    click.option('--frame-interval', default=None, type=click.FloatRange(min=0, min_open=True), help='Submit One Video Frame per This Many Seconds (default 1s unless --frame-stride is set)'),
+    click.option('--results-format', default='json', type=click.Choice(RESULTS_FORMATS), help='Format of the Final Results File: JSON, or a Memory-Mappable Columnar .col File'),
+    click.option('--metrics-file', default=None, help='File Path for Run Metrics JSON (defaults to the results directory); a Prometheus .prom file is written alongside'),
+    click.option('--live-metrics', is_flag=True, default=False, help='Flag to show a per-stage latency breakdown next to the progress bar')
+]
+
+# Class-folder options of the classification scripts
+FOLDER_OPTIONS = [
+    click.option('--folder-mode', default=DEFAULT_FOLDER_MODE, type=click.Choice(FOLDER_MODES), help='How images are placed into class folders'),
+    click.option('--clean-results', is_flag=True, default=False, help='Flag to empty existing class folders before running')
+]
+
+
+def apply_options(options):
+    def decorate(command):
+        for option in reversed(options):
+            command = option(command)
+        return command
+    return decorate
+
+collection_options = apply_options(COLLECTION_OPTIONS)
+folder_options = apply_options(FOLDER_OPTIONS)
+
+
+class CollectionRun:
+    # Everything a collection script sets up around its per-file work: the scheduler, client, deployment registry,
+    # cache, preprocessing, metrics, results logs and near-duplicate index, the file scan and the end-of-run summary
+    # Takes the options from collection_options as keyword arguments
+    def __init__(
+        self, job, host, data_dir, results_dir, max_in_flight, pool_size, cache_dir, cache_max_mb, no_cache, clear_cache,
+        redeploy, max_side, encode_format, encode_quality, png_to_jpeg, resume, flush_every, recursive, include, exclude,
+        manifest, shard, max_retries, rate_limit, upload_budget_mb, no_adaptive_concurrency, dedup, dedup_radius,
+        frame_stride, frame_interval, results_format, metrics_file, live_metrics
+    ):
+        self.job = job
+        self.results_name = f"{job}_results"
+        self.data_dir = data_dir
+        # A shard writes everything under its own subdirectory, so nodes sharing results_dir never collide
+        self.results_dir = shard_results_dir(results_dir, shard)
+        self.max_in_flight = max_in_flight
+        self.resume = resume
+        self.flush_every = flush_every
+        self.scan_options = {'recursive': recursive, 'include': include, 'exclude': exclude, 'manifest': manifest, 'shard': shard}
+        self.frame_stride = frame_stride
+        self.frame_interval = frame_interval
+        self.results_format = results_format
+        self.metrics_file = metrics_file
+        self.live_metrics = live_metrics
+        # Retries, rate limiting and an adaptive window of at most max_in_flight requests
+        self.scheduler = RequestScheduler(
+            max_concurrency=max_in_flight,
+            rate_limit=rate_limit,
+            max_retries=max_retries,
+            adaptive=not no_adaptive_concurrency
+        )
+        # Shared Client (fetches and refreshes the access token on demand)
+        self.client = DirectAIClient(
+            host,
+            client_id=DIRECTAI_CLIENT_ID,
+            client_secret=DIRECTAI_CLIENT_SECRET,
+            pool_size=max(pool_size, max_in_flight),
+            scheduler=self.scheduler,
+            upload_budget_bytes=upload_budget_mb * 1e6
+        )
+        self.client.get_access_token()
+        # Deployed IDs registered for unchanged configs are reused unless redeploy is set
+        self.deployment_registry = open_deployment_registry(cache_dir)
+        self.redeploy = redeploy
+        # Inference Result Cache (keyed by image bytes + config body)
+        self.cache = open_inference_cache(cache_dir, cache_max_mb, no_cache, clear_cache)
+        # Client-Side Preprocessing (runs in the worker threads)
+        self.preprocess_options = PreprocessOptions(max_side, encode_format, encode_quality, png_to_jpeg)
+        self.preprocess_stats = PreprocessStats()
+        # Per-stage timings and byte counts, written next to the results at exit
+        self.metrics = RunMetrics(job)
+        # Near-duplicate suppression (perceptual hashes, looked up within dedup_radius bits)
+        self.dedup_index = NearDuplicateIndex(dedup_radius) if dedup else None
+        self.duplicates_writer = None
+        self.results_jsonl_path = None
+        self.scan_stats = ScanStats()
+
+    def deployment(self, model_type, body, deploy):
+        return Deployment(self.client, model_type, body, deploy, registry=self.deployment_registry, reuse=not self.redeploy)
+
+    def read(self, filename, frame):
+        # Video frames arrive already decoded (keyed file#frame_index) and are encoded here in the worker
+        with self.metrics.stage('read'):
+            file_data = load_file_data(self.data_dir, filename, frame, self.preprocess_options.encode_format, self.preprocess_options.encode_quality)
+        self.metrics.add_bytes('read', len(file_data['data'][1]))
+        return file_data
+
+    def cache_key(self, kind, file_data, body_hash, variant=''):
+        return make_cache_key(self.client, kind, file_data['data'][1], body_hash, self.preprocess_options.signature() + variant)
+
+    def cache_get(self, cache_key):
+        with self.metrics.stage('cache_lookup'):
+            result = self.cache.get(cache_key)
+        if result is not None:
+            self.metrics.increment('cache_hits')
+        return result
+
+    def post(self, path, deployments, make_data, upload_data):
+        # Returns (deployed IDs, parsed response, request seconds); anything but a 200 stops the run
+        upload_start = time.perf_counter()
+        deployed_ids, response = post_to_deployments(self.client, path, deployments, make_data, files=upload_data)
+        # Upload and server inference as seen from the client, including retries
+        request_seconds = time.perf_counter() - upload_start
+        self.metrics.observe('request', request_seconds)
+        self.metrics.add_bytes('uploaded', len(upload_data['data'][1]))
+        self.metrics.add_bytes('downloaded', len(response.content))
+        if response.status_code != 200:
+            raise ValueError(response.json())
+        return deployed_ids, response.json(), request_seconds
+
+    def upload(self, path, deployments, make_data, file_data):
+        # post() of the preprocessed file; also returns the factors mapping uploaded pixel coordinates back to the original
+        upload_data, factors, preprocess_seconds = timed_preprocess(file_data, self.preprocess_options)
+        if self.preprocess_options.enabled:
+            self.metrics.observe('preprocess', preprocess_seconds)
+        deployed_ids, result, request_seconds = self.post(path, deployments, make_data, upload_data)
+        self.preprocess_stats.record(
+            len(file_data['data'][1]),
+            len(upload_data['data'][1]),
+            preprocess_seconds,
+            request_seconds
+        )
+        return deployed_ids, result, factors
+
+    def infer_or_reuse(self, filename, file_data, infer):
+        # infer() unless dedup is on and a near-identical image's result can be reused
+        # Returns (result, duplicate); reuses are logged to the duplicates file
+        if self.dedup_index is None:
+            return infer(), None
+        result, duplicate = infer_or_reuse(self.dedup_index, filename, file_data['data'][1], infer)
+        if duplicate is not None:
+            self.duplicates_writer.write(filename, {'representative': duplicate['representative'], 'distance': duplicate['distance']})
+            self.metrics.increment('duplicates')
+        return result, duplicate
+
+    def run(self, process, on_result=None):
+        # Runs process((filename, frame)) over the collection on max_in_flight workers, logging each result in listing order
+        os.makedirs(self.results_dir, exist_ok=True)
+        results_writer, completed_filenames = open_results_writer(self.results_dir, self.results_name, self.flush_every, self.resume)
+        self.results_jsonl_path = results_writer.jsonl_path
+        if self.dedup_index is not None:
+            # Which files reused which representative's result
+            self.duplicates_writer, _ = open_results_writer(self.results_dir, f"{self.job}_duplicates", self.flush_every, self.resume)
+        extensions = SUPPORTED_IMAGE_EXTENSIONS + VIDEO_EXTENSIONS
+        # Files are enumerated lazily, so inference starts before a large tree has been fully scanned
+        filenames = iter_collection(self.data_dir, extensions=extensions, skip=completed_filenames, stats=self.scan_stats, **self.scan_options)
+        # Progress bar total, when counting the files first costs no more than a flat listing
+        total = count_collection(
+            self.data_dir,
+            extensions=extensions,
+            skip=completed_filenames,
+            uncountable_extensions=VIDEO_EXTENSIONS,
+            **self.scan_options
+        )
+        # Videos are decoded in-process and only every sampled frame is submitted
+        items = expand_videos(self.data_dir, filenames, self.frame_stride, self.frame_interval, completed_filenames, self.scan_stats)
+        with results_writer:
+            for (filename, _), result in track_progress(bounded_map(process, items, self.max_in_flight), self.metrics, self.live_metrics, total):
+                with self.metrics.stage('write_results'):
+                    results_writer.write(filename, result)
+                if on_result is not None:
+                    on_result(filename, result)
+                self.metrics.increment('images')
+
+    def finish(self, summaries=()):
+        # Compacts the results, writes the metrics and prints the run summary; summaries are the script's own, or None
+        with self.metrics.stage(f"compact_{self.results_format}"):
+            duplicates_path = None
+            if self.duplicates_writer is not None:
+                self.duplicates_writer.close()
+                compact_jsonl_to_json(self.duplicates_writer.jsonl_path, f"{self.results_dir}/{self.job}_duplicates.json")
+                duplicates_path = self.duplicates_writer.jsonl_path
+            compact_results(self.results_jsonl_path, self.results_dir, self.results_name, self.results_format, duplicates_path)
+        self.metrics.increment('requests', self.scheduler.requests)
+        self.metrics.increment('retries', self.scheduler.retries)
+        self.metrics.write(*metrics_paths(self.results_dir, self.results_name, self.metrics_file))
+        print(self.scan_stats.summary())
+        print(self.scheduler.summary())
+        if self.client.upload_budget is not None:
+            print(self.client.upload_budget.summary())
+        if self.preprocess_options.enabled:
+            print(self.preprocess_stats.summary())
+        if self.dedup_index is not None:
+            print(self.dedup_index.summary())
+        for summary in summaries:
+            if summary is not None:
+                print(summary)
+        if self.cache is not None:
+            print(self.cache.summary())
+            self.cache.close()
+        print(self.metrics.summary())
+        self.client.close()
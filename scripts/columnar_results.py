@@ -0,0 +1,409 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import click
+import numpy as np
+
+parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_directory)
+from results_writer import iter_results, iter_jsonl_results, compact_jsonl_to_json
+
+
+COLUMNAR_EXTENSION = '.col'
+RESULTS_FORMATS = ('json', 'columnar')
+MAGIC = b'DAICOL1\n'
+ALIGNMENT = 64
+
+
+# The fields each kind of result is stored with; anything else is an error rather than silently dropped
+BOX_FIELDS = {'tlbr', 'score', 'class'}
+CLASSIFICATION_FIELDS = {'scores', 'pred', 'duplicate_of'}
+MULTI_CLASSIFICATION_FIELDS = {'scores', 'pred'}
+
+
+def result_kind(result):
+    # Detection results are lists of boxes; classification results are {'scores': ..., 'pred': ...}
+    # and multi-classification results map each deployed classifier ID to one of those
+    if isinstance(result, list):
+        return 'detection'
+    if isinstance(result, dict) and 'scores' in result:
+        return 'classification'
+    if isinstance(result, dict) and result and all(isinstance(value, dict) and 'scores' in value for value in result.values()):
+        return 'multi_classification'
+    raise ValueError("Only detection, classification and multi-classification results can be stored in columnar form")
+
+def check_fields(key, fields, known):
+    unknown = set(fields) - known
+    if unknown:
+        raise ValueError(f"{key} has result fields the columnar format doesn't store ({', '.join(sorted(unknown))}); write JSON results instead")
+
+
+class ColumnSpool:
+    # Appends one array's rows to a temporary file, so a columnar file is written without holding the collection in memory
+    def __init__(self, directory, name, dtype, row_shape=()):
+        self.path = os.path.join(directory, name)
+        self.dtype = np.dtype(dtype)
+        self.row_shape = row_shape
+        self.rows = 0
+        self._file = open(self.path, 'wb')
+
+    def append(self, values):
+        values = np.asarray(values, dtype=self.dtype).reshape((-1,) + self.row_shape)
+        self._file.write(values.tobytes())
+        self.rows += len(values)
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def shape(self):
+        return (self.rows,) + self.row_shape
+
+
+def write_columnar(results, output_path, kind=None, duplicates=None):
+    # results is an iterable of (key, result) pairs, e.g. iter_results(path); returns the number of keys written
+    # duplicates maps a near-duplicate's key to {'representative', 'distance'}; classification results may also carry it as 'duplicate_of'
+    # Layout: MAGIC, an 8-byte header length, a JSON header listing each array's dtype/shape/offset, then the arrays, 64-byte aligned
+    work_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        spools = {}
+        encoded_keys = []
+        class_ids = {}
+        # Multi-classification: {deployed classifier ID: {class name: column}} in the first result's order
+        classifiers = {}
+        seen_keys = set()
+        duplicate_rows = []
+
+        def spool(name, dtype, row_shape=()):
+            if name not in spools:
+                spools[name] = ColumnSpool(work_dir, name, dtype, row_shape)
+            return spools[name]
+
+        for key, result in results:
+            encoded_key = key.encode()
+            if encoded_key in seen_keys:
+                # First result wins, as when compacting to JSON
+                continue
+            seen_keys.add(encoded_key)
+            encoded_keys.append(encoded_key)
+            kind = kind or result_kind(result)
+            duplicate = result.get('duplicate_of') if isinstance(result, dict) else None
+            duplicate = duplicate or (duplicates or {}).get(key)
+            if duplicate is not None:
+                duplicate_rows.append((len(encoded_keys) - 1, duplicate['representative'], duplicate['distance']))
+            spool('key_bytes', np.uint8).append(np.frombuffer(encoded_key, dtype=np.uint8))
+            if kind == 'detection':
+                for det in result:
+                    check_fields(key, det, BOX_FIELDS)
+                spool('box_counts', np.int64).append([len(result)])
+                if result:
+                    spool('tlbr', np.float32, (4,)).append([det['tlbr'] for det in result])
+                    spool('scores', np.float32).append([det['score'] for det in result])
+                    spool('class_ids', np.int32).append([class_ids.setdefault(det['class'], len(class_ids)) for det in result])
+            elif kind == 'multi_classification':
+                # One score matrix and prediction column per classifier, numbered in the first result's order
+                if not classifiers:
+                    for deployed_id, classifier_result in result.items():
+                        classifiers[deployed_id] = {name: index for index, name in enumerate(classifier_result['scores'])}
+                if set(result) != set(classifiers):
+                    raise ValueError(f"{key} has different classifiers than the rest of the collection")
+                for number, (deployed_id, classifier_class_ids) in enumerate(classifiers.items()):
+                    classifier_result = result[deployed_id]
+                    check_fields(key, classifier_result, MULTI_CLASSIFICATION_FIELDS)
+                    if set(classifier_result['scores']) != set(classifier_class_ids):
+                        raise ValueError(f"{key} has different classes for {deployed_id} than the rest of the collection")
+                    spool(f'scores_{number}', np.float32, (len(classifier_class_ids),)).append(
+                        [classifier_result['scores'][name] for name in classifier_class_ids]
+                    )
+                    spool(f'pred_{number}', np.int32).append([classifier_class_ids[classifier_result['pred']]])
+            else:
+                check_fields(key, result, CLASSIFICATION_FIELDS)
+                # Class columns come from the first result; classification collections share one class list
+                if not class_ids:
+                    class_ids.update((name, index) for index, name in enumerate(result['scores']))
+                if set(result['scores']) != set(class_ids):
+                    raise ValueError(f"{key} has different classes than the rest of the collection")
+                spool('scores', np.float32, (len(class_ids),)).append([result['scores'][name] for name in class_ids])
+                spool('pred', np.int32).append([class_ids[result['pred']]])
+
+        for column in spools.values():
+            column.close()
+        kind = kind or 'detection'
+        arrays = {
+            'key_offsets': np.concatenate(([0], np.cumsum([len(key) for key in encoded_keys], dtype=np.int64))),
+            # Keys sorted bytewise, for binary-search lookups by key
+            'key_order': np.asarray(sorted(range(len(encoded_keys)), key=encoded_keys.__getitem__), dtype=np.int64)
+        }
+        if kind == 'detection':
+            box_counts = np.fromfile(spools.pop('box_counts').path, dtype=np.int64) if 'box_counts' in spools else np.zeros(0, dtype=np.int64)
+            arrays['box_offsets'] = np.concatenate(([0], np.cumsum(box_counts)))
+        if 'key_bytes' not in spools:
+            arrays['key_bytes'] = np.zeros(0, dtype=np.uint8)
+        if duplicate_rows:
+            # Row of the representative whose result a near-duplicate reused (-1 for everything else)
+            rows = {encoded_key: row for row, encoded_key in enumerate(encoded_keys)}
+            arrays['duplicate_of'] = np.full(len(encoded_keys), -1, dtype=np.int64)
+            arrays['duplicate_distance'] = np.full(len(encoded_keys), -1, dtype=np.int32)
+            for row, representative, distance in duplicate_rows:
+                if representative.encode() not in rows:
+                    raise ValueError(f"{encoded_keys[row].decode()} reused the result of {representative}, which isn't in the results")
+                arrays['duplicate_of'][row] = rows[representative.encode()]
+                arrays['duplicate_distance'][row] = distance
+
+        # Array order in the file: small index arrays first, then the spooled columns copied straight from disk
+        layout = [(name, array.dtype, array.shape, array) for name, array in arrays.items()]
+        layout += [(name, column.dtype, column.shape, column.path) for name, column in spools.items()]
+        if kind == 'detection':
+            for name, dtype, row_shape in (('tlbr', np.float32, (4,)), ('scores', np.float32, ()), ('class_ids', np.int32, ())):
+                if name not in spools:
+                    layout.append((name, np.dtype(dtype), (0,) + row_shape, np.zeros((0,) + row_shape, dtype=dtype)))
+        header = {
+            'kind': kind,
+            'count': len(encoded_keys),
+            'class_names': list(class_ids),
+            'classifiers': [{'id': deployed_id, 'class_names': list(classifier_class_ids)} for deployed_id, classifier_class_ids in classifiers.items()],
+            'arrays': {}
+        }
+        offset = 0
+        for name, dtype, shape, _ in layout:
+            header['arrays'][name] = {'dtype': np.dtype(dtype).str, 'shape': list(shape), 'offset': offset}
+            offset += -(-int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize // ALIGNMENT) * ALIGNMENT
+        header_bytes = json.dumps(header).encode()
+        data_start = -(-(len(MAGIC) + 8 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+
+        tmp_path = f"{output_path}.tmp"
+        with open(tmp_path, 'wb') as out:
+            out.write(MAGIC)
+            out.write(len(header_bytes).to_bytes(8, 'little'))
+            out.write(header_bytes)
+            for name, dtype, shape, source in layout:
+                out.seek(data_start + header['arrays'][name]['offset'])
+                if isinstance(source, str):
+                    with open(source, 'rb') as f:
+                        shutil.copyfileobj(f, out)
+                else:
+                    out.write(np.ascontiguousarray(source, dtype=dtype).tobytes())
+            out.truncate(data_start + offset)
+        os.replace(tmp_path, output_path)
+        return len(encoded_keys)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+class ColumnarResults:
+    # Read-only view of a columnar results file; arrays are memory-mapped, so only the pages a query touches are read
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a columnar results file")
+            header_length = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(header_length))
+        self.kind = header['kind']
+        self.class_names = header['class_names']
+        self._class_ids = {name: index for index, name in enumerate(self.class_names)}
+        # Multi-classification files: [{'id': deployed classifier ID, 'class_names': [...]}, ...]
+        self.classifiers = header.get('classifiers', [])
+        data_start = -(-(len(MAGIC) + 8 + header_length) // ALIGNMENT) * ALIGNMENT
+        self._map = np.memmap(path, dtype=np.uint8, mode='r')
+        self.arrays = {}
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape'], dtype=np.int64))
+            start = data_start + spec['offset']
+            self.arrays[name] = self._map[start:start + count * dtype.itemsize].view(dtype).reshape(spec['shape'])
+        self.count = header['count']
+
+    def __len__(self):
+        return self.count
+
+    def key(self, index):
+        offsets = self.arrays['key_offsets']
+        return self.arrays['key_bytes'][offsets[index]:offsets[index + 1]].tobytes().decode()
+
+    def keys(self):
+        for index in range(self.count):
+            yield self.key(index)
+
+    def index_of(self, key):
+        # Binary search over the sorted key order; raises KeyError for unknown keys
+        target = key.encode()
+        order = self.arrays['key_order']
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            index = int(order[middle])
+            probe = self.key(index).encode()
+            if probe == target:
+                return index
+            if probe < target:
+                low = middle + 1
+            else:
+                high = middle
+        raise KeyError(key)
+
+    def class_id(self, class_name):
+        if class_name not in self._class_ids:
+            raise KeyError(class_name)
+        return self._class_ids[class_name]
+
+    def classifier_arrays(self, classifier=None):
+        # (scores, pred, class_names) of a classification file, or of one classifier (its ID or position) of a multi-classification file
+        if self.kind == 'classification':
+            return self.arrays['scores'], self.arrays['pred'], self.class_names
+        if classifier is None:
+            raise ValueError("Multi-classification files need a classifier (its deployed ID or position)")
+        ids = [entry['id'] for entry in self.classifiers]
+        number = classifier if isinstance(classifier, int) else ids.index(classifier)
+        return self.arrays[f'scores_{number}'], self.arrays[f'pred_{number}'], self.classifiers[number]['class_names']
+
+    def result(self, key_or_index):
+        # The original JSON result of one file
+        index = key_or_index if isinstance(key_or_index, (int, np.integer)) else self.index_of(key_or_index)
+        if self.kind == 'classification':
+            scores = self.arrays['scores'][index]
+            result = {
+                'scores': {name: float(score) for name, score in zip(self.class_names, scores)},
+                'pred': self.class_names[self.arrays['pred'][index]]
+            }
+            duplicate = self.duplicate_of(index)
+            if duplicate is not None:
+                result['duplicate_of'] = duplicate
+            return result
+        if self.kind == 'multi_classification':
+            result = {}
+            for number, entry in enumerate(self.classifiers):
+                scores, pred, class_names = self.classifier_arrays(number)
+                result[entry['id']] = {
+                    'scores': {name: float(score) for name, score in zip(class_names, scores[index])},
+                    'pred': class_names[pred[index]]
+                }
+            return result
+        start, end = self.arrays['box_offsets'][index], self.arrays['box_offsets'][index + 1]
+        return self.detections(np.arange(start, end))
+
+    def items(self):
+        for index in range(self.count):
+            yield self.key(index), self.result(index)
+
+    def duplicate_of(self, key_or_index):
+        # {'representative', 'distance'} when the file is a near-duplicate that reused another file's result, else None
+        index = key_or_index if isinstance(key_or_index, (int, np.integer)) else self.index_of(key_or_index)
+        if 'duplicate_of' not in self.arrays or self.arrays['duplicate_of'][index] < 0:
+            return None
+        return {'representative': self.key(int(self.arrays['duplicate_of'][index])), 'distance': int(self.arrays['duplicate_distance'][index])}
+
+    # Detection queries return box indices; image_of() maps them back to files and detections() to dicts
+
+    def boxes(self, key_or_index):
+        # (tlbr, scores, class_ids) array views of one file's boxes
+        index = key_or_index if isinstance(key_or_index, (int, np.integer)) else self.index_of(key_or_index)
+        start, end = self.arrays['box_offsets'][index], self.arrays['box_offsets'][index + 1]
+        return self.arrays['tlbr'][start:end], self.arrays['scores'][start:end], self.arrays['class_ids'][start:end]
+
+    def image_of(self, box_indices):
+        return np.searchsorted(self.arrays['box_offsets'], box_indices, side='right') - 1
+
+    def detections(self, box_indices):
+        tlbr, scores, class_ids = self.arrays['tlbr'], self.arrays['scores'], self.arrays['class_ids']
+        return [
+            {'tlbr': [float(v) for v in tlbr[index]], 'score': float(scores[index]), 'class': self.class_names[class_ids[index]]}
+            for index in box_indices
+        ]
+
+    def select(self, class_name=None, min_score=None, max_score=None, classifier=None):
+        # Box indices (detection) or file indices (classification) matching every given condition
+        # For classification, class_name picks files predicted as that class and the score range applies to its score
+        # (for multi-classification, of the given classifier)
+        if self.kind != 'detection':
+            all_scores, pred, class_names = self.classifier_arrays(classifier)
+            if class_name is None:
+                mask = np.ones(self.count, dtype=bool)
+                scores = all_scores.max(axis=1) if self.count else np.zeros(0)
+            else:
+                if class_name not in class_names:
+                    raise KeyError(class_name)
+                class_id = class_names.index(class_name)
+                mask = pred == class_id
+                scores = all_scores[:, class_id]
+        else:
+            scores = self.arrays['scores']
+            mask = np.ones(len(scores), dtype=bool) if class_name is None else self.arrays['class_ids'] == self.class_id(class_name)
+        if min_score is not None:
+            mask &= scores >= min_score
+        if max_score is not None:
+            mask &= scores <= max_score
+        return np.flatnonzero(mask)
+
+    def files_with(self, class_name=None, min_score=None, max_score=None, classifier=None):
+        # Keys of files with at least one matching box (detection) or matching prediction (classification)
+        indices = self.select(class_name, min_score, max_score, classifier)
+        if self.kind == 'detection':
+            indices = np.unique(self.image_of(indices))
+        for index in indices:
+            yield self.key(index)
+
+
+def write_json(columnar, json_path):
+    # Streams a columnar file back into the classic {key: result} JSON file
+    tmp_path = f"{json_path}.tmp"
+    with open(tmp_path, 'w') as out:
+        out.write('{')
+        for index, (key, result) in enumerate(columnar.items()):
+            if index:
+                out.write(', ')
+            out.write(f"{json.dumps(key)}: {json.dumps(result)}")
+        out.write('}')
+    os.replace(tmp_path, json_path)
+    return columnar.count
+
+
+def load_duplicates(duplicates_path):
+    # {duplicate key: {'representative', 'distance'}} from a *_duplicates .json or .jsonl file; first record wins
+    duplicates = {}
+    if duplicates_path is not None and os.path.exists(duplicates_path):
+        for key, duplicate in iter_results(duplicates_path):
+            duplicates.setdefault(key, duplicate)
+    return duplicates
+
+def compact_results(jsonl_path, results_dir, results_name, results_format='json', duplicates_path=None):
+    # Compacts a run's results JSONL file into <results_name>.json or <results_name>.col
+    # A .col file also records the near-duplicate mapping in duplicates_path
+    if results_format == 'columnar':
+        return write_columnar(
+            iter_jsonl_results(jsonl_path),
+            f"{results_dir}/{results_name}{COLUMNAR_EXTENSION}",
+            duplicates=load_duplicates(duplicates_path)
+        )
+    return compact_jsonl_to_json(jsonl_path, f"{results_dir}/{results_name}.json")
+
+
+@click.command()
+@click.option('-i', '--input-file', required=True, help='Results to Convert: a .json/.jsonl results file, or a .col file to convert back to JSON')
+@click.option('-o', '--output-file', default=None, help='Converted File (defaults to the input with the other extension)')
+@click.option('--duplicates-file', default=None, help='Near-Duplicate Mapping (*_duplicates.json) to Record in the .col File')
+@click.option('--info', is_flag=True, default=False, help='Flag to print a summary of a .col file instead of converting it')
+def main(input_file, output_file, duplicates_file, info):
+    if input_file.endswith(COLUMNAR_EXTENSION):
+        columnar = ColumnarResults(input_file)
+        if info:
+            boxes = f", {len(columnar.arrays['scores'])} boxes" if columnar.kind == 'detection' else ''
+            if 'duplicate_of' in columnar.arrays:
+                boxes += f", {int((columnar.arrays['duplicate_of'] >= 0).sum())} near-duplicates"
+            if columnar.kind == 'multi_classification':
+                classes = '; '.join(f"{entry['id']}: {', '.join(entry['class_names'])}" for entry in columnar.classifiers)
+            else:
+                classes = ', '.join(columnar.class_names)
+            print(f"{input_file}: {columnar.kind} results for {len(columnar)} files{boxes}; classes: {classes}")
+            return
+        output_file = output_file or f"{os.path.splitext(input_file)[0]}.json"
+        count = write_json(columnar, output_file)
+    else:
+        output_file = output_file or f"{os.path.splitext(input_file)[0]}{COLUMNAR_EXTENSION}"
+        count = write_columnar(iter_results(input_file), output_file, duplicates=load_duplicates(duplicates_file))
+    print(f"Wrote {count} results to {output_file}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+import threading
+import itertools
+import cv2
+import numpy as np
+
+from collections import OrderedDict
+from concurrent.futures import Future
+from streaming_upload import read_content
+
+
+HASH_BITS = 64
+HASH_SIZE = 8
+DCT_SIZE = 32
+DEFAULT_DEDUP_RADIUS = 6
+# Hashes are split into blocks this wide for multi-index lookup
+INDEX_BLOCK_BITS = 16
+# Representatives' results kept in memory for their duplicates; bursts are close together in listing order
+DEFAULT_RESULT_MEMORY = 10000
+
+
+def perceptual_hash(image_bytes):
+    # DCT-based pHash: the signs of the lowest frequencies of a 32x32 thumbnail against their median
+    # Returns the 64-bit hash and the (width, height) of the reduced decode, used to rescale boxes between duplicates
+    image = cv2.imdecode(np.frombuffer(read_content(image_bytes), dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if image is None:
+        raise ValueError("Image could not be decoded for hashing")
+    thumbnail = cv2.resize(image, (DCT_SIZE, DCT_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low_frequencies = cv2.dct(thumbnail)[:HASH_SIZE, :HASH_SIZE].flatten()
+    # The DC term is just overall brightness, so it's left out of the median
+    bits = low_frequencies > np.median(low_frequencies[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big'), (image.shape[1], image.shape[0])
+
+
+class HammingIndex:
+    # Multi-index hashing: with the hash split into m blocks, any hash within distance r of a query
+    # matches it to within r // m in at least one block (pigeonhole), so lookups probe a few small
+    # buckets per block instead of comparing against every stored hash
+    def __init__(self, radius, bits=HASH_BITS, block_bits=INDEX_BLOCK_BITS):
+        self.radius = radius
+        self.values = []
+        num_blocks = max(1, bits // block_bits)
+        self._blocks = [(index * block_bits, (1 << block_bits) - 1) for index in range(num_blocks)]
+        self._tables = [{} for _ in self._blocks]
+        block_radius = radius // num_blocks
+        # Every bit flip pattern within block_radius, precomputed once
+        self._probes = [0] + [
+            sum(1 << bit for bit in flipped)
+            for distance in range(1, block_radius + 1)
+            for flipped in itertools.combinations(range(block_bits), distance)
+        ]
+
+    def add(self, value):
+        entry_id = len(self.values)
+        self.values.append(value)
+        for (shift, mask), table in zip(self._blocks, self._tables):
+            table.setdefault((value >> shift) & mask, []).append(entry_id)
+        return entry_id
+
+    def query(self, value):
+        # Returns (entry_id, distance) of the nearest stored hash within radius, or None
+        best = None
+        seen = set()
+        for (shift, mask), table in zip(self._blocks, self._tables):
+            block = (value >> shift) & mask
+            for probe in self._probes:
+                for entry_id in table.get(block ^ probe, ()):
+                    if entry_id in seen:
+                        continue
+                    seen.add(entry_id)
+                    distance = (self.values[entry_id] ^ value).bit_count()
+                    if distance <= self.radius and (best is None or distance < best[1]):
+                        best = (entry_id, distance)
+        return best
+
+    def __len__(self):
+        return len(self.values)
+
+
+class NearDuplicateIndex:
+    # Maps each image to the first near-identical image seen (its representative) and hands
+    # duplicates the representative's result, waiting for it if it's still in flight
+    def __init__(self, radius=DEFAULT_DEDUP_RADIUS, result_memory=DEFAULT_RESULT_MEMORY):
+        self.index = HammingIndex(radius)
+        self.result_memory = result_memory
+        self.duplicates = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+        self._representatives = []
+        self._pending = {}
+        self._results = OrderedDict()
+
+    def claim(self, key, image_hash, size):
+        # Returns (None, entry_id) for a new representative, which must later resolve() or fail(),
+        # or (representative, None) for a near-duplicate, where representative is (key, size, distance, future)
+        with self._lock:
+            match = self.index.query(image_hash)
+            if match is not None:
+                entry_id, distance = match
+                representative_key, representative_size = self._representatives[entry_id]
+                future = self._future(entry_id)
+                if future is not None:
+                    return (representative_key, representative_size, distance, future), None
+                # The representative failed or its result was evicted: this image is uploaded after all
+                self.fallbacks += 1
+                return None, None
+            entry_id = self.index.add(image_hash)
+            self._representatives.append((key, size))
+            self._pending[entry_id] = Future()
+            return None, entry_id
+
+    def _future(self, entry_id):
+        if entry_id in self._results:
+            self._results.move_to_end(entry_id)
+            future = Future()
+            future.set_result(self._results[entry_id])
+            return future
+        return self._pending.get(entry_id)
+
+    def resolve(self, entry_id, result):
+        with self._lock:
+            self._results[entry_id] = result
+            if len(self._results) > self.result_memory:
+                self._results.popitem(last=False)
+            future = self._pending.pop(entry_id)
+        future.set_result(result)
+
+    def fail(self, entry_id, error):
+        with self._lock:
+            future = self._pending.pop(entry_id)
+        future.set_exception(error)
+
+    def record_duplicate(self, reused):
+        # reused is False when the representative failed and the duplicate had to be uploaded itself
+        with self._lock:
+            if reused:
+                self.duplicates += 1
+            else:
+                self.fallbacks += 1
+
+    def summary(self):
+        line = f"Dedup: {self.duplicates} near-duplicates reused a representative's result ({len(self.index)} distinct images)"
+        if self.fallbacks:
+            line += f"; {self.fallbacks} were uploaded because their representative's result was unavailable"
+        return line
+
+
+def size_factors(size, representative_size):
+    # (x, y) factors mapping the representative's pixel coordinates onto a resized duplicate
+    return size[0] / representative_size[0], size[1] / representative_size[1]
+
+def infer_or_reuse(dedup_index, key, image_bytes, infer):
+    # Runs infer() unless the image is a near-duplicate of one already inferred (or in flight)
+    # Returns (result, duplicate), where duplicate describes the representative whose result was reused
+    image_hash, size = perceptual_hash(image_bytes)
+    representative, entry_id = dedup_index.claim(key, image_hash, size)
+    if representative is not None:
+        representative_key, representative_size, distance, future = representative
+        try:
+            result = future.result()
+        except Exception:
+            # The representative's upload failed, so this image gets its own attempt
+            dedup_index.record_duplicate(False)
+        else:
+            dedup_index.record_duplicate(True)
+            duplicate = {
+                'representative': representative_key,
+                'distance': distance,
+                'factors': size_factors(size, representative_size)
+            }
+            return result, duplicate
+    try:
+        result = infer()
+    except Exception as e:
+        if entry_id is not None:
+            dedup_index.fail(entry_id, e)
+        raise
+    if entry_id is not None:
+        dedup_index.resolve(entry_id, result)
+    return result, None
@@ -0,0 +1,133 @@
+import os
+import sys
+import json
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process lock on Windows; the merge on save still keeps most concurrent entries
+    fcntl = None
+
+parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_directory)
+from utils import bounded_map
+from inference_cache import hash_body
+
+
+DEPLOYMENT_REGISTRY_FILENAME = 'deployments.json'
+# Status codes that mean the server no longer knows a deployed_id we reused
+# (400/422 are left out: a bad or unsupported image gets those too, and redeploying won't fix it)
+REJECTED_DEPLOYMENT_STATUS_CODES = (404, 410)
+
+
+class DeploymentRegistry:
+    # Local map from (host, client, kind, normalized config hash) to the deployed_id the server gave us
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def make_key(client, kind, body):
+        return f"{client.host}|{client.client_id}|{kind}|{hash_body(body)}"
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                # Another process sharing the cache_dir (a shard, the daemon) may have deployed it since we loaded
+                self._entries.update(self._load())
+            return self._entries.get(key)
+
+    def set(self, key, deployed_id):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        with self._lock, open(f"{self.path}.lock", 'a') as lock_file:
+            if fcntl is not None:
+                # Held from reading to renaming, so two processes can't both merge the same old file
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Merge what other processes saved since we loaded, so their entries aren't overwritten
+            self._entries = {**self._entries, **self._load(), key: deployed_id}
+            self._save(directory)
+
+    def _save(self, directory):
+        # Write then rename so a crash never leaves a truncated registry behind
+        # The temp file is unique per write, so processes saving at once never rename each other's file
+        fd, tmp_path = tempfile.mkstemp(dir=directory or '.', prefix=f"{os.path.basename(self.path)}.", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self._entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+
+class Deployment:
+    # A classifier/detector body plus the deployed_id currently serving it
+    # Reuses the registered ID when possible and re-deploys only if the server rejects it
+    def __init__(self, client, kind, body, deploy_fn, registry=None, reuse=True):
+        self.client = client
+        self.kind = kind
+        self.body = body
+        self.deploy_fn = deploy_fn
+        self.registry = registry
+        self.reuse = reuse
+        self.key = DeploymentRegistry.make_key(client, kind, body)
+        self.deployed_id = None
+        # True once the ID came from the server during this run, so a rejection is a real error
+        self.fresh = False
+        self._lock = threading.Lock()
+
+    def ensure(self):
+        with self._lock:
+            if self.deployed_id is None and self.registry is not None and self.reuse:
+                self.deployed_id = self.registry.get(self.key)
+            if self.deployed_id is None:
+                self._deploy()
+        return self.deployed_id
+
+    def redeploy(self, stale_id):
+        with self._lock:
+            # Another worker may already have replaced the stale ID
+            if self.deployed_id == stale_id and not self.fresh:
+                self._deploy()
+        return self.deployed_id
+
+    def _deploy(self):
+        self.deployed_id = self.deploy_fn(self.client, self.body)
+        self.fresh = True
+        if self.registry is not None:
+            self.registry.set(self.key, self.deployed_id)
+
+
+def ensure_deployments(deployments):
+    # Resolves every deployment, deploying any that aren't registered concurrently
+    return [deployed_id for _, deployed_id in bounded_map(lambda d: d.ensure(), deployments, len(deployments))]
+
+def post_to_deployments(client, path, deployments, build_params, **kwargs):
+    # Posts with the current deployed IDs, re-deploying reused IDs once if the server rejects them
+    # Returns the IDs the final request was made with alongside the response
+    deployed_ids = [deployment.deployed_id for deployment in deployments]
+    # Checked before posting: a concurrent worker's redeploy can make the deployment fresh while our stale request is in flight
+    reused = not all(deployment.fresh for deployment in deployments)
+    response = client.post(path, params=build_params(deployed_ids), **kwargs)
+    if response.status_code in REJECTED_DEPLOYMENT_STATUS_CODES and reused:
+        deployed_ids = [
+            deployment.redeploy(deployed_id)
+            for deployment, deployed_id in zip(deployments, deployed_ids)
+        ]
+        response = client.post(path, params=build_params(deployed_ids), **kwargs)
+    return deployed_ids, response
+
+def open_deployment_registry(cache_dir):
+    return DeploymentRegistry(os.path.join(cache_dir, DEPLOYMENT_REGISTRY_FILENAME))
@@ -1,37 +1,26 @@
 import os
 import sys
 import json
-import requests
-import cv2
 import click
 
-from dotenv import load_dotenv
-from tqdm import tqdm
-
 parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(parent_directory)
-from utils import (
-    get_directai_access_token, 
-    get_file_data, 
-    display_bounding_boxes
-)
+from collection_run import CollectionRun, collection_options
+from preprocessing import rescale_detections
+from annotation import AnnotationPipeline, ANNOTATION_FORMATS, DEFAULT_ANNOTATION_QUALITY, DEFAULT_ANNOTATION_WORKERS
+from nms import apply_thresholds
+from tiling import TilingOptions, detect_tiled, DEFAULT_TILE_OVERLAP, DEFAULT_TILE_CONCURRENCY
+from video import KeyframeCollector
+from inference_cache import hash_body
 
-load_dotenv()
-DIRECTAI_CLIENT_ID = os.getenv("DIRECTAI_CLIENT_ID")
-DIRECTAI_CLIENT_SECRET = os.getenv("DIRECTAI_CLIENT_SECRET")
 DEFAULT_OBJECT_DETECTION_THRESHOLD = 0.1
 DEFAULT_NMS_THRESHOLD = 0.4
+# Floor for --raw-detections; anything above it can be re-thresholded offline
+DEFAULT_RAW_DETECTION_THRESHOLD = 0.01
 
 
-@click.command()
-@click.option('-h', '--host', default='https://api.alpha.directai.io', help='DirectAI Host')
-@click.option('-d', '--data-dir', default='data', help='Directory for Input Data')
-@click.option('-r', '--results-dir', default='results', help='Directory for Results')
-@click.option('-f', '--config-file-path', default='configs/detector.json', help='File Path for Classifier Configuration')
-@click.option('-b', '--bounding-box-drawing', is_flag=True, default=False, help='Flag to draw bounding boxes on images')
-@click.option('-c', '--class-name', help='Class to Predict', multiple=True)
-def main(host, data_dir, results_dir, config_file_path, bounding_box_drawing, class_name):
-    if len(class_name) > 0:
+def get_detector_body(config_file_path, class_name=None):
+    if (class_name is not None) and len(class_name) > 0:
         detector_configs = []
         for single_class in class_name:
             detector_configs.append({
@@ -48,64 +37,150 @@ def main(host, data_dir, results_dir, config_file_path, bounding_box_drawing, cl
         with open(config_file_path) as f:
             body = json.loads(f.read())
     
-    # Get Access Token
-    access_token = get_directai_access_token(
-        client_id=DIRECTAI_CLIENT_ID,
-        client_secret=DIRECTAI_CLIENT_SECRET,
-        auth_endpoint=host+"/token"
-    )
-    
-    headers = {
-        'Authorization': f"Bearer {access_token}"
+    return body
+
+def config_thresholds(body):
+    # ({class name: detection_threshold}, nms_threshold) from a detector body
+    thresholds = {
+        detector_config['name']: detector_config.get('detection_threshold', DEFAULT_OBJECT_DETECTION_THRESHOLD)
+        for detector_config in body['detector_configs']
     }
-    
+    return thresholds, body.get('nms_threshold', DEFAULT_NMS_THRESHOLD)
+
+def raw_detector_body(body, raw_threshold=DEFAULT_RAW_DETECTION_THRESHOLD):
+    # The same detector with a low threshold and server-side NMS off, so results can be re-evaluated offline
+    return {
+        **body,
+        'detector_configs': [
+            {
+                **detector_config,
+                'detection_threshold': min(raw_threshold, detector_config.get('detection_threshold', DEFAULT_OBJECT_DETECTION_THRESHOLD))
+            }
+            for detector_config in body['detector_configs']
+        ],
+        'nms_threshold': 1.0
+    }
+
+def deploy_detector(client, body):
     # Deploy Detector
-    deploy_response = requests.post(
-        f"{host}/deploy_detector",
-        headers=headers,
+    deploy_response = client.post(
+        "/deploy_detector",
         json=body
     )
     if deploy_response.status_code != 200:
         raise ValueError(deploy_response.json())
     deployed_detector_id = deploy_response.json()['deployed_id']
+    
+    return deployed_detector_id
 
+@click.command()
+@collection_options
+@click.option('-f', '--config-file-path', default='configs/detector.json', help='File Path for Classifier Configuration')
+@click.option('-b', '--bounding-box-drawing', is_flag=True, default=False, help='Flag to draw bounding boxes on images')
+@click.option('-c', '--class-name', help='Class to Predict', multiple=True)
+@click.option('--annotation-workers', default=DEFAULT_ANNOTATION_WORKERS, type=click.IntRange(min=1), help='Number of Threads Drawing Bounding Boxes')
+@click.option('--annotation-format', default=None, type=click.Choice(ANNOTATION_FORMATS), help='Image Format for Annotated Images (defaults to the input format)')
+@click.option('--annotation-quality', default=DEFAULT_ANNOTATION_QUALITY, type=click.IntRange(1, 100), help='JPEG Quality for Annotated Images')
+@click.option('--raw-detections', is_flag=True, default=False, help='Flag to store low-threshold detections without server-side NMS, for re-evaluation with reevaluate_detections.py')
+@click.option('--raw-threshold', default=DEFAULT_RAW_DETECTION_THRESHOLD, type=click.FloatRange(0, 1), help='Detection Threshold Deployed with --raw-detections')
+@click.option('--tile-size', default=None, type=click.IntRange(min=64), help='Split Images Larger Than This Many Pixels into Overlapping Tiles Detected Separately')
+@click.option('--tile-overlap', default=DEFAULT_TILE_OVERLAP, type=click.IntRange(min=0), help='Overlap Between Neighboring Tiles (pixels)')
+@click.option('--tile-concurrency', default=DEFAULT_TILE_CONCURRENCY, type=click.IntRange(min=1), help='Maximum Number of Concurrent Tile Requests per Image')
+def main(config_file_path, bounding_box_drawing, class_name, annotation_workers, annotation_format, annotation_quality, raw_detections, raw_threshold, tile_size, tile_overlap, tile_concurrency, **options):
+    body = get_detector_body(config_file_path, class_name)
+    # Annotations in raw mode are drawn with the config's own thresholds applied locally
+    class_thresholds, config_nms_threshold = config_thresholds(body)
+    if raw_detections:
+        body = raw_detector_body(body, raw_threshold)
     
-    # Compiled Results
-    results = {}
+    run = CollectionRun('detection', **options)
+    deployment = run.deployment('detector', body, deploy_detector)
+    deployment.ensure()
+    detector_body_hash = hash_body(body)
+    # Tiled detection of large images, merged with the config's NMS threshold
+    preprocess_options = run.preprocess_options
+    tiling_options = TilingOptions(tile_size, tile_overlap, tile_concurrency, preprocess_options.encode_format, preprocess_options.encode_quality, preprocess_options.max_side)
+    nms_threshold = body.get('nms_threshold', DEFAULT_NMS_THRESHOLD)
 
-    if not os.path.exists(results_dir):
-        os.makedirs(results_dir)
+    if not os.path.exists(run.results_dir):
+        os.makedirs(run.results_dir)
     
-    # Run Classification on Data Collection
-    for filename in tqdm(os.listdir(data_dir)):
-        if filename == '.DS_Store':
-            continue
-        params = {
-            'deployed_id': deployed_detector_id
-        }
-        file_data = get_file_data(f"{data_dir}/{filename}")
-        detect_response = requests.post(
-            f"{host}/detect",
-            headers=headers, 
-            params=params,
-            files=file_data
-        )
-        if detect_response.status_code != 200:
-            raise ValueError(detect_response.json())
-        dets = detect_response.json()
+    # Annotation runs on its own pool so drawing overlaps with in-flight detection requests
+    annotator = None
+    if bounding_box_drawing:
+        annotator = AnnotationPipeline(run.results_dir, annotation_workers, annotation_format, annotation_quality, run.metrics)
+    
+    def drawn_detections(image_dets):
+        # Raw results are drawn as the config would have returned them
+        if raw_detections:
+            return apply_thresholds(image_dets, class_thresholds, config_nms_threshold)
+        return image_dets
+    
+    def make_data(deployed_ids):
+        return {'deployed_id': deployed_ids[0]}
+    
+    def upload_file(file_data, cache_key):
+        if tiling_options.enabled:
+            image_dets = detect_tiled(
+                file_data,
+                tiling_options,
+                lambda tile_data: run.post("/detect", [deployment], make_data, tile_data)[1][0],
+                nms_threshold,
+                run.metrics
+            )
+            if image_dets is not None:
+                if run.cache is not None:
+                    run.cache.put(cache_key, image_dets)
+                return image_dets
+        _, dets, factors = run.upload("/detect", [deployment], make_data, file_data)
+        # Boxes come back in the uploaded image's coordinates
+        image_dets = rescale_detections(dets[0], factors)
+        if run.cache is not None:
+            run.cache.put(cache_key, image_dets)
+        return image_dets
+    
+    def detect_file(item):
+        filename, frame = item
+        file_data = run.read(filename, frame)
+        image_dets = None
+        cache_key = None
+        if run.cache is not None:
+            cache_key = run.cache_key('detect', file_data, detector_body_hash, tiling_options.signature())
+            image_dets = run.cache_get(cache_key)
+        if image_dets is None:
+            # A near-duplicate waits for (or reuses) its representative's detections instead of being uploaded
+            image_dets, duplicate = run.infer_or_reuse(filename, file_data, lambda: upload_file(file_data, cache_key))
+            if duplicate is not None:
+                # Resized copies get the representative's boxes scaled onto their own pixels
+                image_dets = rescale_detections(image_dets, duplicate['factors'])
         
-        if bounding_box_drawing:
-            cv2_img = cv2.imread(f"{data_dir}/{filename}")
-            drawn_image = display_bounding_boxes(cv2_img, dets[0])
-            cv2.imwrite(f'{results_dir}/annotated_{filename}'.format(), drawn_image)
-
-        results[filename] = dets[0]
+        if annotator is not None and frame is None:
+            annotator.submit(filename, file_data['data'][1], drawn_detections(image_dets))
+        
+        return image_dets
+    
+    # Annotated videos get every frame, with boxes interpolated between the sampled ones
+    keyframes = None
+    if annotator is not None:
+        keyframes = KeyframeCollector(
+            lambda video_key, keyframe_dets: annotator.submit_video(video_key, os.path.join(run.data_dir, video_key), keyframe_dets)
+        )
+    
+    def add_keyframe(filename, image_dets):
+        if keyframes is not None:
+            keyframes.add(filename, drawn_detections(image_dets))
+    
+    # Run Detection on Data Collection
+    run.run(detect_file, add_keyframe)
+    if keyframes is not None:
+        keyframes.flush()
+    if annotator is not None:
+        with run.metrics.stage('annotate_drain'):
+            annotator.close()
     
     # Save Inference Results
-    with open(f"{results_dir}/detection_results.json", 'w') as f:
-        json.dump(results, f)
+    # Detection results stay lists of boxes, so the near-duplicate mapping goes into the .col file's columns
+    run.finish()
     
 if __name__ == '__main__':
     main()
-    
-    
\ No newline at end of file
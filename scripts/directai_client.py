@@ -0,0 +1,141 @@
+import os
+import sys
+import json
+import time
+import base64
+import threading
+import requests
+
+from requests.adapters import HTTPAdapter
+
+parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_directory)
+from utils import fetch_directai_token
+from streaming_upload import MultipartBody, UploadBudget, DEFAULT_UPLOAD_CHUNK_SIZE
+
+
+DEFAULT_POOL_SIZE = 10
+# Refresh the token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = 60
+# Used when the token endpoint doesn't tell us when the token expires
+DEFAULT_TOKEN_LIFETIME = 3600
+# Requests that create something server-side (a deployment, a stream tracker); replaying them after a 5xx could create it twice
+NON_IDEMPOTENT_PATH_PREFIXES = ('/deploy_', '/run_')
+# Uploads are grouped into size classes 4x apart, each judged against its own best latency, because
+# the tail of a large upload still drains from the socket buffer after the body is handed over
+UPLOAD_SIZE_CLASS_BITS = 2
+
+
+def get_token_lifetime(token_response):
+    # Prefer the explicit lifetime, then the JWT `exp` claim, then our default
+    if token_response.get('expires_in') is not None:
+        return float(token_response['expires_in'])
+    try:
+        payload = token_response['access_token'].split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        expires_at = json.loads(base64.urlsafe_b64decode(payload))['exp']
+        return float(expires_at) - time.time()
+    except (IndexError, KeyError, TypeError, ValueError):
+        return DEFAULT_TOKEN_LIFETIME
+
+
+class DirectAIClient:
+    # Keep-alive session shared by every call to a DirectAI host
+    # The bearer token is refreshed shortly before it expires (or after a 401) so long runs don't die partway through
+    def __init__(
+        self,
+        host,
+        client_id,
+        client_secret,
+        pool_size=DEFAULT_POOL_SIZE,
+        refresh_margin=TOKEN_REFRESH_MARGIN,
+        scheduler=None,
+        upload_budget_bytes=None,
+        upload_chunk_size=DEFAULT_UPLOAD_CHUNK_SIZE
+    ):
+        self.host = host
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_margin = refresh_margin
+        # Optional RequestScheduler adding retries, rate limiting and adaptive concurrency
+        self.scheduler = scheduler
+        # Optional cap on upload bytes in flight across all threads
+        self.upload_budget = UploadBudget(upload_budget_bytes) if upload_budget_bytes else None
+        self.upload_chunk_size = upload_chunk_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._token_lock = threading.Lock()
+        self._access_token = None
+        self._expires_at = 0.0
+
+    def refresh_access_token(self, stale_token=None):
+        with self._token_lock:
+            # Another thread may have refreshed while we waited on the lock
+            if stale_token is not None and self._access_token != stale_token:
+                return self._access_token
+            token_response = fetch_directai_token(
+                client_id=self.client_id,
+                client_secret=self.client_secret,
+                auth_endpoint=f"{self.host}/token",
+                session=self.session
+            )
+            self._expires_at = time.monotonic() + get_token_lifetime(token_response)
+            self._access_token = token_response['access_token']
+            return self._access_token
+
+    def get_access_token(self):
+        access_token = self._access_token
+        if access_token is None or time.monotonic() >= self._expires_at - self.refresh_margin:
+            access_token = self.refresh_access_token(stale_token=access_token)
+        return access_token
+
+    def post(self, path, files=None, **kwargs):
+        if files is None or 'data' in kwargs:
+            return self._scheduled_post(path, files=files, **kwargs)
+        # Files are encoded as a stream, byte-for-byte as requests would encode them, so a file is never held whole
+        body = MultipartBody(files, self.upload_chunk_size)
+        headers = {**(kwargs.pop('headers', None) or {}), 'Content-Type': body.content_type}
+        if self.upload_budget is None:
+            return self._scheduled_post(path, data=body, headers=headers, **kwargs)
+        # Held through retries, so a large upload backing off doesn't let others overrun the budget
+        reserved = self.upload_budget.acquire(len(body))
+        try:
+            return self._scheduled_post(path, data=body, headers=headers, **kwargs)
+        finally:
+            self.upload_budget.release(reserved)
+
+    def _scheduled_post(self, path, **kwargs):
+        if self.scheduler is None:
+            return self._authorized_post(path, **kwargs)
+        body = kwargs.get('data')
+        streamed = isinstance(body, MultipartBody)
+        return self.scheduler.call(
+            lambda: self._authorized_post(path, **kwargs),
+            key=(path, len(body).bit_length() // UPLOAD_SIZE_CLASS_BITS) if streamed else path,
+            idempotent=not path.startswith(NON_IDEMPOTENT_PATH_PREFIXES),
+            upload_finished=(lambda: body.finished_at) if streamed else None
+        )
+
+    def _authorized_post(self, path, **kwargs):
+        access_token = self.get_access_token()
+        response = self._post(path, access_token, **kwargs)
+        if response.status_code == 401:
+            # Token was revoked or expired early; refresh once and retry
+            access_token = self.refresh_access_token(stale_token=access_token)
+            response = self._post(path, access_token, **kwargs)
+        return response
+
+    def _post(self, path, access_token, headers=None, **kwargs):
+        headers = {**(headers or {}), 'Authorization': f"Bearer {access_token}"}
+        return self.session.post(f"{self.host}{path}", headers=headers, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
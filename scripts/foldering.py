@@ -0,0 +1,76 @@
+import os
+import errno
+import shutil
+import threading
+
+
+FOLDER_MODES = ('copy', 'hardlink', 'symlink', 'none')
+DEFAULT_FOLDER_MODE = 'copy'
+# errnos meaning "this filesystem can't link here", as opposed to a real I/O error
+LINK_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EACCES, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EMLINK}
+
+
+class ResultFolderer:
+    # Places input images into results/<label>/ by hardlink, symlink or copy
+    # Falls back to copying per (source device, destination device) pair once linking is known not to work there
+    def __init__(self, mode=DEFAULT_FOLDER_MODE):
+        if mode not in FOLDER_MODES:
+            raise ValueError(f"Unknown folder mode {mode}")
+        self.mode = mode
+        self.fallback_copies = 0
+        self._lock = threading.Lock()
+        self._copy_only_devices = set()
+
+    def place(self, src, dst):
+        if self.mode == 'none':
+            return
+        # Files from nested input directories keep their relative path under the class folder
+        dst_dir = os.path.dirname(dst)
+        if dst_dir and not os.path.isdir(dst_dir):
+            os.makedirs(dst_dir, exist_ok=True)
+        if self.mode == 'copy':
+            self._copy(src, dst)
+            return
+        device_pair = (os.stat(src).st_dev, os.stat(os.path.dirname(dst) or '.').st_dev)
+        # Hardlinks can never cross devices, so skip the doomed syscall
+        if self.mode == 'hardlink' and device_pair[0] != device_pair[1]:
+            self._mark_copy_only(device_pair)
+        if device_pair not in self._copy_only_devices:
+            try:
+                self._link(src, dst)
+                return
+            except OSError as e:
+                if e.errno not in LINK_UNSUPPORTED_ERRNOS:
+                    raise
+                self._mark_copy_only(device_pair)
+        with self._lock:
+            self.fallback_copies += 1
+        self._copy(src, dst)
+
+    def _copy(self, src, dst):
+        # A link left by an earlier run in another mode would make shutil.copy copy the file onto itself
+        if os.path.islink(dst) or (os.path.exists(dst) and os.path.samefile(src, dst)):
+            os.unlink(dst)
+        shutil.copy(src, dst)
+
+    def _link(self, src, dst):
+        if os.path.lexists(dst):
+            # Re-running over the same results directory: leave an identical link alone
+            if self.mode == 'hardlink' and os.path.exists(dst) and os.path.samefile(src, dst):
+                return
+            if self.mode == 'symlink' and os.path.islink(dst) and os.readlink(dst) == os.path.abspath(src):
+                return
+            os.unlink(dst)
+        if self.mode == 'hardlink':
+            os.link(src, dst)
+        else:
+            os.symlink(os.path.abspath(src), dst)
+
+    def _mark_copy_only(self, device_pair):
+        with self._lock:
+            self._copy_only_devices.add(device_pair)
+
+    def summary(self):
+        if self.fallback_copies == 0:
+            return None
+        return f"Foldering: {self.fallback_copies} images copied because {self.mode} isn't supported between those filesystems"
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+DEFAULT_CACHE_DIR = '.directai_cache'
+DEFAULT_CACHE_MAX_MB = 512
+# When the cache is over its size limit, evict least recently used entries down to this fraction of it
+EVICTION_TARGET_FRACTION = 0.9
+
+
+def hash_body(body):
+    # Canonical hash of a classifier/detector body, independent of key order and whitespace
+    canonical = json.dumps(body, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def make_cache_key(client, kind, image_bytes, body_hash, variant=''):
+    # kind namespaces the endpoint (classify/detect), variant captures client-side options that change the result
+    # Scoped to the client's host and client_id like the deployment registry, so hosts sharing a cache_dir
+    # never serve each other's results
+    scope = hashlib.sha256(f"{client.host}|{client.client_id}".encode()).hexdigest()[:16]
+    # Streamed files (FileSource) hash themselves once, chunk by chunk, to the same digest
+    image_hash = image_bytes.sha256() if hasattr(image_bytes, 'sha256') else hashlib.sha256(image_bytes).hexdigest()
+    return f"{kind}:{scope}:{body_hash}:{variant}:{image_hash}"
+
+
+class InferenceCache:
+    # Size-bounded, least-recently-used store of inference results in a SQLite file
+    # Safe to share across the worker threads of a single run
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_mb=DEFAULT_CACHE_MAX_MB):
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(cache_dir, 'inference_cache.sqlite3'),
+            check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        serialized = json.dumps(value)
+        size = len(key) + len(serialized)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if previous is not None:
+                self._total_bytes -= previous[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, serialized, size, time.time())
+            )
+            self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        target_bytes = self.max_bytes * EVICTION_TARGET_FRACTION
+        rows = self._conn.execute("SELECT key, size FROM entries ORDER BY last_used")
+        evicted_keys = []
+        for key, size in rows:
+            if self._total_bytes <= target_bytes:
+                break
+            evicted_keys.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", evicted_keys)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+            self._total_bytes = 0
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return f"Inference cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1%} hit rate)"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_inference_cache(cache_dir, max_mb, no_cache=False, clear_cache=False):
+    # Returns None when caching is bypassed so callers can skip cache work with a single check
+    if no_cache and not clear_cache:
+        return None
+    cache = InferenceCache(cache_dir, max_mb)
+    if clear_cache:
+        cache.clear()
+    if no_cache:
+        cache.close()
+        return None
+    return cache
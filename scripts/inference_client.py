@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+import time
+import socket
+import itertools
+import click
+
+parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_directory)
+# Only light modules here: the client's startup must not pay for cv2, numpy or requests, which the daemon already holds
+from scanner import iter_collection, ScanStats
+from results_writer import open_results_writer, compact_jsonl_to_json, DEFAULT_FLUSH_EVERY
+from inference_cache import DEFAULT_CACHE_DIR
+from foldering import FOLDER_MODES, DEFAULT_FOLDER_MODE
+
+
+DEFAULT_SOCKET_PATH = os.path.join(DEFAULT_CACHE_DIR, 'inference_daemon.sock')
+JOB_MODES = ('classify', 'multi_classify', 'detect')
+DEFAULT_JOB_IN_FLIGHT = 4
+DEFAULT_BATCH_SIZE = 1000
+# Kept in step with preprocessing.py, which can't be imported here without cv2
+ENCODE_FORMATS = ('jpg', 'png')
+DEFAULT_ENCODE_QUALITY = 90
+RESULTS_NAMES = {
+    'classify': 'classification_results',
+    'multi_classify': 'multi_classification_results',
+    'detect': 'detection_results'
+}
+DEFAULT_CONFIG_FILE_PATHS = {
+    'classify': ('configs/classifier.json',),
+    'multi_classify': ('configs/classifier.json', 'configs/alt_classifier.json'),
+    'detect': ('configs/detector.json',)
+}
+
+
+class DaemonConnection:
+    # Newline-delimited JSON over the daemon's Unix socket
+    def __init__(self, socket_path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            self.sock.close()
+            raise click.ClickException(f"No inference daemon is listening on {socket_path}; start one with inference_daemon.py")
+        self.reader = self.sock.makefile('rb')
+
+    def send(self, message):
+        self.sock.sendall(json.dumps(message).encode() + b'\n')
+
+    def records(self):
+        # Yields the daemon's records for the last message, up to and including its closing {'done': True, ...}
+        for line in self.reader:
+            record = json.loads(line)
+            yield record
+            if record.get('done'):
+                return
+        raise click.ClickException('The inference daemon closed the connection mid-job')
+
+    def request(self, message):
+        self.send(message)
+        return list(self.records())[-1]
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def build_job(mode, config_file_path, class_name, max_in_flight, max_side, encode_format, encode_quality, png_to_jpeg, results_dir, folder_mode):
+    # Configs are read (and class folders written) by the daemon, so paths go over the socket absolute
+    config_file_paths = [os.path.abspath(path) for path in (config_file_path or DEFAULT_CONFIG_FILE_PATHS[mode])]
+    job = {
+        'mode': mode,
+        'max_in_flight': max_in_flight,
+        'results_dir': os.path.abspath(results_dir),
+        'folder_mode': folder_mode,
+        'preprocess': {
+            'max_side': max_side,
+            'encode_format': encode_format,
+            'encode_quality': encode_quality,
+            'png_to_jpeg': png_to_jpeg
+        }
+    }
+    if mode == 'multi_classify':
+        job['config_file_paths'] = config_file_paths
+    else:
+        job['config_file_path'] = config_file_paths[0]
+        job['class_name'] = list(class_name) or None
+    return job
+
+
+@click.command()
+@click.option('-m', '--mode', default='classify', type=click.Choice(JOB_MODES), help='Kind of Inference to Run')
+@click.option('-d', '--data-dir', default='data', help='Directory for Input Data')
+@click.option('-r', '--results-dir', default='results', help='Directory for Results')
+@click.option('-f', '--config-file-path', multiple=True, help='File Path for the Classifier or Detector Configuration; repeat for multi_classify')
+@click.option('-c', '--class-name', help='Class to Predict', multiple=True)
+@click.option('-n', '--max-in-flight', default=DEFAULT_JOB_IN_FLIGHT, type=click.IntRange(min=1), help='Maximum Number of Concurrent Requests for This Job')
+@click.option('--socket', 'socket_path', default=DEFAULT_SOCKET_PATH, help='Unix Socket the Inference Daemon Listens On')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, type=click.IntRange(min=1), help='Number of Files Sent to the Daemon per Job Message')
+@click.option('--max-side', default=None, type=click.IntRange(min=1), help='Downscale images so their long side is at most this many pixels before upload')
+@click.option('--encode-format', default=None, type=click.Choice(ENCODE_FORMATS), help='Re-encode images in this format before upload')
+@click.option('--encode-quality', default=DEFAULT_ENCODE_QUALITY, type=click.IntRange(1, 100), help='JPEG Quality for Re-encoded Images')
+@click.option('--png-to-jpeg', is_flag=True, default=False, help='Flag to convert PNG images to JPEG before upload')
+@click.option('--folder-mode', default=DEFAULT_FOLDER_MODE, type=click.Choice(FOLDER_MODES), help='How images are placed into class folders (classify and multi_classify)')
+@click.option('--clean-results', is_flag=True, default=False, help='Flag to empty existing class folders before running')
+@click.option('--resume', is_flag=True, default=False, help='Flag to skip files already recorded by a previous run in the same results directory')
+@click.option('--flush-every', default=DEFAULT_FLUSH_EVERY, type=click.IntRange(min=1), help='Number of Results Buffered Before Each Write to Disk')
+@click.option('--recursive', is_flag=True, default=False, help='Flag to include images in subdirectories of the data directory')
+@click.option('--include', multiple=True, help='Glob of Files to Process (e.g. "*.png"); repeat as necessary')
+@click.option('--exclude', multiple=True, help='Glob of Files to Skip; repeat as necessary')
+@click.option('--manifest', default=None, help='File Listing Paths to Process, one per line ("-" for stdin)')
+@click.option('--status', is_flag=True, default=False, help='Flag to print the daemon\'s status and exit')
+@click.option('--stop-daemon', is_flag=True, default=False, help='Flag to shut the daemon down and exit')
+def main(mode, data_dir, results_dir, config_file_path, class_name, max_in_flight, socket_path, batch_size, max_side, encode_format, encode_quality, png_to_jpeg, folder_mode, clean_results, resume, flush_every, recursive, include, exclude, manifest, status, stop_daemon):
+    with DaemonConnection(socket_path) as connection:
+        if status or stop_daemon:
+            reply = connection.request({'mode': 'status' if status else 'shutdown'})
+            print(json.dumps(reply.get('status', reply), indent=2))
+            return
+
+        start = time.perf_counter()
+        job = build_job(mode, config_file_path, class_name, max_in_flight, max_side, encode_format, encode_quality, png_to_jpeg, results_dir, folder_mode)
+        # Class folders are emptied with the first batch only, and never when resuming (as in the collection scripts)
+        clean = clean_results and not resume
+        results_name = RESULTS_NAMES[mode]
+        os.makedirs(results_dir, exist_ok=True)
+        results_writer, completed_keys = open_results_writer(results_dir, results_name, flush_every, resume)
+        scan_stats = ScanStats()
+        keys = iter_collection(data_dir, recursive, include, exclude, manifest, skip=completed_keys, stats=scan_stats)
+        files = errors = 0
+        with results_writer:
+            while True:
+                batch = list(itertools.islice(keys, batch_size))
+                if not batch:
+                    break
+                # The daemon reads files itself, so keys travel with absolute paths
+                connection.send({**job, 'clean_results': clean, 'files': [[key, os.path.abspath(os.path.join(data_dir, key))] for key in batch]})
+                clean = False
+                for record in connection.records():
+                    if record.get('done'):
+                        if 'error' in record and 'files' not in record:
+                            raise click.ClickException(f"Inference daemon: {record['error']}")
+                        continue
+                    files += 1
+                    if 'error' in record:
+                        # Failed files stay out of the results, so --resume retries them
+                        errors += 1
+                        print(f"{record['key']}: {record['error']}", file=sys.stderr)
+                    else:
+                        results_writer.write(record['key'], record['result'])
+        compact_jsonl_to_json(results_writer.jsonl_path, f"{results_dir}/{results_name}.json")
+        print(scan_stats.summary())
+        print(f"Inference client: {files} files ({errors} failed) in {time.perf_counter() - start:.2f}s")
+        if errors:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import threading
+import socketserver
+import click
+
+parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_directory)
+from utils import get_file_data, bounded_map
+from directai_client import DirectAIClient, DEFAULT_POOL_SIZE
+from streaming_upload import DEFAULT_UPLOAD_BUDGET_MB, STREAM_THRESHOLD_BYTES
+from deployment_registry import Deployment, open_deployment_registry, post_to_deployments
+from preprocessing import PreprocessOptions, timed_preprocess, rescale_detections
+from scheduler import RequestScheduler, DEFAULT_MAX_RETRIES
+from inference_cache import open_inference_cache, hash_body, make_cache_key, DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_MB
+from foldering import ResultFolderer
+from scanner import result_relpath
+from classification_on_collection import get_classifier_body, deploy_classifier, prep_classification_results_dir
+from multi_classify_on_collection import classifier_results_dir
+from detection_on_collection import get_detector_body, deploy_detector
+from collection_run import DIRECTAI_CLIENT_ID, DIRECTAI_CLIENT_SECRET
+from inference_client import DEFAULT_SOCKET_PATH, JOB_MODES, DEFAULT_JOB_IN_FLIGHT
+
+
+DEFAULT_MAX_CONCURRENCY = 16
+ENDPOINTS = {
+    'classify': '/classify',
+    'multi_classify': '/multi_classify',
+    'detect': '/detect'
+}
+
+
+class InferenceDaemon:
+    # Holds one warm client, token and set of deployments for every job it is sent
+    def __init__(self, client, registry, cache=None):
+        self.client = client
+        self.registry = registry
+        self.cache = cache
+        self.started = time.time()
+        self.jobs = 0
+        self.files = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._deployments = {}
+
+    def deployment(self, kind, body):
+        # Deployed once per config for the daemon's lifetime (and reused across restarts via the registry)
+        key = (kind, hash_body(body))
+        with self._lock:
+            if key not in self._deployments:
+                deploy_fn = deploy_detector if kind == 'detector' else deploy_classifier
+                self._deployments[key] = Deployment(self.client, kind, body, deploy_fn, registry=self.registry)
+            deployment = self._deployments[key]
+        deployment.ensure()
+        return deployment
+
+    def job_deployments(self, job):
+        mode = job['mode']
+        if mode == 'detect':
+            return [self.deployment('detector', get_detector_body(job.get('config_file_path'), job.get('class_name')))]
+        if mode == 'multi_classify':
+            return [self.deployment('classifier', get_classifier_body(path)) for path in job['config_file_paths']]
+        return [self.deployment('classifier', get_classifier_body(job.get('config_file_path'), job.get('class_name')))]
+
+    def job_folders(self, job, deployments):
+        # (folderer, class folder root per deployment) for classify jobs that place images like the collection scripts, else None
+        folder_mode = job.get('folder_mode', 'none')
+        if job['mode'] == 'detect' or job.get('results_dir') is None or folder_mode == 'none':
+            return None
+        if job['mode'] == 'multi_classify':
+            roots = [classifier_results_dir(job['results_dir'], path) for path in job['config_file_paths']]
+        else:
+            roots = [job['results_dir']]
+        for deployment, root in zip(deployments, roots):
+            prep_classification_results_dir(deployment.body, root, clean=job.get('clean_results', False))
+        return ResultFolderer(folder_mode), roots
+
+    def infer_file(self, mode, deployments, body_hashes, path, preprocess_options):
+        # Returns the result and the deployed IDs it was made with
+        file_data = get_file_data(path, STREAM_THRESHOLD_BYTES)
+        cache_keys = None
+        if self.cache is not None:
+            # Same keys as the collection scripts, so the daemon and the scripts share cached results
+            cache_keys = [
+                make_cache_key(self.client, mode, file_data['data'][1], body_hash, preprocess_options.signature())
+                for body_hash in body_hashes
+            ]
+            cached = [self.cache.get(cache_key) for cache_key in cache_keys]
+            if all(result is not None for result in cached):
+                deployed_ids = [deployment.deployed_id for deployment in deployments]
+                if mode == 'multi_classify':
+                    return dict(zip(deployed_ids, cached)), deployed_ids
+                return cached[0], deployed_ids
+        upload_data, factors, _ = timed_preprocess(file_data, preprocess_options)
+        if mode == 'multi_classify':
+            build_params = lambda deployed_ids: {'deployed_ids': deployed_ids}
+        else:
+            build_params = lambda deployed_ids: {'deployed_id': deployed_ids[0]}
+        deployed_ids, response = post_to_deployments(self.client, ENDPOINTS[mode], deployments, build_params, files=upload_data)
+        if response.status_code != 200:
+            raise ValueError(response.json())
+        result = response.json()
+        if mode == 'detect':
+            # Boxes come back in the uploaded image's coordinates
+            result = rescale_detections(result[0], factors)
+        if cache_keys is not None:
+            if mode == 'multi_classify':
+                for cache_key, deployed_id in zip(cache_keys, deployed_ids):
+                    self.cache.put(cache_key, result[deployed_id])
+            else:
+                self.cache.put(cache_keys[0], result)
+        return result, deployed_ids
+
+    def run_job(self, job, emit):
+        # Emits one {'key', 'result'} or {'key', 'error'} record per file in order, then a summary
+        start = time.perf_counter()
+        deployments = self.job_deployments(job)
+        body_hashes = [hash_body(deployment.body) for deployment in deployments]
+        preprocess_options = PreprocessOptions(**job.get('preprocess', {}))
+        folders = self.job_folders(job, deployments)
+
+        def infer(item):
+            key, path = item
+            try:
+                result, deployed_ids = self.infer_file(job['mode'], deployments, body_hashes, path, preprocess_options)
+                if folders is not None:
+                    folderer, roots = folders
+                    predictions = [result[deployed_id]['pred'] for deployed_id in deployed_ids] if job['mode'] == 'multi_classify' else [result['pred']]
+                    for root, prediction in zip(roots, predictions):
+                        folderer.place(path, f"{root}/{prediction}/{result_relpath(key)}")
+                return {'key': key, 'result': result}
+            except Exception as e:
+                # One bad file fails its own record, not the job or the daemon
+                return {'key': key, 'error': str(e)}
+
+        files = errors = 0
+        for _, record in bounded_map(infer, job['files'], job.get('max_in_flight', DEFAULT_JOB_IN_FLIGHT)):
+            files += 1
+            errors += 'error' in record
+            emit(record)
+        with self._lock:
+            self.jobs += 1
+            self.files += files
+            self.errors += errors
+        emit({'done': True, 'files': files, 'errors': errors, 'seconds': time.perf_counter() - start})
+
+    def status(self):
+        with self._lock:
+            return {
+                'uptime_seconds': time.time() - self.started,
+                'jobs': self.jobs,
+                'files': self.files,
+                'errors': self.errors,
+                'deployments': len(self._deployments),
+                'scheduler': self.client.scheduler.summary() if self.client.scheduler is not None else None,
+                'uploads': self.client.upload_budget.summary() if self.client.upload_budget is not None else None
+            }
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    # One JSON job per line in; newline-delimited JSON records out
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+                if job.get('mode') == 'status':
+                    self.send({'done': True, 'status': self.server.daemon.status()})
+                elif job.get('mode') == 'shutdown':
+                    self.send({'done': True, 'message': 'shutting down'})
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+                elif job.get('mode') in JOB_MODES:
+                    self.server.daemon.run_job(job, self.send)
+                else:
+                    self.send({'done': True, 'error': f"Unknown mode {job.get('mode')}"})
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            except Exception as e:
+                self.send({'done': True, 'error': str(e)})
+
+    def send(self, record):
+        self.wfile.write(json.dumps(record).encode() + b'\n')
+        self.wfile.flush()
+
+
+class DaemonServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def claim_socket_path(socket_path):
+    # Removes a socket left behind by a daemon that died; refuses to start next to a live one
+    if not os.path.exists(socket_path):
+        os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(socket_path)
+    else:
+        raise click.ClickException(f"An inference daemon is already listening on {socket_path}")
+    finally:
+        probe.close()
+
+
+@click.command()
+@click.option('-h', '--host', default='https://api.alpha.directai.io', help='DirectAI Host')
+@click.option('--socket', 'socket_path', default=DEFAULT_SOCKET_PATH, help='Unix Socket to Listen On')
+@click.option('--max-concurrency', default=DEFAULT_MAX_CONCURRENCY, type=click.IntRange(min=1), help='Maximum Number of Concurrent Requests Across All Jobs')
+@click.option('--pool-size', default=DEFAULT_POOL_SIZE, type=click.IntRange(min=1), help='Maximum Number of Keep-Alive Connections')
+@click.option('--cache-dir', default=DEFAULT_CACHE_DIR, help='Directory for the Inference Result Cache and Deployment Registry')
+@click.option('--cache-max-mb', default=DEFAULT_CACHE_MAX_MB, type=click.FloatRange(min=0), help='Maximum Size of the Inference Result Cache (MB)')
+@click.option('--no-cache', is_flag=True, default=False, help='Flag to bypass the inference result cache')
+@click.option('--max-retries', default=DEFAULT_MAX_RETRIES, type=click.IntRange(min=0), help='Retries per Request on 429/5xx/Connection Errors')
+@click.option('--rate-limit', default=None, type=click.FloatRange(min=0, min_open=True), help='Maximum Requests per Second')
+@click.option('--upload-budget-mb', default=DEFAULT_UPLOAD_BUDGET_MB, type=click.FloatRange(min=0), help='Maximum Upload Bytes in Flight Across All Requests (MB); 0 for no cap')
+def main(host, socket_path, max_concurrency, pool_size, cache_dir, cache_max_mb, no_cache, max_retries, rate_limit, upload_budget_mb):
+    # One scheduler for every job, so concurrent batches share the concurrency window and rate limit
+    scheduler = RequestScheduler(max_concurrency=max_concurrency, rate_limit=rate_limit, max_retries=max_retries)
+    client = DirectAIClient(
+        host,
+        client_id=DIRECTAI_CLIENT_ID,
+        client_secret=DIRECTAI_CLIENT_SECRET,
+        pool_size=max(pool_size, max_concurrency),
+        scheduler=scheduler,
+        upload_budget_bytes=upload_budget_mb * 1e6
+    )
+    client.get_access_token()
+    cache = open_inference_cache(cache_dir, cache_max_mb, no_cache)
+    daemon = InferenceDaemon(client, open_deployment_registry(cache_dir), cache)
+
+    claim_socket_path(socket_path)
+    server = DaemonServer(socket_path, JobHandler)
+    server.daemon = daemon
+    os.chmod(socket_path, 0o600)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        # shutdown() waits for serve_forever to return, so it can't run on the thread serving
+        signal.signal(signum, lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+    print(f"Inference daemon listening on {socket_path}", flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        status = daemon.status()
+        print(f"Inference daemon: {status['jobs']} jobs, {status['files']} files, {status['errors']} errors")
+        if cache is not None:
+            print(cache.summary())
+            cache.close()
+        client.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+import os
+import re
+import sys
+import shutil
+import click
+
+parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_directory)
+from scanner import iter_collection, shard_of, SUPPORTED_IMAGE_EXTENSIONS
+from results_writer import open_results_writer, iter_results, compact_jsonl_to_json
+from columnar_results import compact_results, RESULTS_FORMATS
+from video import split_frame_key, VIDEO_EXTENSIONS
+
+
+MERGE_MODES = ('classification', 'multi_classification', 'detection')
+SHARD_DIR_PATTERN = re.compile(r'^shard-(\d+)-of-(\d+)$')
+# Top-level files of a shard directory that are merged (or left behind), never moved
+BOOKKEEPING_EXTENSIONS = ('.json', '.jsonl', '.col', '.prom')
+MAX_LISTED = 10
+
+
+def find_shard_dirs(results_dir):
+    # ({shard index: directory}, shard count) from the shard-i-of-N subdirectories of results_dir
+    shard_dirs = {}
+    counts = set()
+    with os.scandir(results_dir) as entries:
+        for entry in entries:
+            match = SHARD_DIR_PATTERN.match(entry.name)
+            if match and entry.is_dir():
+                shard_dirs[int(match.group(1))] = entry.path
+                counts.add(int(match.group(2)))
+    if not shard_dirs:
+        raise click.ClickException(f"No shard-i-of-N directories in {results_dir}")
+    if len(counts) > 1:
+        raise click.ClickException(f"{results_dir} holds shards of different runs (of {', '.join(map(str, sorted(counts)))}); merge them separately")
+    return shard_dirs, counts.pop()
+
+def shard_results_path(shard_dir, results_name):
+    # The JSONL log is complete even when a shard died before compacting its JSON
+    for extension in ('.jsonl', '.json'):
+        path = os.path.join(shard_dir, f"{results_name}{extension}")
+        if os.path.exists(path):
+            return path
+    return None
+
+class ShardMerge:
+    # Streams every shard's results into one writer, keeping only the keys to check for duplicates and misplaced files
+    def __init__(self, shard_dirs, count):
+        self.shard_dirs = shard_dirs
+        self.count = count
+        self.shards_of_keys = {}
+        self.duplicates = []
+        self.misplaced = []
+        self.without_results = []
+
+    def merge(self, results_name, writer):
+        for index in sorted(self.shard_dirs):
+            path = shard_results_path(self.shard_dirs[index], results_name)
+            if path is None:
+                self.without_results.append(index)
+                continue
+            for key, result in iter_results(path):
+                first_shard = self.shards_of_keys.setdefault(key, index)
+                if first_shard != index:
+                    # First shard wins, as when a single run recorded a key twice
+                    self.duplicates.append((key, first_shard, index))
+                    continue
+                if shard_of(split_frame_key(key)[0], self.count) != index:
+                    self.misplaced.append((key, index))
+                writer.write(key, result)
+
+    def missing(self, expected_keys):
+        # Files in the collection no shard has results for; video keys count as processed if any frame is
+        processed = {split_frame_key(key)[0] for key in self.shards_of_keys}
+        return [key for key in expected_keys if key not in processed]
+
+def merge_extra_results(shard_dirs, results_name, results_dir):
+    # Side outputs such as the near-duplicate mappings are concatenated without checks; returns the merged JSONL path
+    if not any(shard_results_path(shard_dir, results_name) for shard_dir in shard_dirs.values()):
+        return None
+    writer, _ = open_results_writer(results_dir, results_name)
+    with writer:
+        ShardMerge(shard_dirs, 1).merge(results_name, writer)
+    compact_jsonl_to_json(writer.jsonl_path, f"{results_dir}/{results_name}.json")
+    return writer.jsonl_path
+
+def move_shard_outputs(shard_dir, results_dir):
+    # Moves class folders and annotated images up into results_dir; the shard's results and metrics files stay put
+    moved = 0
+    for root, _, files in os.walk(shard_dir, topdown=False):
+        relative_root = os.path.relpath(root, shard_dir)
+        for name in files:
+            if relative_root == '.' and name.endswith(BOOKKEEPING_EXTENSIONS):
+                continue
+            target = os.path.normpath(os.path.join(results_dir, relative_root, name))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(os.path.join(root, name), target)
+            moved += 1
+        if relative_root != '.' and not os.listdir(root):
+            os.rmdir(root)
+    return moved
+
+def print_listed(title, items):
+    print(f"{title}: {len(items)}")
+    for item in items[:MAX_LISTED]:
+        print(f"    {item}")
+    if len(items) > MAX_LISTED:
+        print(f"    ... and {len(items) - MAX_LISTED} more")
+
+
+@click.command()
+@click.option('-m', '--mode', default='classification', type=click.Choice(MERGE_MODES), help='Which Script\'s Shards to Merge')
+@click.option('-r', '--results-dir', default='results', help='Directory Holding the shard-i-of-N Directories; Merged Results Are Written Here')
+@click.option('-d', '--data-dir', default='data', help='Directory for Input Data, Scanned to Find Files No Shard Processed')
+@click.option('--recursive', is_flag=True, default=False, help='Flag to include images in subdirectories of the data directory')
+@click.option('--include', multiple=True, help='Glob of Files to Process (e.g. "*.png"); repeat as necessary')
+@click.option('--exclude', multiple=True, help='Glob of Files to Skip; repeat as necessary')
+@click.option('--manifest', default=None, help='File Listing Paths to Process, one per line ("-" for stdin)')
+@click.option('--no-scan', is_flag=True, default=False, help='Flag to skip scanning the data directory for missing files')
+@click.option('--move-outputs', is_flag=True, default=False, help='Flag to move each shard\'s class folders and annotated images into the results directory')
+@click.option('--results-format', default='json', type=click.Choice(RESULTS_FORMATS), help='Format of the Merged Results File: JSON, or a Memory-Mappable Columnar .col File')
+def main(mode, results_dir, data_dir, recursive, include, exclude, manifest, no_scan, move_outputs, results_format):
+    results_name = f"{mode}_results"
+    shard_dirs, count = find_shard_dirs(results_dir)
+
+    shard_merge = ShardMerge(shard_dirs, count)
+    writer, _ = open_results_writer(results_dir, results_name)
+    with writer:
+        shard_merge.merge(results_name, writer)
+    duplicates_path = None
+    if mode != 'multi_classification':
+        duplicates_path = merge_extra_results(shard_dirs, f"{mode}_duplicates", results_dir)
+    compact_results(writer.jsonl_path, results_dir, results_name, results_format, duplicates_path)
+    print(f"Merged {len(shard_merge.shards_of_keys)} results from {len(shard_dirs)} of {count} shards into {results_dir}")
+
+    missing_shards = [f"shard {index}/{count}" for index in range(1, count + 1) if index not in shard_dirs]
+    missing_shards += [f"shard {index}/{count} (no {results_name} file)" for index in shard_merge.without_results]
+    missing = []
+    if not no_scan:
+        expected_keys = iter_collection(
+            data_dir,
+            recursive=recursive,
+            include=include,
+            exclude=exclude,
+            manifest=manifest,
+            extensions=SUPPORTED_IMAGE_EXTENSIONS + VIDEO_EXTENSIONS
+        )
+        # Listed with the shard to re-run (with --resume) for each
+        missing = [f"{key} (shard {shard_of(key, count)}/{count})" for key in shard_merge.missing(expected_keys)]
+    print_listed('Missing shards', missing_shards)
+    print_listed('Files in more than one shard', [f"{key} (shards {first} and {other})" for key, first, other in shard_merge.duplicates])
+    print_listed('Files in the wrong shard', [f"{key} (in shard {index}, hashes to {shard_of(split_frame_key(key)[0], count)})" for key, index in shard_merge.misplaced])
+    if not no_scan:
+        print_listed('Files no shard processed', missing)
+
+    if move_outputs:
+        moved = sum(move_shard_outputs(shard_dir, results_dir) for shard_dir in shard_dirs.values())
+        print(f"Moved {moved} files from the shard directories into {results_dir}")
+    if missing_shards or missing or shard_merge.duplicates or shard_merge.misplaced:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import bisect
+import threading
+
+from tqdm import tqdm
+
+
+# Histogram bucket upper bounds (seconds), Prometheus-style
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float('inf'))
+LIVE_REFRESH_SECONDS = 1.0
+METRICS_PREFIX = 'directai'
+
+
+class StageHistogram:
+    def __init__(self):
+        self.counts = [0] * len(STAGE_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(STAGE_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        # Linear interpolation within the bucket holding the q-th observation,
+        # with the bucket narrowed to the observed [min, max] so estimates never leave that range
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for upper, count in zip(STAGE_BUCKETS, self.counts):
+            if count and seen + count >= rank:
+                lower = max(lower, self.min)
+                upper = min(upper, self.max)
+                return lower + (upper - lower) * max(0.0, rank - seen) / count
+            seen += count
+            lower = upper
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum_seconds': self.total,
+            'mean_ms': 1000 * self.total / self.count if self.count else 0.0,
+            'min_ms': 1000 * self.min if self.count else 0.0,
+            'p50_ms': 1000 * self.quantile(0.5),
+            'p95_ms': 1000 * self.quantile(0.95),
+            'p99_ms': 1000 * self.quantile(0.99),
+            'max_ms': 1000 * self.max,
+            'buckets': {format_bound(upper): count for upper, count in zip(STAGE_BUCKETS, self.counts)}
+        }
+
+
+class _StageTimer:
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+
+
+class RunMetrics:
+    # Per-stage latency histograms plus byte and event counters for one collection run
+    # Recording is a perf_counter pair and a short critical section, so it stays on by default
+    def __init__(self, job):
+        self.job = job
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.bytes = {}
+        self.counters = {}
+
+    def stage(self, name):
+        # with metrics.stage('read'): ...
+        return _StageTimer(self, name)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.stages.get(name)
+            if histogram is None:
+                histogram = self.stages[name] = StageHistogram()
+            histogram.observe(seconds)
+
+    def add_bytes(self, name, count):
+        with self._lock:
+            self.bytes[name] = self.bytes.get(name, 0) + count
+
+    def increment(self, name, count=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    def wall_seconds(self):
+        return time.perf_counter() - self._start
+
+    def breakdown(self):
+        # Compact per-stage mean latency for a progress bar postfix
+        with self._lock:
+            return ' '.join(
+                f"{name}={1000 * histogram.total / histogram.count:.1f}ms"
+                for name, histogram in self.stages.items() if histogram.count
+            )
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'job': self.job,
+                'started': self.started,
+                'wall_seconds': self.wall_seconds(),
+                'stages': {name: histogram.to_dict() for name, histogram in self.stages.items()},
+                'bytes': dict(self.bytes),
+                'counters': dict(self.counters)
+            }
+
+    def to_prometheus(self):
+        # Prometheus text exposition format, for the node_exporter textfile collector
+        data = self.to_dict()
+        job = escape_label(self.job)
+        lines = [
+            f"# HELP {METRICS_PREFIX}_stage_seconds Time spent per item in each pipeline stage",
+            f"# TYPE {METRICS_PREFIX}_stage_seconds histogram"
+        ]
+        for name, stage in data['stages'].items():
+            labels = f'job="{job}",stage="{escape_label(name)}"'
+            cumulative = 0
+            for bound, count in stage['buckets'].items():
+                cumulative += count
+                lines.append(f'{METRICS_PREFIX}_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{METRICS_PREFIX}_stage_seconds_sum{{{labels}}} {stage['sum_seconds']}")
+            lines.append(f"{METRICS_PREFIX}_stage_seconds_count{{{labels}}} {stage['count']}")
+        lines += [
+            f"# HELP {METRICS_PREFIX}_bytes_total Bytes moved per kind",
+            f"# TYPE {METRICS_PREFIX}_bytes_total counter"
+        ]
+        for name, count in data['bytes'].items():
+            lines.append(f'{METRICS_PREFIX}_bytes_total{{job="{job}",kind="{escape_label(name)}"}} {count}')
+        lines += [
+            f"# HELP {METRICS_PREFIX}_events_total Run events per kind",
+            f"# TYPE {METRICS_PREFIX}_events_total counter"
+        ]
+        for name, count in data['counters'].items():
+            lines.append(f'{METRICS_PREFIX}_events_total{{job="{job}",event="{escape_label(name)}"}} {count}')
+        lines += [
+            f"# HELP {METRICS_PREFIX}_run_wall_seconds Wall-clock duration of the run",
+            f"# TYPE {METRICS_PREFIX}_run_wall_seconds gauge",
+            f'{METRICS_PREFIX}_run_wall_seconds{{job="{job}"}} {data["wall_seconds"]}',
+            f"# HELP {METRICS_PREFIX}_run_started_timestamp_seconds Unix time the run started",
+            f"# TYPE {METRICS_PREFIX}_run_started_timestamp_seconds gauge",
+            f'{METRICS_PREFIX}_run_started_timestamp_seconds{{job="{job}"}} {data["started"]}'
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        data = self.to_dict()
+        lines = [f"Metrics: {data['wall_seconds']:.1f}s wall"]
+        for name, stage in data['stages'].items():
+            lines.append(
+                f"Metrics: {name:<16} n={stage['count']:<7} total={stage['sum_seconds']:.1f}s "
+                f"mean={stage['mean_ms']:.1f}ms p95={stage['p95_ms']:.1f}ms"
+            )
+        if data['bytes']:
+            lines.append('Metrics: ' + ', '.join(f"{name} {count / 1e6:.1f} MB" for name, count in data['bytes'].items()))
+        return '\n'.join(lines)
+
+    def write(self, json_path, prometheus_path=None):
+        # Both files are replaced atomically so a collector never scrapes a half-written file
+        write_atomic(json_path, json.dumps(self.to_dict(), indent=2))
+        if prometheus_path is not None:
+            write_atomic(prometheus_path, self.to_prometheus())
+
+
+def format_bound(upper):
+    return '+Inf' if upper == float('inf') else repr(upper)
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def write_atomic(path, text):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def metrics_paths(results_dir, results_name, metrics_file=None):
+    # Defaults to <results_dir>/<results_name>_metrics.json with a .prom file alongside
+    json_path = metrics_file or f"{results_dir}/{results_name}_metrics.json"
+    return json_path, f"{os.path.splitext(json_path)[0]}.prom"
+
+def track_progress(iterable, metrics, live=False, total=None):
+    # tqdm over the results, showing the per-stage breakdown at most once per refresh interval
+    progress = tqdm(iterable, total=total)
+    if not live:
+        yield from progress
+        return
+    last_refresh = 0.0
+    for item in progress:
+        now = time.perf_counter()
+        if now - last_refresh >= LIVE_REFRESH_SECONDS:
+            progress.set_postfix_str(metrics.breakdown(), refresh=False)
+            last_refresh = now
+        yield item
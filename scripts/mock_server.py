@@ -0,0 +1,296 @@
+import json
+import time
+import uuid
+import random
+import hashlib
+import threading
+import click
+import cv2
+import numpy as np
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+INFERENCE_PATHS = ('/classify', '/multi_classify', '/detect')
+DEFAULT_LATENCY_MS = 50.0
+DEFAULT_CAPACITY = 8
+DETECT_MODES = ('random', 'targets')
+# In targets mode, images are shrunk to this long side before looking for targets, like a model's input resolution
+DEFAULT_MODEL_INPUT_SIZE = 1024
+# Targets smaller than this many pixels at model resolution are missed
+MIN_TARGET_PIXELS = 16
+
+
+class MockSettings:
+    def __init__(
+        self,
+        latency_ms=DEFAULT_LATENCY_MS,
+        latency_jitter_ms=0.0,
+        error_rate=0.0,
+        throttle_rate=0.0,
+        bandwidth_mbps=None,
+        max_upload_mb=None,
+        capacity=DEFAULT_CAPACITY,
+        token_lifetime=3600,
+        detect_mode='random',
+        model_input_size=DEFAULT_MODEL_INPUT_SIZE
+    ):
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        # Fraction of inference requests answered with 503 / 429
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        # Simulated ingest bandwidth, so upload time scales with payload size
+        self.bandwidth_mbps = bandwidth_mbps
+        self.max_upload_mb = max_upload_mb
+        # Inference slots; requests beyond this queue up, like a saturated container
+        self.capacity = capacity
+        self.token_lifetime = token_lifetime
+        # 'random' boxes, or 'targets': pure red blobs, found only if big enough at model_input_size
+        self.detect_mode = detect_mode
+        self.model_input_size = model_input_size
+
+
+class MockState:
+    # Deployments plus per-request statistics the benchmark harness reads back
+    def __init__(self, settings):
+        self.settings = settings
+        self.deployments = {}
+        self.slots = threading.BoundedSemaphore(settings.capacity)
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.request_counts = {}
+            self.status_counts = {}
+            self.latencies = []
+            self.bytes_received = 0
+
+    def record(self, path, status, latency, received):
+        with self.lock:
+            self.request_counts[path] = self.request_counts.get(path, 0) + 1
+            self.status_counts[str(status)] = self.status_counts.get(str(status), 0) + 1
+            self.bytes_received += received
+            if path in INFERENCE_PATHS:
+                self.latencies.append(latency)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'request_counts': dict(self.request_counts),
+                'status_counts': dict(self.status_counts),
+                'bytes_received': self.bytes_received,
+                'latencies': list(self.latencies)
+            }
+
+
+def parse_multipart_file(content_type, body):
+    # Returns the bytes of the first file part of a multipart/form-data body
+    boundary = content_type.split('boundary=')[-1].strip('"').encode()
+    start = body.find(b'\r\n\r\n', body.find(b'--' + boundary))
+    end = body.rfind(b'\r\n--' + boundary)
+    if start < 0 or end < 0:
+        raise ValueError("Malformed multipart body")
+    return body[start + 4:end]
+
+def image_digest(image_bytes):
+    return int(hashlib.sha256(image_bytes).hexdigest(), 16)
+
+def image_size(image_bytes):
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None:
+        raise ValueError("Unsupported image")
+    # Reduced decode is 1/8 scale; dimensions are only used to keep boxes inside the image
+    return image.shape[1] * 8, image.shape[0] * 8
+
+def classify_image(config, image_bytes):
+    names = [c['name'] for c in config['classifier_configs']]
+    digest = image_digest(image_bytes + config_id_salt(config))
+    raw = [((digest >> (8 * i)) & 0xff) + 1 for i in range(len(names))]
+    total = float(sum(raw))
+    scores = {name: value / total for name, value in zip(names, raw)}
+    return {'scores': scores, 'pred': max(scores, key=scores.get)}
+
+def detect_image(config, image_bytes):
+    width, height = image_size(image_bytes)
+    digest = image_digest(image_bytes + config_id_salt(config))
+    rng = random.Random(digest)
+    dets = []
+    for detector_config in config['detector_configs']:
+        threshold = detector_config.get('detection_threshold', 0.1)
+        for _ in range(rng.randint(0, 3)):
+            x1, y1 = rng.uniform(0, width * 0.8), rng.uniform(0, height * 0.8)
+            x2, y2 = rng.uniform(x1 + 1, width), rng.uniform(y1 + 1, height)
+            score = rng.uniform(0, 1)
+            if score >= threshold:
+                dets.append({'tlbr': [x1, y1, x2, y2], 'score': score, 'class': detector_config['name']})
+    return [dets]
+
+def detect_targets(config, image_bytes, model_input_size=DEFAULT_MODEL_INPUT_SIZE):
+    # Finds pure red blobs (see benchmark_tiling.py) the way a fixed-resolution model would:
+    # small ones vanish when a large image is shrunk to the model's input size
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Unsupported image")
+    height, width = image.shape[:2]
+    scale = min(1.0, model_input_size / max(height, width))
+    if scale < 1.0:
+        image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    blue, green, red = cv2.split(image.astype(np.int16))
+    mask = ((red > 200) & (green < 60) & (blue < 60)).astype(np.uint8)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+    name = config['detector_configs'][0]['name']
+    dets = []
+    for x, y, w, h, area in stats[1:count]:
+        if area >= MIN_TARGET_PIXELS:
+            dets.append({
+                'tlbr': [x / scale, y / scale, (x + w) / scale, (y + h) / scale],
+                'score': min(1.0, 0.5 + area / 400),
+                'class': name
+            })
+    return [dets]
+
+def config_id_salt(config):
+    return json.dumps(config, sort_keys=True).encode()
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        start = time.perf_counter()
+        if urlparse(self.path).path == '/stats':
+            self._respond(200, self.state.stats(), start, 0)
+        else:
+            self._respond(404, {'message': 'Not Found'}, start, 0)
+
+    def do_POST(self):
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            status, payload = self._route(url.path, query, body)
+        except ValueError as e:
+            status, payload = 400, {'message': str(e)}
+        self._respond(status, payload, start, len(body), url.path)
+
+    def _route(self, path, query, body):
+        settings = self.state.settings
+        if path == '/token':
+            return 200, {'access_token': uuid.uuid4().hex, 'expires_in': settings.token_lifetime}
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            return 401, {'message': 'Missing bearer token'}
+        if path in ('/deploy_classifier', '/deploy_detector'):
+            config = json.loads(body)
+            deployed_id = f"{path.split('_')[-1]}-{uuid.uuid4().hex[:12]}"
+            with self.state.lock:
+                self.state.deployments[deployed_id] = config
+            return 200, {'deployed_id': deployed_id}
+        if path in ('/run_tracker_on_url_stream', '/run_classifier_on_url_stream'):
+            return 200, {'tracker_instance_id': uuid.uuid4().hex[:12]}
+        if path == '/stop_tracker':
+            return 200, {'message': 'OK'}
+        if path not in INFERENCE_PATHS:
+            return 404, {'message': 'Not Found'}
+        return self._infer(path, query, body)
+
+    def _infer(self, path, query, body):
+        settings = self.state.settings
+        if settings.max_upload_mb is not None and len(body) > settings.max_upload_mb * 1024 * 1024:
+            return 413, {'message': 'Payload too large'}
+        if settings.bandwidth_mbps:
+            time.sleep(len(body) * 8 / (settings.bandwidth_mbps * 1e6))
+        roll = random.random()
+        if roll < settings.throttle_rate:
+            return 429, {'message': 'Too many requests'}
+        if roll < settings.throttle_rate + settings.error_rate:
+            return 503, {'message': 'Service unavailable'}
+        deployed_ids = query.get('deployed_ids', []) if path == '/multi_classify' else query.get('deployed_id', [])
+        with self.state.lock:
+            configs = [self.state.deployments.get(deployed_id) for deployed_id in deployed_ids]
+        if not configs or any(config is None for config in configs):
+            return 404, {'message': 'Unknown deployed_id'}
+        image_bytes = parse_multipart_file(self.headers.get('Content-Type', ''), body)
+        with self.state.slots:
+            latency = settings.latency_ms + random.uniform(-1, 1) * settings.latency_jitter_ms
+            time.sleep(max(0.0, latency) / 1000)
+            if path == '/classify':
+                return 200, classify_image(configs[0], image_bytes)
+            if path == '/multi_classify':
+                return 200, {
+                    deployed_id: classify_image(config, image_bytes)
+                    for deployed_id, config in zip(deployed_ids, configs)
+                }
+            if settings.detect_mode == 'targets':
+                return 200, detect_targets(configs[0], image_bytes, settings.model_input_size)
+            return 200, detect_image(configs[0], image_bytes)
+
+    def _respond(self, status, payload, start, received, path=None):
+        encoded = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+        if path is not None:
+            self.state.record(path, status, time.perf_counter() - start, received)
+
+
+def create_mock_server(settings=None, host='127.0.0.1', port=0):
+    # Returns a server with its own state; port 0 picks a free port (see server.server_address)
+    state = MockState(settings or MockSettings())
+    handler = type('BoundMockRequestHandler', (MockRequestHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+def start_mock_server_thread(settings=None, host='127.0.0.1', port=0):
+    server = create_mock_server(settings, host, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{server.server_address[0]}:{server.server_address[1]}"
+
+
+@click.command()
+@click.option('--bind', default='127.0.0.1', help='Address to Listen On')
+@click.option('-p', '--port', default=8000, type=int, help='Port to Listen On')
+@click.option('--latency-ms', default=DEFAULT_LATENCY_MS, type=click.FloatRange(min=0), help='Simulated Inference Latency (ms)')
+@click.option('--latency-jitter-ms', default=0.0, type=click.FloatRange(min=0), help='Uniform Jitter Added to the Latency (ms)')
+@click.option('--error-rate', default=0.0, type=click.FloatRange(0, 1), help='Fraction of Inference Requests Answered with 503')
+@click.option('--throttle-rate', default=0.0, type=click.FloatRange(0, 1), help='Fraction of Inference Requests Answered with 429')
+@click.option('--bandwidth-mbps', default=None, type=click.FloatRange(min=0, min_open=True), help='Simulated Upload Bandwidth (Mbit/s)')
+@click.option('--max-upload-mb', default=None, type=click.FloatRange(min=0), help='Reject Uploads Larger Than This (MB) with 413')
+@click.option('--capacity', default=DEFAULT_CAPACITY, type=click.IntRange(min=1), help='Number of Requests Inferred at Once')
+@click.option('--token-lifetime', default=3600, type=click.IntRange(min=1), help='Access Token Lifetime (s)')
+@click.option('--detect-mode', default='random', type=click.Choice(DETECT_MODES), help='Random Boxes, or Red Targets Found at the Model Input Resolution')
+@click.option('--model-input-size', default=DEFAULT_MODEL_INPUT_SIZE, type=click.IntRange(min=32), help='Long Side Images Are Shrunk to in Targets Mode')
+def main(bind, port, latency_ms, latency_jitter_ms, error_rate, throttle_rate, bandwidth_mbps, max_upload_mb, capacity, token_lifetime, detect_mode, model_input_size):
+    settings = MockSettings(
+        latency_ms=latency_ms,
+        latency_jitter_ms=latency_jitter_ms,
+        error_rate=error_rate,
+        throttle_rate=throttle_rate,
+        bandwidth_mbps=bandwidth_mbps,
+        max_upload_mb=max_upload_mb,
+        capacity=capacity,
+        token_lifetime=token_lifetime,
+        detect_mode=detect_mode,
+        model_input_size=model_input_size
+    )
+    server = create_mock_server(settings, bind, port)
+    print(f"Mock DirectAI server listening on http://{bind}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
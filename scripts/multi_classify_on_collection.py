@@ -1,93 +1,102 @@
 import os
 import sys
-import json
-import requests
-import shutil
 import click
 
-from dotenv import load_dotenv
-from tqdm import tqdm
-
 parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(parent_directory)
-from utils import get_directai_access_token, get_file_data
+from collection_run import CollectionRun, collection_options, folder_options
+from deployment_registry import ensure_deployments
+from foldering import ResultFolderer
+from scanner import result_relpath
+from inference_cache import hash_body
 from classification_on_collection import get_classifier_body, deploy_classifier, prep_classification_results_dir
 
 
-load_dotenv()
-DIRECTAI_CLIENT_ID = os.getenv("DIRECTAI_CLIENT_ID")
-DIRECTAI_CLIENT_SECRET = os.getenv("DIRECTAI_CLIENT_SECRET")
-
+def classifier_results_dir(results_dir, config_file_path):
+    # Each config's class folders go under a subdirectory named after its config file
+    stripped_config_name = config_file_path.split("/")[-1].split(".")[0]
+    return f"{results_dir}/{stripped_config_name}"
 
 @click.command()
-@click.option('-h', '--host', default='https://api.alpha.directai.io', help='DirectAI Host')
-@click.option('-d', '--data-dir', default='data', help='Directory for Input Data')
-@click.option('-r', '--results-dir', default='results', help='Directory for Results')
+@collection_options
 @click.option('-f', '--config-file-paths', default=['configs/classifier.json', 'configs/alt_classifier.json'], help='File Path(s) for Classifier Configuration', multiple=True)
-def main(host, data_dir, results_dir, config_file_paths):
-    # Get Access Token
-    access_token = get_directai_access_token(
-        client_id=DIRECTAI_CLIENT_ID,
-        client_secret=DIRECTAI_CLIENT_SECRET,
-        auth_endpoint=host+"/token"
-    )
-    
-    deployed_classifier_ids = []
-    classifier_results_dirs = []
-    if len(config_file_paths) > 0:
-        if not os.path.exists(results_dir):
-            os.makedirs(results_dir)
-        for config_file_path in config_file_paths:
-            # Model Deployment Prep
-            classifier_body = get_classifier_body(config_file_path)
-            deployed_classifier_id = deploy_classifier(host, classifier_body, access_token)
-            deployed_classifier_ids.append(deployed_classifier_id)
-            # Results Directory Prep
-            stripped_config_name = config_file_path.split("/")[-1].split(".")[0]
-            classifier_results_dir = f"{results_dir}/{stripped_config_name}"
-            classifier_results_dirs.append(classifier_results_dir)
-            prep_classification_results_dir(classifier_body, classifier_results_dir)
-    else:
+@folder_options
+def main(config_file_paths, folder_mode, clean_results, **options):
+    if len(config_file_paths) == 0:
         print("Please provide config file paths. Exiting.")
         return
+    run = CollectionRun('multi_classification', **options)
+    deployments = []
+    classifier_body_hashes = []
+    classifier_results_dirs = []
+    for config_file_path in config_file_paths:
+        # Model Deployment Prep
+        classifier_body = get_classifier_body(config_file_path)
+        deployments.append(run.deployment('classifier', classifier_body, deploy_classifier))
+        classifier_body_hashes.append(hash_body(classifier_body))
+        # Results Directory Prep
+        classifier_results_dirs.append(classifier_results_dir(run.results_dir, config_file_path))
+        prep_classification_results_dir(
+            classifier_body,
+            classifier_results_dirs[-1],
+            clean=clean_results and not run.resume,
+            create_class_dirs=folder_mode != 'none'
+        )
+    # Reuses registered IDs for unchanged configs and deploys the rest concurrently
+    ensure_deployments(deployments)
     
-    headers = {
-        'Authorization': f"Bearer {access_token}"
-    }
-    
-    # Compiled Results
-    results = {}
+    # Places predicted images into class folders
+    folderer = ResultFolderer(folder_mode)
     
-    # Run Classification on Data Collection
-    for filename in tqdm(os.listdir(data_dir)):
-        if filename == '.DS_Store':
-            continue
-        params = {
-            'deployed_ids': deployed_classifier_ids
-        }
-        file_data = get_file_data(f"{data_dir}/{filename}")
-        classify_response = requests.post(
-            f"{host}/multi_classify",
-            headers=headers, 
-            params=params,
-            files=file_data
+    def upload_file(file_data, cache_keys):
+        # Returns the deployed IDs the results are keyed by with the results, since a redeploy may change them
+        deployed_classifier_ids, file_results, _ = run.upload(
+            "/multi_classify",
+            deployments,
+            lambda deployed_ids: {'deployed_ids': deployed_ids},
+            file_data
         )
-        if classify_response.status_code != 200:
-            raise ValueError(classify_response.json())
-        results[filename] = classify_response.json()
-        for classifier_results_dir, deployed_classifier_id in zip(classifier_results_dirs, deployed_classifier_ids):
-            prediction = results[filename][deployed_classifier_id]['pred']
-            stripped_config_name = config_file_path.split("/")[-1].split(".")[0]
-            shutil.copy(
-                f"{data_dir}/{filename}",
-                f"{classifier_results_dir}/{prediction}/{filename}"
-            )
+        if run.cache is not None:
+            for cache_key, deployed_classifier_id in zip(cache_keys, deployed_classifier_ids):
+                run.cache.put(cache_key, file_results[deployed_classifier_id])
+        return deployed_classifier_ids, file_results
+    
+    def multi_classify_file(item):
+        filename, frame = item
+        file_data = run.read(filename, frame)
+        deployed_classifier_ids = [deployment.deployed_id for deployment in deployments]
+        file_results = None
+        cache_keys = None
+        if run.cache is not None:
+            # One entry per image + classifier body, so adding a config only re-runs missing ones
+            cache_keys = [
+                run.cache_key('multi_classify', file_data, classifier_body_hash)
+                for classifier_body_hash in classifier_body_hashes
+            ]
+            with run.metrics.stage('cache_lookup'):
+                cached_results = [run.cache.get(cache_key) for cache_key in cache_keys]
+            if all(cached_result is not None for cached_result in cached_results):
+                file_results = dict(zip(deployed_classifier_ids, cached_results))
+                run.metrics.increment('cache_hits')
+        if file_results is None:
+            # A near-duplicate waits for (or reuses) its representative's predictions instead of being uploaded
+            (deployed_classifier_ids, file_results), _ = run.infer_or_reuse(filename, file_data, lambda: upload_file(file_data, cache_keys))
+        if frame is not None:
+            # Frames have no file of their own to place; their predictions are in the results only
+            return file_results
+        with run.metrics.stage('folder'):
+            for class_folders_dir, deployed_classifier_id in zip(classifier_results_dirs, deployed_classifier_ids):
+                prediction = file_results[deployed_classifier_id]['pred']
+                folderer.place(
+                    os.path.join(run.data_dir, filename),
+                    f"{class_folders_dir}/{prediction}/{result_relpath(filename)}"
+                )
+        return file_results
     
+    # Run Classification on Data Collection
+    run.run(multi_classify_file)
     # Save Inference Results
-    with open(f"{results_dir}/multi_classification_results.json", 'w') as f:
-        json.dump(results, f)
+    run.finish([folderer.summary()])
     
 if __name__ == '__main__':
     main()
-    
-    
\ No newline at end of file
@@ -0,0 +1,113 @@
+import numpy as np
+
+
+def box_iou(a, b):
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+def detections_to_arrays(dets):
+    # (boxes (n, 4), scores (n,), class ids (n,), class names) from a list of detection dicts
+    if not dets:
+        return np.zeros((0, 4)), np.zeros(0), np.zeros(0, dtype=np.intp), []
+    boxes = np.asarray([det['tlbr'] for det in dets], dtype=np.float64)
+    scores = np.asarray([det['score'] for det in dets], dtype=np.float64)
+    class_names, class_ids = np.unique([det['class'] for det in dets], return_inverse=True)
+    return boxes, scores, class_ids, list(class_names)
+
+def nms_indices(boxes, scores, iou_threshold, groups=None):
+    # Greedy NMS: keeps the highest-scoring box and drops every box overlapping it by more than
+    # iou_threshold, one vectorized IoU row per kept box. Returns kept indices, best first
+    # Boxes in different groups (classes, or images) never suppress each other
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.intp)
+    if groups is not None:
+        # Moving each group to its own region makes cross-group IoU zero, so one pass covers every group
+        span = boxes.max() - boxes.min() + 1
+        boxes = boxes + (np.asarray(groups) * span)[:, None]
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        widths = np.clip(np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest]), 0, None)
+        heights = np.clip(np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest]), 0, None)
+        intersections = widths * heights
+        unions = areas[best] + areas[rest] - intersections
+        ious = np.divide(intersections, unions, out=np.zeros_like(intersections), where=unions > 0)
+        order = rest[ious <= iou_threshold]
+    return np.asarray(keep, dtype=np.intp)
+
+def class_wise_nms(dets, iou_threshold):
+    # NMS within each class over a list of detection dicts, best first
+    boxes, scores, class_ids, _ = detections_to_arrays(dets)
+    return [dets[index] for index in nms_indices(boxes, scores, iou_threshold, class_ids)]
+
+def apply_thresholds(dets, thresholds, nms_threshold):
+    # One image's detections as the server would return them with these thresholds ({class: threshold});
+    # classes not listed are dropped
+    candidates = [det for det in dets if det['class'] in thresholds and det['score'] >= thresholds[det['class']]]
+    return class_wise_nms(candidates, nms_threshold)
+
+def group_bounds(groups):
+    # For groups sorted ascending: the index one past the end of each element's group
+    n = len(groups)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(groups)) + 1, [n]))
+    return np.repeat(starts[1:], np.diff(starts))
+
+def overlap_pairs(boxes, groups, min_iou=0.0, chunk_pairs=1 << 22):
+    # Every pair (i, j) within a group whose IoU exceeds min_iou, with i ranked above j
+    # Rows must already be sorted by group, then by descending score; pairs are built chunk by chunk to bound memory
+    n = len(boxes)
+    if n == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), np.zeros(0)
+    counts = group_bounds(groups) - np.arange(n) - 1
+    ends = np.cumsum(counts)
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    firsts, seconds, ious = [], [], []
+    start = 0
+    while start < n:
+        stop = max(start + 1, int(np.searchsorted(ends, ends[start] - counts[start] + chunk_pairs, side='right')))
+        chunk_counts = counts[start:stop]
+        first = np.repeat(np.arange(start, stop), chunk_counts)
+        offsets = np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+        second = first + 1 + (np.arange(len(first)) - offsets)
+        widths = np.clip(np.minimum(x2[first], x2[second]) - np.maximum(x1[first], x1[second]), 0, None)
+        heights = np.clip(np.minimum(y2[first], y2[second]) - np.maximum(y1[first], y1[second]), 0, None)
+        intersections = widths * heights
+        unions = areas[first] + areas[second] - intersections
+        iou = np.divide(intersections, unions, out=np.zeros_like(intersections), where=unions > 0)
+        overlapping = iou > min_iou
+        firsts.append(first[overlapping])
+        seconds.append(second[overlapping])
+        ious.append(iou[overlapping])
+        start = stop
+    return np.concatenate(firsts), np.concatenate(seconds), np.concatenate(ious)
+
+def nms_from_pairs(candidates, firsts, seconds, ious, iou_threshold):
+    # Greedy NMS over every group at once, from overlap_pairs: returns a keep mask
+    # Each round keeps the boxes with no undecided box above them and drops what those suppress, so the
+    # rounds are bounded by the longest suppression chain, not by the number of boxes
+    undecided, kept, suppressed = 0, 1, 2
+    active = candidates[firsts] & candidates[seconds] & (ious > iou_threshold)
+    firsts, seconds = firsts[active], seconds[active]
+    state = np.where(candidates, undecided, suppressed).astype(np.int8)
+    while True:
+        pending = state == undecided
+        if not pending.any():
+            break
+        blocked = np.zeros(len(state), dtype=bool)
+        blocked[seconds[state[firsts] == undecided]] = True
+        state[pending & ~blocked] = kept
+        state[seconds[state[firsts] == kept]] = suppressed
+        live = state[seconds] == undecided
+        firsts, seconds = firsts[live], seconds[live]
+    return state == kept
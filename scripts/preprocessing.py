@@ -0,0 +1,152 @@
+import os
+import time
+import threading
+import cv2
+import numpy as np
+
+from streaming_upload import read_content
+
+
+ENCODE_FORMATS = ('jpg', 'png')
+DEFAULT_ENCODE_QUALITY = 90
+IMAGE_TYPES = {
+    'jpg': 'image/jpg',
+    'png': 'image/png'
+}
+
+
+class PreprocessOptions:
+    # Client-side downscale/re-encode settings applied before upload
+    def __init__(self, max_side=None, encode_format=None, encode_quality=DEFAULT_ENCODE_QUALITY, png_to_jpeg=False):
+        self.max_side = max_side
+        self.encode_format = encode_format
+        self.encode_quality = encode_quality
+        self.png_to_jpeg = png_to_jpeg
+
+    @property
+    def enabled(self):
+        return self.max_side is not None or self.encode_format is not None or self.png_to_jpeg
+
+    def signature(self):
+        # Distinguishes cached results computed from differently preprocessed uploads
+        if not self.enabled:
+            return ''
+        return f"max_side={self.max_side},format={self.encode_format},quality={self.encode_quality},png_to_jpeg={self.png_to_jpeg}"
+
+
+class PreprocessStats:
+    # Thread-safe byte and time counters for the end-of-run report
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.original_bytes = 0
+        self.sent_bytes = 0
+        self.preprocess_seconds = 0.0
+        self.upload_seconds = 0.0
+
+    def record(self, original_bytes, sent_bytes, preprocess_seconds=0.0, upload_seconds=0.0):
+        with self._lock:
+            self.images += 1
+            self.original_bytes += original_bytes
+            self.sent_bytes += sent_bytes
+            self.preprocess_seconds += preprocess_seconds
+            self.upload_seconds += upload_seconds
+
+    def summary(self):
+        if self.images == 0:
+            return "Preprocessing: no images uploaded"
+        saved_bytes = self.original_bytes - self.sent_bytes
+        saved_fraction = saved_bytes / self.original_bytes if self.original_bytes else 0.0
+        lines = [
+            f"Preprocessing: {self.images} images, "
+            f"{self.original_bytes / self.images / 1024:.1f} KiB -> {self.sent_bytes / self.images / 1024:.1f} KiB per image "
+            f"({saved_fraction:.1%} fewer bytes sent)"
+        ]
+        if saved_bytes > 0 and self.upload_seconds > 0:
+            # Treating all request time as upload time makes this an upper bound on the saving
+            seconds_per_byte = self.upload_seconds / self.sent_bytes
+            saved_seconds = saved_bytes * seconds_per_byte
+            lines.append(
+                f"Preprocessing: up to ~{saved_seconds:.1f}s of upload time saved "
+                f"for {self.preprocess_seconds:.1f}s spent resizing/re-encoding"
+            )
+        return "\n".join(lines)
+
+
+def encode_image(image, encode_format, encode_quality=DEFAULT_ENCODE_QUALITY):
+    if encode_format == 'jpg':
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(encode_quality)]
+    else:
+        params = [cv2.IMWRITE_PNG_COMPRESSION, 3]
+    success, encoded = cv2.imencode(f".{encode_format}", image, params)
+    if not success:
+        raise ValueError(f"Failed to encode image as {encode_format}")
+    return encoded.tobytes()
+
+def fit_max_side(image, max_side):
+    # Downscales so the long side is at most max_side pixels; smaller images are returned as is
+    height, width = image.shape[:2]
+    if max_side is None or max(height, width) <= max_side:
+        return image
+    ratio = max_side / max(height, width)
+    new_size = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+    return cv2.resize(image, new_size, interpolation=cv2.INTER_AREA)
+
+def encode_frame_data(frame, name, encode_format='jpg', encode_quality=DEFAULT_ENCODE_QUALITY, max_side=None):
+    # get_file_data for an in-memory frame: returns the files dict and the factors back to frame coordinates
+    height, width = frame.shape[:2]
+    image = fit_max_side(frame, max_side)
+    files = {
+        'data': (f"{name}.{encode_format}", encode_image(image, encode_format, encode_quality), IMAGE_TYPES[encode_format]),
+    }
+    return files, (width / image.shape[1], height / image.shape[0])
+
+def preprocess_file_data(file_data, options):
+    # Returns the files dict to upload and the (x, y) factors mapping uploaded pixel coordinates back to the original
+    if options is None or not options.enabled:
+        return file_data, (1.0, 1.0)
+    fp, data, image_type = file_data['data']
+    source_format = 'png' if image_type == 'image/png' else 'jpg'
+    target_format = options.encode_format or source_format
+    if options.png_to_jpeg and source_format == 'png':
+        target_format = 'jpg'
+
+    image = cv2.imdecode(np.frombuffer(read_content(data), dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"{fp} could not be decoded")
+    height, width = image.shape[:2]
+    image = fit_max_side(image, options.max_side)
+    resized = image.shape[:2] != (height, width)
+    if not resized and target_format == source_format and options.encode_format is None:
+        return file_data, (1.0, 1.0)
+
+    encoded = encode_image(image, target_format, options.encode_quality)
+    # Re-encoding alone can make an already compact file bigger; keep the original then
+    if not resized and len(encoded) >= len(data):
+        return file_data, (1.0, 1.0)
+    new_height, new_width = image.shape[:2]
+    if target_format != source_format:
+        fp = f"{os.path.splitext(fp)[0]}.{target_format}"
+    files = {
+        'data': (fp, encoded, IMAGE_TYPES[target_format]),
+    }
+    return files, (width / new_width, height / new_height)
+
+def rescale_detections(dets, factors):
+    # Maps tlbr boxes predicted on a resized upload back to original image coordinates
+    scale_x, scale_y = factors
+    if scale_x == 1.0 and scale_y == 1.0:
+        return dets
+    rescaled = []
+    for bbox in dets:
+        tlbr = bbox['tlbr']
+        rescaled.append({
+            **bbox,
+            'tlbr': [tlbr[0] * scale_x, tlbr[1] * scale_y, tlbr[2] * scale_x, tlbr[3] * scale_y]
+        })
+    return rescaled
+
+def timed_preprocess(file_data, options):
+    start = time.perf_counter()
+    upload_data, factors = preprocess_file_data(file_data, options)
+    return upload_data, factors, time.perf_counter() - start
@@ -0,0 +1,177 @@
+import os
+import sys
+import json
+import time
+import itertools
+import click
+import numpy as np
+
+parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_directory)
+from utils import get_file_data
+from nms import overlap_pairs, nms_from_pairs
+from annotation import AnnotationPipeline, ANNOTATION_FORMATS, DEFAULT_ANNOTATION_QUALITY, DEFAULT_ANNOTATION_WORKERS
+from video import split_frame_key
+from results_writer import iter_jsonl_results
+from columnar_results import ColumnarResults, COLUMNAR_EXTENSION
+from detection_on_collection import get_detector_body, config_thresholds
+
+
+def parse_grid(values):
+    return sorted({float(value) for value in values.split(',') if value.strip()}) if values else None
+
+
+class DetectionTable:
+    # Every stored detection of a results file as flat arrays, sorted by image and class, then by descending score,
+    # so a whole collection is re-thresholded and re-NMSed with a handful of array operations
+    def __init__(self, results):
+        self.keys = list(results)
+        dets = [det for key in self.keys for det in results[key]]
+        image_ids = np.repeat(np.arange(len(self.keys)), [len(results[key]) for key in self.keys])
+        self.class_names = sorted({det['class'] for det in dets})
+        class_index = {name: index for index, name in enumerate(self.class_names)}
+        class_ids = np.fromiter((class_index[det['class']] for det in dets), dtype=np.intp, count=len(dets))
+        scores = np.fromiter((det['score'] for det in dets), dtype=np.float64, count=len(dets))
+        boxes = np.asarray([det['tlbr'] for det in dets], dtype=np.float64).reshape(-1, 4)
+        groups = image_ids * max(1, len(self.class_names)) + class_ids
+        order = np.lexsort((-scores, groups))
+        self.dets = [dets[index] for index in order]
+        self.image_ids = image_ids[order]
+        self.class_ids = class_ids[order]
+        self.scores = scores[order]
+        self.boxes = boxes[order]
+        self.groups = groups[order]
+        self._pairs = None
+        self._pairs_min_iou = None
+
+    def __len__(self):
+        return len(self.dets)
+
+    def pairs(self, min_iou):
+        # Overlapping same-image, same-class pairs; computed once and reused by every NMS threshold at or above min_iou
+        if self._pairs is None or self._pairs_min_iou > min_iou:
+            self._pairs = overlap_pairs(self.boxes, self.groups, min_iou)
+            self._pairs_min_iou = min_iou
+        return self._pairs
+
+    def select(self, thresholds, nms_threshold):
+        # Keep mask for per-class score thresholds ({class: threshold}, or one threshold for every class) and NMS
+        if isinstance(thresholds, dict):
+            class_thresholds = np.asarray([thresholds.get(name, np.inf) for name in self.class_names])
+        else:
+            class_thresholds = np.full(len(self.class_names), thresholds)
+        candidates = self.scores >= class_thresholds[self.class_ids] if len(self) else np.zeros(0, dtype=bool)
+        return nms_from_pairs(candidates, *self.pairs(nms_threshold), nms_threshold)
+
+    def to_results(self, keep):
+        results = {key: [] for key in self.keys}
+        for index in np.flatnonzero(keep):
+            results[self.keys[self.image_ids[index]]].append(self.dets[index])
+        return results
+
+    def summarize(self, keep):
+        per_class = np.bincount(self.class_ids[keep], minlength=len(self.class_names))
+        return {
+            'detections': int(keep.sum()),
+            'images_with_detections': int(len(np.unique(self.image_ids[keep]))),
+            'per_class': {name: int(count) for name, count in zip(self.class_names, per_class)}
+        }
+
+
+def load_results(results_file):
+    if results_file.endswith(COLUMNAR_EXTENSION):
+        return dict(ColumnarResults(results_file).items())
+    # A results JSONL file can be re-evaluated while its run is still going
+    if results_file.endswith('.jsonl'):
+        results = {}
+        for key, result in iter_jsonl_results(results_file):
+            results.setdefault(key, result)
+        return results
+    with open(results_file) as f:
+        return json.load(f)
+
+def annotate_results(data_dir, results, annotation_dir, workers, output_format, quality):
+    # Redraws annotated images from the re-evaluated detections; video frames are skipped
+    annotator = AnnotationPipeline(annotation_dir, workers, output_format, quality)
+    skipped = 0
+    for key, dets in results.items():
+        if split_frame_key(key)[1] is not None:
+            skipped += 1
+            continue
+        file_data = get_file_data(os.path.join(data_dir, key))
+        annotator.submit(key, file_data['data'][1], dets)
+    annotator.close()
+    return skipped
+
+def print_sweep(rows, num_images):
+    header = f"{'threshold':>10}{'nms':>7}{'detections':>12}{'per image':>11}{'images':>9}"
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        threshold = 'config' if row['threshold'] is None else f"{row['threshold']:.3f}"
+        print(
+            f"{threshold:>10}{row['nms_threshold']:>7.2f}{row['detections']:>12}"
+            f"{row['detections'] / max(1, num_images):>11.2f}{row['images_with_detections']:>9}"
+        )
+
+
+@click.command()
+@click.option('-r', '--results-dir', default='results', help='Directory for Results')
+@click.option('-i', '--input-file', default=None, help='Stored Detections to Re-evaluate: .json, .jsonl or .col (defaults to detection_results.json in the results directory)')
+@click.option('-f', '--config-file-path', default='configs/detector.json', help='File Path for Detector Configuration')
+@click.option('-c', '--class-name', help='Class to Keep', multiple=True)
+@click.option('--thresholds', default=None, help='Comma-Separated Detection Thresholds to Sweep, Applied to Every Class (defaults to the config)')
+@click.option('--nms-thresholds', default=None, help='Comma-Separated NMS Thresholds to Sweep (defaults to the config)')
+@click.option('-o', '--output-file', default=None, help='File Path for the Re-evaluated Detections (defaults to detection_results_reevaluated.json in the results directory)')
+@click.option('--report-json', default=None, help='File Path to Write the Sweep Table as JSON')
+@click.option('-b', '--bounding-box-drawing', is_flag=True, default=False, help='Flag to redraw bounding boxes on images from the re-evaluated detections')
+@click.option('-d', '--data-dir', default='data', help='Directory for Input Data (for redrawing)')
+@click.option('--annotation-dir', default=None, help='Directory for Redrawn Images (defaults to reevaluated/ in the results directory)')
+@click.option('--annotation-workers', default=DEFAULT_ANNOTATION_WORKERS, type=click.IntRange(min=1), help='Number of Threads Drawing Bounding Boxes')
+@click.option('--annotation-format', default=None, type=click.Choice(ANNOTATION_FORMATS), help='Image Format for Annotated Images (defaults to the input format)')
+@click.option('--annotation-quality', default=DEFAULT_ANNOTATION_QUALITY, type=click.IntRange(1, 100), help='JPEG Quality for Annotated Images')
+def main(results_dir, input_file, config_file_path, class_name, thresholds, nms_thresholds, output_file, report_json, bounding_box_drawing, data_dir, annotation_dir, annotation_workers, annotation_format, annotation_quality):
+    class_thresholds, config_nms_threshold = config_thresholds(get_detector_body(config_file_path, class_name))
+    threshold_grid = parse_grid(thresholds) or [class_thresholds]
+    nms_grid = parse_grid(nms_thresholds) or [config_nms_threshold]
+
+    start = time.perf_counter()
+    results = load_results(input_file or os.path.join(results_dir, 'detection_results.json'))
+    # Only classes in the config (or given with -c) are kept
+    results = {key: [det for det in dets if det['class'] in class_thresholds] for key, dets in results.items()}
+    table = DetectionTable(results)
+    print(f"Loaded {len(table)} detections on {len(table.keys)} images in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    table.pairs(min(nms_grid))
+    rows = []
+    for threshold, nms_threshold in itertools.product(threshold_grid, nms_grid):
+        keep = table.select(threshold, nms_threshold)
+        rows.append({
+            # None stands for the config's per-class thresholds
+            'threshold': None if isinstance(threshold, dict) else threshold,
+            'nms_threshold': nms_threshold,
+            **table.summarize(keep)
+        })
+    elapsed = time.perf_counter() - start
+    print_sweep(rows, len(table.keys))
+    print(f"Re-evaluated {len(rows)} threshold combinations in {elapsed:.2f}s")
+    if report_json is not None:
+        with open(report_json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+    if len(rows) == 1:
+        reevaluated = table.to_results(keep)
+        output_file = output_file or os.path.join(results_dir, 'detection_results_reevaluated.json')
+        with open(output_file, 'w') as f:
+            json.dump(reevaluated, f)
+        print(f"Wrote {output_file}")
+        if bounding_box_drawing:
+            annotation_dir = annotation_dir or os.path.join(results_dir, 'reevaluated')
+            skipped = annotate_results(data_dir, reevaluated, annotation_dir, annotation_workers, annotation_format, annotation_quality)
+            print(f"Redrew {len(reevaluated) - skipped} annotated images in {annotation_dir}" + (f" ({skipped} video frames skipped)" if skipped else ''))
+    elif bounding_box_drawing:
+        print("Pass a single --thresholds and --nms-thresholds value to write results and redraw images")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import os
+import json
+import threading
+
+
+DEFAULT_FLUSH_EVERY = 100
+
+
+def load_completed_keys(jsonl_path):
+    # Returns the keys already recorded in a results JSONL file
+    # A partially written last line (from a crash mid-flush) is truncated away so appends stay valid
+    completed_keys = set()
+    if not os.path.exists(jsonl_path):
+        return completed_keys
+    valid_bytes = 0
+    with open(jsonl_path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            completed_keys.add(record['key'])
+            valid_bytes += len(line)
+    if valid_bytes < os.path.getsize(jsonl_path):
+        with open(jsonl_path, 'r+b') as f:
+            f.truncate(valid_bytes)
+    return completed_keys
+
+def iter_jsonl_results(jsonl_path):
+    # Yields (key, result) pairs one line at a time
+    with open(jsonl_path) as f:
+        for line in f:
+            record = json.loads(line)
+            yield record['key'], record['result']
+
+def iter_json_results(json_path, chunk_size=1 << 20):
+    # Yields (key, result) pairs from a {key: result} JSON file without loading it all, reading chunk_size characters at a time
+    decoder = json.JSONDecoder()
+    with open(json_path) as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith('{'):
+            raise ValueError(f"{json_path} is not a JSON object")
+        position = 1
+        eof = False
+        while True:
+            # Skip separators; decode the next member once it is entirely in the buffer
+            while position < len(buffer) and buffer[position] in ' \t\r\n,:':
+                position += 1
+            if position < len(buffer) and buffer[position] == '}':
+                return
+            try:
+                key, end = decoder.raw_decode(buffer, position)
+                while end < len(buffer) and buffer[end] in ' \t\r\n:':
+                    end += 1
+                result, end = decoder.raw_decode(buffer, end)
+                # A number at the very end of the buffer may continue in the next chunk
+                if end >= len(buffer) and not eof:
+                    raise ValueError("Member may be truncated")
+            except ValueError:
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield key, result
+            position = end
+
+def iter_results(results_path):
+    # (key, result) pairs from either a results JSONL log or a compacted JSON file
+    if results_path.endswith('.jsonl'):
+        return iter_jsonl_results(results_path)
+    return iter_json_results(results_path)
+
+def compact_jsonl_to_json(jsonl_path, json_path):
+    # Streams a results JSONL file into the classic {key: result} JSON file without loading it into memory
+    # If a key was recorded more than once, its first result wins
+    seen_keys = set()
+    tmp_path = f"{json_path}.tmp"
+    with open(tmp_path, 'w') as out:
+        out.write('{')
+        for key, result in iter_jsonl_results(jsonl_path):
+            if key in seen_keys:
+                continue
+            if seen_keys:
+                out.write(', ')
+            seen_keys.add(key)
+            out.write(f"{json.dumps(key)}: {json.dumps(result)}")
+        out.write('}')
+    os.replace(tmp_path, json_path)
+    return len(seen_keys)
+
+
+class JsonlResultsWriter:
+    # Append-only results log, flushed to disk every `flush_every` records
+    def __init__(self, jsonl_path, flush_every=DEFAULT_FLUSH_EVERY, resume=False):
+        self.jsonl_path = jsonl_path
+        self.flush_every = max(1, flush_every)
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._file = open(jsonl_path, 'a' if resume else 'w')
+
+    def write(self, key, result):
+        line = json.dumps({'key': key, 'result': result}) + '\n'
+        with self._lock:
+            self._buffer.append(line)
+            if len(self._buffer) >= self.flush_every:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        self._file.write(''.join(self._buffer))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._buffer = []
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # Flush whatever finished before an error so a resumed run can skip it
+        self.close()
+
+
+def open_results_writer(results_dir, results_name, flush_every=DEFAULT_FLUSH_EVERY, resume=False):
+    # Returns the writer and the keys a resumed run can skip
+    jsonl_path = f"{results_dir}/{results_name}.jsonl"
+    completed_keys = load_completed_keys(jsonl_path) if resume else set()
+    return JsonlResultsWriter(jsonl_path, flush_every, resume), completed_keys
@@ -1,13 +1,12 @@
 import os
-import requests
 import time
 from copy import deepcopy
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from utils import get_directai_access_token
-from scripts.rtsp_rebroadcast import stop_rtsp_inference, record_annotated_stream_via_hls, DIRECTAI_BASE_URL, DIRECTAI_STREAM_URL, DIRECTAI_CLIENT_ID, DIRECTAI_CLIENT_SECRET, HLS_OUTPUT_DIR
+from directai_client import DirectAIClient
+from scripts.rtsp_rebroadcast import stop_rtsp_inference, record_annotated_stream_via_hls, stop_recorder, wait_for_interrupt, DIRECTAI_BASE_URL, DIRECTAI_STREAM_URL, DIRECTAI_CLIENT_ID, DIRECTAI_CLIENT_SECRET, HLS_OUTPUT_DIR
 from scripts.classification_on_collection import deploy_classifier
 
 
@@ -53,35 +52,43 @@ STREAMING_CLASSIFIER_CONFIG = {
 }
 
 
-def start_rtsp_inference(access_token):
-    headers = {
-        'Authorization': f"Bearer {access_token}"
-    }
-    classifier_id = deploy_classifier(CLASSIFIER_CONFIG, access_token)
-    streaming_classifier_config = deepcopy(STREAMING_CLASSIFIER_CONFIG)
-    streaming_classifier_config["deployed_id"] = classifier_id
-    response = requests.post(
-        f"{DIRECTAI_BASE_URL}/run_classifier_on_url_stream",
-        headers=headers,
+class StreamStartError(ValueError):
+    # A rejected /run_classifier_on_url_stream call, with the status code so callers can tell a dropped deployed_id apart
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def start_classifier_on_stream(client, deployed_id, streaming_classifier_config):
+    streaming_classifier_config = deepcopy(streaming_classifier_config)
+    streaming_classifier_config["deployed_id"] = deployed_id
+    response = client.post(
+        "/run_classifier_on_url_stream",
         json=streaming_classifier_config
     )
-    response_json = response.json()
-    tracker_instance_id = response_json["tracker_instance_id"]
+    if response.status_code != 200:
+        raise StreamStartError(response.json()['message'], response.status_code)
+    return response.json()["tracker_instance_id"]
+
+def start_rtsp_inference(client):
+    classifier_id = deploy_classifier(client, CLASSIFIER_CONFIG)
+    tracker_instance_id = start_classifier_on_stream(client, classifier_id, STREAMING_CLASSIFIER_CONFIG)
     print(f"View stream here: {DIRECTAI_STREAM_URL}/{tracker_instance_id}")
     return tracker_instance_id
 
 
 if __name__ == '__main__':
-    access_token = get_directai_access_token(DIRECTAI_CLIENT_ID, DIRECTAI_CLIENT_SECRET)
-    tracker_instance_id = start_rtsp_inference(access_token)
+    client = DirectAIClient(DIRECTAI_BASE_URL, DIRECTAI_CLIENT_ID, DIRECTAI_CLIENT_SECRET)
+    tracker_instance_id = start_rtsp_inference(client)
     
+    recorder = None
     if HLS_OUTPUT_DIR is not None:
         # wait for the stream to start
         print("Waiting 10 seconds for stream to start so we can record it...")
         time.sleep(10)
         try:
             print("Recording stream...")
-            record_annotated_stream_via_hls(f"{DIRECTAI_STREAM_URL}/{tracker_instance_id}", HLS_OUTPUT_DIR)
+            recorder = record_annotated_stream_via_hls(f"{DIRECTAI_STREAM_URL}/{tracker_instance_id}", HLS_OUTPUT_DIR)
         except Exception as e:
             print(f"Error recording stream: {e}")
     else:
@@ -89,9 +96,10 @@ if __name__ == '__main__':
         
     try:
         print("Press CTRL-C to stop stream.")
-        while True:
-            pass
+        wait_for_interrupt()
     except KeyboardInterrupt:
-        response = stop_rtsp_inference(access_token,tracker_instance_id)
+        if recorder is not None:
+            stop_recorder(recorder)
+        response = stop_rtsp_inference(client, tracker_instance_id)
         if "OK" in response["message"]:
             print("Stream inference stopped successfully.")
\ No newline at end of file
@@ -0,0 +1,357 @@
+import os
+import sys
+import time
+import threading
+import click
+import cv2
+
+from dotenv import load_dotenv
+
+parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_directory)
+from utils import display_bounding_boxes
+from directai_client import DirectAIClient, DEFAULT_POOL_SIZE
+from deployment_registry import Deployment, open_deployment_registry, post_to_deployments
+from preprocessing import encode_frame_data, encode_image, rescale_detections, ENCODE_FORMATS, DEFAULT_ENCODE_QUALITY
+from results_writer import JsonlResultsWriter, load_completed_keys
+from scheduler import RequestScheduler, DEFAULT_MAX_RETRIES
+from inference_cache import DEFAULT_CACHE_DIR
+from classification_on_collection import get_classifier_body, deploy_classifier
+from detection_on_collection import get_detector_body, deploy_detector
+
+
+load_dotenv()
+DIRECTAI_CLIENT_ID = os.getenv("DIRECTAI_CLIENT_ID")
+DIRECTAI_CLIENT_SECRET = os.getenv("DIRECTAI_CLIENT_SECRET")
+
+LIVE_SOURCE_PREFIXES = ('rtsp://', 'rtsps://', 'rtmp://', 'http://', 'https://', 'udp://', 'tcp://')
+DEFAULT_MAX_RATE = 1.0
+DEFAULT_CHANGE_THRESHOLD = 0.005
+DEFAULT_PIXEL_THRESHOLD = 15
+DEFAULT_COMPARE_WIDTH = 96
+DEFAULT_HEARTBEAT = 60.0
+RECONNECT_DELAY = 2.0
+RECONNECT_DELAY_MAX = 30.0
+
+
+def change_signature(frame, compare_width=DEFAULT_COMPARE_WIDTH):
+    # Small blurred grayscale thumbnail; downsampling averages away sensor noise and compression artifacts
+    height, width = frame.shape[:2]
+    size = (compare_width, max(1, round(height * compare_width / width)))
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    return cv2.GaussianBlur(cv2.resize(gray, size, interpolation=cv2.INTER_AREA), (3, 3), 0)
+
+def frame_change(signature, reference, pixel_threshold=DEFAULT_PIXEL_THRESHOLD):
+    # Fraction of thumbnail pixels that moved by more than pixel_threshold gray levels
+    # A car pulling into one space changes few pixels a lot, which a mean difference would wash out
+    if reference is None or reference.shape != signature.shape:
+        return 1.0
+    return float((cv2.absdiff(signature, reference) > pixel_threshold).mean())
+
+def parse_stream(value, index):
+    # "name=url" or just "url"
+    name, separator, url = value.partition('=')
+    if separator and '://' not in name and '/' not in name:
+        return name, url
+    return f"stream_{index}", value
+
+
+class FrameGrabber(threading.Thread):
+    # Decodes on a dedicated thread and keeps only the newest frame, so a slow consumer never falls behind live
+    # Live sources reconnect with backoff; files are paced at their native frame rate and end at EOF
+    def __init__(self, source):
+        super().__init__(daemon=True)
+        self.source = source
+        self.live = source.startswith(LIVE_SOURCE_PREFIXES)
+        self.decoded = 0
+        self.reconnects = 0
+        self.finished = False
+        self._frame = None
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        delay = RECONNECT_DELAY
+        try:
+            while not self._stop_event.is_set():
+                capture = cv2.VideoCapture(self.source)
+                if capture.isOpened():
+                    # Keep the driver from buffering stale frames behind the one we want
+                    capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+                    if self._read_frames(capture):
+                        delay = RECONNECT_DELAY
+                capture.release()
+                if not self.live or self._stop_event.wait(delay):
+                    break
+                self.reconnects += 1
+                delay = min(RECONNECT_DELAY_MAX, delay * 2)
+        finally:
+            with self._condition:
+                self.finished = True
+                self._condition.notify_all()
+
+    def _read_frames(self, capture):
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        interval = 1.0 / fps if not self.live and fps and fps > 0 else 0.0
+        start = time.monotonic()
+        read_any = False
+        frames = 0
+        while not self._stop_event.is_set():
+            ok, frame = capture.read()
+            if not ok:
+                break
+            read_any = True
+            if interval:
+                delay = start + frames * interval - time.monotonic()
+                if delay > 0:
+                    self._stop_event.wait(delay)
+            frames += 1
+            with self._condition:
+                self.decoded += 1
+                self._frame = (self.decoded, time.time(), frame)
+                self._condition.notify_all()
+        return read_any
+
+    def latest(self, after_index, timeout):
+        # Newest frame decoded after after_index, or None on timeout / once the source is exhausted
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.finished or (self._frame is not None and self._frame[0] > after_index),
+                timeout
+            )
+            if self._frame is not None and self._frame[0] > after_index:
+                return self._frame
+            return None
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class SamplerStats:
+    def __init__(self):
+        self.examined = 0
+        self.rate_capped = 0
+        self.unchanged = 0
+        self.submitted = 0
+        self.failed = 0
+
+    def summary(self, name, grabber):
+        reduction = grabber.decoded / self.submitted if self.submitted else float('inf')
+        return (
+            f"{name}: {grabber.decoded} frames decoded, {self.examined} examined, {self.rate_capped} over the rate cap, "
+            f"{self.unchanged} unchanged, {self.submitted} submitted ({reduction:.1f}x fewer calls than every frame), "
+            f"{self.failed} failed, {grabber.reconnects} reconnects"
+        )
+
+
+def last_frame_index(jsonl_path, name):
+    # Highest <name>#<index> key already recorded (0 if none); also trims a line torn by a crash before appending
+    prefix = f"{name}#"
+    indexes = [
+        int(key[len(prefix):])
+        for key in load_completed_keys(jsonl_path)
+        if key.startswith(prefix) and key[len(prefix):].isdigit()
+    ]
+    return max(indexes, default=0)
+
+
+class StreamSampler(threading.Thread):
+    # Submits a stream's frames to /classify or /detect only when they changed, at most max_rate times per second
+    def __init__(
+        self,
+        name,
+        grabber,
+        client,
+        deployment,
+        mode,
+        writer,
+        max_rate=DEFAULT_MAX_RATE,
+        change_threshold=DEFAULT_CHANGE_THRESHOLD,
+        pixel_threshold=DEFAULT_PIXEL_THRESHOLD,
+        heartbeat=DEFAULT_HEARTBEAT,
+        max_side=None,
+        encode_format='jpg',
+        encode_quality=DEFAULT_ENCODE_QUALITY,
+        annotated_dir=None,
+        first_index=0
+    ):
+        super().__init__(daemon=True)
+        self.name = name
+        self.grabber = grabber
+        self.client = client
+        self.deployment = deployment
+        self.mode = mode
+        self.writer = writer
+        self.min_interval = 1.0 / max_rate
+        self.change_threshold = change_threshold
+        self.pixel_threshold = pixel_threshold
+        self.heartbeat = heartbeat
+        self.max_side = max_side
+        self.encode_format = encode_format
+        self.encode_quality = encode_quality
+        self.annotated_dir = annotated_dir
+        # Added to the grabber's frame index, so keys keep counting up across restarts
+        self.first_index = first_index
+        self.stats = SamplerStats()
+        self.error = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        last_index = 0
+        reference = None
+        last_submit = None
+        while not self._stop_event.is_set():
+            item = self.grabber.latest(last_index, timeout=0.5)
+            if item is None:
+                if self.grabber.finished:
+                    break
+                continue
+            index, timestamp, frame = item
+            last_index = index
+            self.stats.examined += 1
+            now = time.monotonic()
+            # The rate cap is checked first: it is cheaper than comparing frames
+            if last_submit is not None and now - last_submit < self.min_interval:
+                self.stats.rate_capped += 1
+                continue
+            signature = change_signature(frame)
+            change = frame_change(signature, reference, self.pixel_threshold)
+            heartbeat_due = last_submit is None or (self.heartbeat and now - last_submit >= self.heartbeat)
+            if change < self.change_threshold and not heartbeat_due:
+                self.stats.unchanged += 1
+                continue
+            last_submit = now
+            try:
+                self.submit(index, timestamp, frame, change)
+            except Exception as e:
+                self.stats.failed += 1
+                self.error = e
+                print(f"{self.name}: frame {index} failed: {e}", flush=True)
+                continue
+            # Later frames are compared against what was last sent, so slow drift still triggers eventually
+            reference = signature
+            self.stats.submitted += 1
+
+    def submit(self, index, timestamp, frame, change):
+        index += self.first_index
+        upload_data, factors = encode_frame_data(
+            frame, f"{self.name}_{index:08d}", self.encode_format, self.encode_quality, self.max_side
+        )
+        _, response = post_to_deployments(
+            self.client,
+            f"/{self.mode}",
+            [self.deployment],
+            lambda deployed_ids: {'deployed_id': deployed_ids[0]},
+            files=upload_data
+        )
+        if response.status_code != 200:
+            raise ValueError(response.json())
+        record = {'timestamp': timestamp, 'frame_index': index, 'change': change}
+        if self.mode == 'classify':
+            record.update(response.json())
+        else:
+            # Boxes come back in the uploaded frame's coordinates
+            record['dets'] = rescale_detections(response.json()[0], factors)
+            if self.annotated_dir is not None:
+                annotated = display_bounding_boxes(frame.copy(), record['dets'])
+                with open(os.path.join(self.annotated_dir, f"frame_{index:08d}.jpg"), 'wb') as f:
+                    f.write(encode_image(annotated, 'jpg', self.encode_quality))
+        self.writer.write(f"{self.name}#{index}", record)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+@click.command()
+@click.option('-h', '--host', default='https://api.alpha.directai.io', help='DirectAI Host')
+@click.option('-u', '--stream-url', multiple=True, required=True, help='Stream URL or Video File, optionally as name=url; repeat as necessary')
+@click.option('-m', '--mode', default='classify', type=click.Choice(['classify', 'detect']), help='Endpoint Frames are Sent To')
+@click.option('-r', '--results-dir', default='results', help='Directory for Results')
+@click.option('-f', '--config-file-path', default=None, help='File Path for Classifier/Detector Configuration (defaults to configs/classifier.json or configs/detector.json)')
+@click.option('-c', '--class-name', help='Class to Predict', multiple=True)
+@click.option('-b', '--bounding-box-drawing', is_flag=True, default=False, help='Flag to save annotated frames (detect mode)')
+@click.option('--max-rate', default=DEFAULT_MAX_RATE, type=click.FloatRange(min=0, min_open=True), help='Maximum Frames Submitted per Second per Stream')
+@click.option('--change-threshold', default=DEFAULT_CHANGE_THRESHOLD, type=click.FloatRange(0, 1), help='Fraction of Downsampled Pixels that Must Change Before a Frame is Submitted')
+@click.option('--pixel-threshold', default=DEFAULT_PIXEL_THRESHOLD, type=click.IntRange(0, 255), help='Gray-Level Difference that Counts as a Changed Pixel')
+@click.option('--heartbeat', default=DEFAULT_HEARTBEAT, type=click.FloatRange(min=0), help='Submit at Least One Frame Every This Many Seconds (0 to disable)')
+@click.option('--max-side', default=None, type=click.IntRange(min=1), help='Downscale frames so their long side is at most this many pixels before upload')
+@click.option('--encode-format', default='jpg', type=click.Choice(ENCODE_FORMATS), help='Format Frames are Encoded in for Upload')
+@click.option('--encode-quality', default=DEFAULT_ENCODE_QUALITY, type=click.IntRange(1, 100), help='JPEG Quality for Uploaded Frames')
+@click.option('--duration', default=None, type=click.FloatRange(min=0, min_open=True), help='Stop After This Many Seconds')
+@click.option('--pool-size', default=DEFAULT_POOL_SIZE, type=click.IntRange(min=1), help='Maximum Number of Keep-Alive Connections')
+@click.option('--cache-dir', default=DEFAULT_CACHE_DIR, help='Directory for the Deployment Registry')
+@click.option('--redeploy', is_flag=True, default=False, help='Flag to deploy configs fresh instead of reusing registered deployment IDs')
+@click.option('--max-retries', default=DEFAULT_MAX_RETRIES, type=click.IntRange(min=0), help='Retries per Request on 429/5xx/Connection Errors')
+def main(host, stream_url, mode, results_dir, config_file_path, class_name, bounding_box_drawing, max_rate, change_threshold, pixel_threshold, heartbeat, max_side, encode_format, encode_quality, duration, pool_size, cache_dir, redeploy, max_retries):
+    streams = [parse_stream(value, index) for index, value in enumerate(stream_url)]
+    # One request in flight per stream at most
+    scheduler = RequestScheduler(max_concurrency=len(streams), max_retries=max_retries)
+    client = DirectAIClient(
+        host,
+        client_id=DIRECTAI_CLIENT_ID,
+        client_secret=DIRECTAI_CLIENT_SECRET,
+        pool_size=max(pool_size, len(streams)),
+        scheduler=scheduler
+    )
+    client.get_access_token()
+
+    if mode == 'classify':
+        body = get_classifier_body(config_file_path or 'configs/classifier.json', class_name)
+        deployment = Deployment(client, 'classifier', body, deploy_classifier, registry=open_deployment_registry(cache_dir), reuse=not redeploy)
+    else:
+        body = get_detector_body(config_file_path or 'configs/detector.json', class_name)
+        deployment = Deployment(client, 'detector', body, deploy_detector, registry=open_deployment_registry(cache_dir), reuse=not redeploy)
+    deployment.ensure()
+
+    if not os.path.exists(results_dir):
+        os.makedirs(results_dir)
+    samplers = []
+    for name, url in streams:
+        annotated_dir = None
+        if bounding_box_drawing and mode == 'detect':
+            annotated_dir = os.path.join(results_dir, name)
+            os.makedirs(annotated_dir, exist_ok=True)
+        # Appends, so restarting a stream keeps its history; flushed per result since frames trickle in
+        # Numbering continues after the last recorded frame, so a restart never reuses a key or an annotated frame's name
+        jsonl_path = f"{results_dir}/{name}_stream_results.jsonl"
+        first_index = last_frame_index(jsonl_path, name)
+        writer = JsonlResultsWriter(jsonl_path, flush_every=1, resume=True)
+        samplers.append(StreamSampler(
+            name, FrameGrabber(url), client, deployment, mode, writer,
+            max_rate=max_rate,
+            change_threshold=change_threshold,
+            pixel_threshold=pixel_threshold,
+            heartbeat=heartbeat,
+            max_side=max_side,
+            encode_format=encode_format,
+            encode_quality=encode_quality,
+            annotated_dir=annotated_dir,
+            first_index=first_index
+        ))
+    for sampler in samplers:
+        sampler.grabber.start()
+        sampler.start()
+
+    deadline = time.monotonic() + duration if duration is not None else None
+    try:
+        print("Sampling streams. Press CTRL-C to stop.", flush=True)
+        while any(sampler.is_alive() for sampler in samplers):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for sampler in samplers:
+            sampler.stop()
+            sampler.grabber.stop()
+        for sampler in samplers:
+            sampler.join()
+            sampler.writer.close()
+        for sampler in samplers:
+            print(sampler.stats.summary(sampler.name, sampler.grabber))
+        print(scheduler.summary())
+        client.close()
+
+if __name__ == '__main__':
+    main()
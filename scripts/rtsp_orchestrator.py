@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import subprocess
+import click
+
+parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_directory)
+from directai_client import DirectAIClient, DEFAULT_POOL_SIZE
+from deployment_registry import Deployment, open_deployment_registry, REJECTED_DEPLOYMENT_STATUS_CODES
+from scheduler import RequestScheduler, DEFAULT_MAX_RETRIES
+from inference_cache import DEFAULT_CACHE_DIR
+from classification_on_collection import get_classifier_body, deploy_classifier
+from rtsp_rebroadcast import (
+    start_tracker_on_stream, stop_rtsp_inference, prep_hls_output_dir, hls_command, RECORDER_STOP_TIMEOUT,
+    DIRECTAI_BASE_URL, DIRECTAI_STREAM_URL, DIRECTAI_CLIENT_ID, DIRECTAI_CLIENT_SECRET
+)
+from rtsp_classifier import start_classifier_on_stream, StreamStartError
+
+
+STREAM_TYPES = ('tracker', 'classifier')
+DEFAULT_RECORD_DELAY = 10.0
+RESTART_BACKOFF_BASE = 1.0
+RESTART_BACKOFF_MAX = 60.0
+# A recorder that ran at least this long resets the restart backoff
+RECORDER_STABLE_SECONDS = 60.0
+STATE_FILE_NAME = 'running_streams.json'
+
+
+def load_stream_specs(config_file_path):
+    # {"streams": [{"name", "type", "stream_url", "webhook_url", ...}, ...]}; see configs/streams.json
+    with open(config_file_path) as f:
+        specs = json.load(f)['streams']
+    names = set()
+    for spec in specs:
+        if spec.get('type', 'tracker') not in STREAM_TYPES:
+            raise ValueError(f"Stream {spec.get('name')} has unknown type {spec.get('type')}")
+        if 'name' not in spec or spec['name'] in names:
+            raise ValueError("Every stream needs a unique name")
+        names.add(spec['name'])
+    return specs
+
+def load_running_streams(state_path):
+    if not os.path.exists(state_path):
+        return {}
+    with open(state_path) as f:
+        return json.load(f)
+
+def save_running_streams(state_path, running):
+    # Lets the next run stop streams an orchestrator that was killed outright left behind
+    os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(running, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+async def wait_or_stop(stop_event, timeout):
+    # Sleeps for timeout seconds; returns True early if shutdown was requested
+    try:
+        await asyncio.wait_for(stop_event.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+async def terminate_recorder(process):
+    # SIGINT lets ffmpeg write out the last segment and playlist before exiting
+    if process.returncode is not None:
+        return
+    process.send_signal(signal.SIGINT)
+    try:
+        await asyncio.wait_for(process.wait(), RECORDER_STOP_TIMEOUT)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+class StreamSupervisor:
+    # Starts one stream's inference, keeps its HLS recorder running and stops both on shutdown
+    def __init__(self, client, spec, registry, redeploy=False, record_delay=DEFAULT_RECORD_DELAY):
+        self.client = client
+        self.spec = spec
+        self.name = spec['name']
+        self.registry = registry
+        self.redeploy = redeploy
+        self.record_delay = record_delay
+        self.tracker_instance_id = None
+        self.recorder_restarts = 0
+
+    def log(self, message):
+        print(f"[{self.name}] {message}", flush=True)
+
+    def _start_inference(self):
+        if self.spec.get('type', 'tracker') == 'tracker':
+            tracker_config = {
+                'stream_url': self.spec['stream_url'],
+                'webhook_url': self.spec['webhook_url'],
+                'tracker_config': self.spec['tracker_config']
+            }
+            return start_tracker_on_stream(self.client, tracker_config)
+        # Classifier streams deploy (or reuse) their classifier first
+        body = self.spec.get('classifier_config') or get_classifier_body(self.spec['config_file_path'])
+        deployment = Deployment(
+            self.client, 'classifier', body, deploy_classifier,
+            registry=self.registry,
+            reuse=not self.redeploy
+        )
+        streaming_classifier_config = {
+            'stream_url': self.spec['stream_url'],
+            'webhook_url': self.spec['webhook_url'],
+            'rebroadcast_annotations': self.spec.get('rebroadcast_annotations', 'True')
+        }
+        deployed_id = deployment.ensure()
+        try:
+            return start_classifier_on_stream(self.client, deployed_id, streaming_classifier_config)
+        except StreamStartError as e:
+            # A registered ID the server has since dropped: deploy fresh once and retry
+            # Any other failure (bad stream_url, auth, 5xx) is raised as is and leaves the registry alone
+            if deployment.fresh or e.status_code not in REJECTED_DEPLOYMENT_STATUS_CODES:
+                raise
+            return start_classifier_on_stream(self.client, deployment.redeploy(deployed_id), streaming_classifier_config)
+
+    async def start(self):
+        self.tracker_instance_id = await asyncio.to_thread(self._start_inference)
+        self.log(f"started; view stream here: {DIRECTAI_STREAM_URL}/{self.tracker_instance_id}")
+        return self.tracker_instance_id
+
+    async def record(self, stop_event):
+        # Restarts ffmpeg with exponential backoff whenever it exits, until shutdown
+        hls_output_dir = self.spec.get('hls_output_dir')
+        if hls_output_dir is None:
+            return
+        self.log(f"waiting {self.record_delay:.0f}s for the stream to start before recording")
+        if await wait_or_stop(stop_event, self.record_delay):
+            return
+        await asyncio.to_thread(prep_hls_output_dir, hls_output_dir)
+        rtsp_url = f"{DIRECTAI_STREAM_URL}/{self.tracker_instance_id}"
+        backoff = RESTART_BACKOFF_BASE
+        attempt = 0
+        while not stop_event.is_set():
+            started = time.monotonic()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *hls_command(rtsp_url, hls_output_dir, f"segment_{attempt:03d}", append=attempt > 0),
+                    stdin=subprocess.DEVNULL
+                )
+            except FileNotFoundError:
+                self.log("ffmpeg not found; not recording")
+                return
+            self.log(f"recording to {hls_output_dir}" + (f" (restart {attempt})" if attempt else ''))
+            exited = asyncio.create_task(process.wait())
+            stopping = asyncio.create_task(stop_event.wait())
+            await asyncio.wait({exited, stopping}, return_when=asyncio.FIRST_COMPLETED)
+            if stop_event.is_set():
+                exited.cancel()
+                await terminate_recorder(process)
+                return
+            stopping.cancel()
+            if time.monotonic() - started >= RECORDER_STABLE_SECONDS:
+                backoff = RESTART_BACKOFF_BASE
+            self.log(f"recorder exited with code {process.returncode}; restarting in {backoff:.0f}s")
+            if await wait_or_stop(stop_event, backoff):
+                return
+            backoff = min(RESTART_BACKOFF_MAX, backoff * 2)
+            attempt += 1
+            self.recorder_restarts += 1
+
+    async def stop(self):
+        if self.tracker_instance_id is None:
+            return
+        try:
+            response = await asyncio.to_thread(stop_rtsp_inference, self.client, self.tracker_instance_id)
+            self.log(f"stopped: {response.get('message')}")
+        except Exception as e:
+            self.log(f"failed to stop {self.tracker_instance_id}: {e}")
+
+
+async def stop_leftover_streams(client, running):
+    async def stop_one(name, tracker_instance_id):
+        try:
+            await asyncio.to_thread(stop_rtsp_inference, client, tracker_instance_id)
+            print(f"[{name}] stopped stream {tracker_instance_id} left running by a previous run", flush=True)
+        except Exception as e:
+            print(f"[{name}] could not stop leftover stream {tracker_instance_id}: {e}", flush=True)
+    await asyncio.gather(*(stop_one(name, tracker_instance_id) for name, tracker_instance_id in running.items()))
+
+async def orchestrate(client, specs, registry, state_path, redeploy, record_delay):
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop_event.set)
+
+    leftovers = load_running_streams(state_path)
+    if leftovers:
+        await stop_leftover_streams(client, leftovers)
+    save_running_streams(state_path, {})
+
+    supervisors = [StreamSupervisor(client, spec, registry, redeploy, record_delay) for spec in specs]
+    started = await asyncio.gather(*(supervisor.start() for supervisor in supervisors), return_exceptions=True)
+    running = []
+    for supervisor, result in zip(supervisors, started):
+        if isinstance(result, Exception):
+            supervisor.log(f"failed to start: {result}")
+        else:
+            running.append(supervisor)
+    save_running_streams(state_path, {supervisor.name: supervisor.tracker_instance_id for supervisor in running})
+
+    try:
+        if running:
+            print(f"{len(running)}/{len(supervisors)} streams running. Press CTRL-C to stop.", flush=True)
+            # Idles on the event loop; recorders only wake it when ffmpeg exits
+            recorders = [asyncio.create_task(supervisor.record(stop_event)) for supervisor in running]
+            await stop_event.wait()
+            await asyncio.gather(*recorders, return_exceptions=True)
+    finally:
+        print("Stopping streams...", flush=True)
+        await asyncio.gather(*(supervisor.stop() for supervisor in running))
+        save_running_streams(state_path, {})
+
+
+@click.command()
+@click.option('-h', '--host', default=DIRECTAI_BASE_URL, help='DirectAI Host')
+@click.option('-f', '--config-file-path', default='configs/streams.json', help='File Path for the Stream Configuration')
+@click.option('--record-delay', default=DEFAULT_RECORD_DELAY, type=click.FloatRange(min=0), help='Seconds to Wait for a Stream to Start Before Recording It')
+@click.option('--cache-dir', default=DEFAULT_CACHE_DIR, help='Directory for the Deployment Registry and Running-Stream State')
+@click.option('--redeploy', is_flag=True, default=False, help='Flag to deploy classifier configs fresh instead of reusing registered deployment IDs')
+@click.option('--max-retries', default=DEFAULT_MAX_RETRIES, type=click.IntRange(min=0), help='Retries per Request on 429/5xx/Connection Errors')
+def main(host, config_file_path, record_delay, cache_dir, redeploy, max_retries):
+    specs = load_stream_specs(config_file_path)
+    scheduler = RequestScheduler(max_concurrency=DEFAULT_POOL_SIZE, max_retries=max_retries)
+    client = DirectAIClient(
+        host,
+        client_id=DIRECTAI_CLIENT_ID,
+        client_secret=DIRECTAI_CLIENT_SECRET,
+        scheduler=scheduler
+    )
+    client.get_access_token()
+    try:
+        asyncio.run(orchestrate(
+            client,
+            specs,
+            open_deployment_registry(cache_dir),
+            os.path.join(cache_dir, STATE_FILE_NAME),
+            redeploy,
+            record_delay
+        ))
+    finally:
+        client.close()
+
+if __name__ == '__main__':
+    main()
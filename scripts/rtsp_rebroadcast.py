@@ -1,11 +1,12 @@
 import os
-import requests
 import time
+import signal
+import subprocess
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from utils import get_directai_access_token
+from directai_client import DirectAIClient
 
 ## TO MODIFY ##
 # NOTE: for the object tracker, as opposed to the object detector, objects are not mutually exclusive
@@ -41,32 +42,33 @@ DIRECTAI_STREAM_URL = "rtsp://watch.directai.io"
 HLS_OUTPUT_DIR = None ## TO MODIFY ##
 
 
-def start_rtsp_inference(access_token):
-    headers = {
-        'Authorization': f"Bearer {access_token}"
-    }
-    response = requests.post(
-        f"{DIRECTAI_BASE_URL}/run_tracker_on_url_stream",
-        headers=headers,
-        json=TRACKER_CONFIG
+# Seconds ffmpeg gets to finalize the HLS playlist after being interrupted
+RECORDER_STOP_TIMEOUT = 10
+
+
+def start_tracker_on_stream(client, tracker_config):
+    response = client.post(
+        "/run_tracker_on_url_stream",
+        json=tracker_config
     )
-    response_json = response.json()
-    tracker_instance_id = response_json["tracker_instance_id"]
+    if response.status_code != 200:
+        raise ValueError(response.json()['message'])
+    return response.json()["tracker_instance_id"]
+
+def start_rtsp_inference(client):
+    tracker_instance_id = start_tracker_on_stream(client, TRACKER_CONFIG)
     print(f"View stream here: {DIRECTAI_STREAM_URL}/{tracker_instance_id}")
     return tracker_instance_id
 
-def stop_rtsp_inference(access_token, tracker_instance_id):
-    headers = {
-        'Authorization': f"Bearer {access_token}"
-    }
-    response = requests.post(
-        f"{DIRECTAI_BASE_URL}/stop_tracker?tracker_instance_id={tracker_instance_id}",
-        headers=headers
+def stop_rtsp_inference(client, tracker_instance_id):
+    response = client.post(
+        "/stop_tracker",
+        params={'tracker_instance_id': tracker_instance_id}
     )
     return response.json()
 
 
-def record_annotated_stream_via_hls(rtsp_url, hls_output_dir):
+def prep_hls_output_dir(hls_output_dir):
     if hls_output_dir is None:
         raise ValueError("HLS Output Directory not set.")
     
@@ -82,22 +84,54 @@ def record_annotated_stream_via_hls(rtsp_url, hls_output_dir):
                     os.unlink(file_path)
             except Exception as e:
                 print(e)
-    
-    # switch to running the ffmpeg command to transmux the broadcasted stream to HLS
-    os.system(f"ffmpeg -rtsp_transport tcp -i {rtsp_url} -f hls -hls_time 5 -hls_list_size 0 -hls_segment_filename '{hls_output_dir}/segment_%05d.ts' {hls_output_dir}/playlist.m3u8")
+
+def hls_command(rtsp_url, hls_output_dir, segment_prefix='segment', append=False):
+    # ffmpeg arguments to transmux the broadcasted stream to HLS (an argument list, so URLs and paths aren't shell-parsed)
+    command = [
+        'ffmpeg', '-nostdin', '-loglevel', 'error',
+        '-rtsp_transport', 'tcp', '-i', rtsp_url,
+        '-f', 'hls', '-hls_time', '5', '-hls_list_size', '0',
+        '-hls_segment_filename', f"{hls_output_dir}/{segment_prefix}_%05d.ts"
+    ]
+    if append:
+        # Restarted recorders keep extending the same playlist
+        command += ['-hls_flags', 'append_list']
+    return command + [f"{hls_output_dir}/playlist.m3u8"]
+
+def record_annotated_stream_via_hls(rtsp_url, hls_output_dir):
+    prep_hls_output_dir(hls_output_dir)
+    # ffmpeg runs in the background so the caller can still stop the stream while recording
+    return subprocess.Popen(hls_command(rtsp_url, hls_output_dir))
+
+def stop_recorder(recorder):
+    # SIGINT lets ffmpeg write out the last segment and playlist before exiting
+    if recorder.poll() is None:
+        recorder.send_signal(signal.SIGINT)
+        try:
+            recorder.wait(timeout=RECORDER_STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            recorder.kill()
+            recorder.wait()
+
+def wait_for_interrupt():
+    # Sleeps until CTRL-C (or SIGTERM) instead of spinning a CPU core
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    while True:
+        time.sleep(3600)
 
 
 if __name__ == '__main__':
-    access_token = get_directai_access_token(DIRECTAI_CLIENT_ID, DIRECTAI_CLIENT_SECRET)
-    tracker_instance_id = start_rtsp_inference(access_token)
+    client = DirectAIClient(DIRECTAI_BASE_URL, DIRECTAI_CLIENT_ID, DIRECTAI_CLIENT_SECRET)
+    tracker_instance_id = start_rtsp_inference(client)
     
+    recorder = None
     if HLS_OUTPUT_DIR is not None:
         # wait for the stream to start
         print("Waiting 10 seconds for stream to start so we can record it...")
         time.sleep(10)
         try:
             print("Recording stream...")
-            record_annotated_stream_via_hls(f"{DIRECTAI_STREAM_URL}/{tracker_instance_id}", HLS_OUTPUT_DIR)
+            recorder = record_annotated_stream_via_hls(f"{DIRECTAI_STREAM_URL}/{tracker_instance_id}", HLS_OUTPUT_DIR)
         except Exception as e:
             print(f"Error recording stream: {e}")
     else:
@@ -105,10 +139,11 @@ if __name__ == '__main__':
         
     try:
         print("Press CTRL-C to stop stream.")
-        while True:
-            pass
+        wait_for_interrupt()
     except KeyboardInterrupt:
-        response = stop_rtsp_inference(access_token,tracker_instance_id)
+        if recorder is not None:
+            stop_recorder(recorder)
+        response = stop_rtsp_inference(client, tracker_instance_id)
         if "OK" in response["message"]:
             print("Stream inference stopped successfully.")
     
\ No newline at end of file
@@ -0,0 +1,145 @@
+import os
+import sys
+import hashlib
+import fnmatch
+import click
+
+
+SUPPORTED_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+class ScanStats:
+    def __init__(self):
+        self.yielded = 0
+        self.skipped_unsupported = 0
+        self.excluded = 0
+        self.other_shards = 0
+        self.skipped_unreadable = 0
+
+    def summary(self):
+        shards = f", {self.other_shards} left to other shards" if self.other_shards else ''
+        unreadable = f", {self.skipped_unreadable} unreadable videos skipped" if self.skipped_unreadable else ''
+        return (
+            f"Scanner: {self.yielded} files queued, "
+            f"{self.skipped_unsupported} unsupported files skipped, {self.excluded} filtered out{shards}{unreadable}"
+        )
+
+
+def matches_any(relative_path, patterns):
+    # Globs match either the path relative to data_dir or just the file name
+    name = relative_path.rsplit('/', 1)[-1]
+    return any(fnmatch.fnmatch(relative_path, p) or fnmatch.fnmatch(name, p) for p in patterns)
+
+def iter_directory(data_dir, recursive=False):
+    # Yields paths relative to data_dir as scandir produces them, without listing the whole tree first
+    pending = ['']
+    while pending:
+        relative_dir = pending.pop()
+        with os.scandir(os.path.join(data_dir, relative_dir) if relative_dir else data_dir) as entries:
+            for entry in entries:
+                relative_path = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+                if entry.is_dir():
+                    if recursive:
+                        pending.append(relative_path)
+                    continue
+                yield relative_path
+
+def iter_manifest(manifest):
+    # One path per line; '-' reads from stdin. Relative paths are relative to data_dir
+    f = sys.stdin if manifest == '-' else open(manifest)
+    try:
+        for line in f:
+            path = line.strip()
+            if path and not path.startswith('#'):
+                yield path
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def parse_shard(value):
+    # "i/N" with 1 <= i <= N, or None for the whole collection
+    if value is None:
+        return None
+    index, _, count = value.partition('/')
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise click.BadParameter(f"expected i/N (e.g. 1/4), got {value}")
+    if not 1 <= index <= count:
+        raise click.BadParameter(f"shard index must be between 1 and {count}, got {index}")
+    return index, count
+
+def shard_option(ctx, param, value):
+    return parse_shard(value)
+
+def shard_of(key, count):
+    # Stable across machines, Python versions and runs (unlike hash()), so every node agrees on the split
+    digest = hashlib.md5(key.replace('\\', '/').encode()).digest()
+    return int.from_bytes(digest[:8], 'big') % count + 1
+
+def shard_results_dir(results_dir, shard):
+    # Each shard keeps its own results files and class folders; merge_shards.py combines them
+    if shard is None:
+        return results_dir
+    return os.path.join(results_dir, f"shard-{shard[0]}-of-{shard[1]}")
+
+def iter_collection(
+    data_dir,
+    recursive=False,
+    include=(),
+    exclude=(),
+    manifest=None,
+    extensions=SUPPORTED_IMAGE_EXTENSIONS,
+    skip=None,
+    stats=None,
+    shard=None
+):
+    # Streams the keys of the files to process: paths relative to data_dir (plain filenames for a flat directory)
+    # Unsupported files are counted and skipped instead of aborting the run
+    stats = stats if stats is not None else ScanStats()
+    paths = iter_manifest(manifest) if manifest is not None else iter_directory(data_dir, recursive)
+    for relative_path in paths:
+        if not relative_path.lower().endswith(extensions):
+            stats.skipped_unsupported += 1
+            continue
+        if (include and not matches_any(relative_path, include)) or (exclude and matches_any(relative_path, exclude)):
+            stats.excluded += 1
+            continue
+        # Sharded by relative path, so all frames of a video stay on one node
+        if shard is not None and shard_of(relative_path, shard[1]) != shard[0]:
+            stats.other_shards += 1
+            continue
+        if skip is not None and relative_path in skip:
+            continue
+        stats.yielded += 1
+        yield relative_path
+
+def count_collection(
+    data_dir,
+    recursive=False,
+    include=(),
+    exclude=(),
+    manifest=None,
+    extensions=SUPPORTED_IMAGE_EXTENSIONS,
+    skip=None,
+    shard=None,
+    uncountable_extensions=()
+):
+    # How many keys iter_collection will yield, for a progress bar total, when that is cheap to know:
+    # one flat directory listing or a manifest file. None for recursive scans and stdin manifests,
+    # and when a match expands into an unknown number of items (a video's sampled frames)
+    if recursive or manifest == '-':
+        return None
+    total = 0
+    for relative_path in iter_collection(data_dir, False, include, exclude, manifest, extensions, skip, shard=shard):
+        if relative_path.lower().endswith(uncountable_extensions):
+            return None
+        total += 1
+    return total
+
+def result_relpath(key):
+    # Where a key's outputs go under a results folder: its relative path, or just the file name
+    # for manifest entries that are absolute or point outside data_dir
+    if os.path.isabs(key) or '..' in key.replace('\\', '/').split('/'):
+        return os.path.basename(key)
+    return key
@@ -0,0 +1,193 @@
+import time
+import random
+import threading
+import requests
+
+
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+# The only failure a non-idempotent request (e.g. a deploy) is retried on: the server turned it away unprocessed
+NON_IDEMPOTENT_RETRYABLE_STATUS_CODES = (429,)
+RETRYABLE_EXCEPTIONS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError
+)
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 30.0
+# Back off once smoothed latency exceeds this multiple of the best smoothed latency seen
+DEFAULT_LATENCY_TOLERANCE = 2.0
+MULTIPLICATIVE_DECREASE = 0.5
+LATENCY_SMOOTHING = 0.2
+# Samples per endpoint before latency is trusted as a congestion signal (the first requests are noisy)
+LATENCY_WARMUP_SAMPLES = 10
+
+
+class TokenBucket:
+    # Classic token bucket: `rate` requests per second with bursts of up to `burst`
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Blocks until a token is available and returns how long we waited
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return waited
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class AdaptiveConcurrencyLimiter:
+    # AIMD concurrency window: grows by ~1 per round trip while latency is healthy,
+    # halves (at most once per round trip) on errors, throttling or latency blow-ups
+    # Latency baselines are kept per endpoint, since e.g. deploys and inference differ wildly
+    def __init__(self, max_concurrency, min_concurrency=1, latency_tolerance=DEFAULT_LATENCY_TOLERANCE, adaptive=True):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.latency_tolerance = latency_tolerance
+        self.adaptive = adaptive
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.decreases = 0
+        self._smoothed_latency = {}
+        self._best_latency = {}
+        self._samples = {}
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        # Blocks until the current window has room and returns how long we waited
+        start = time.monotonic()
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+        return time.monotonic() - start
+
+    def release(self, latency, congested, key=None):
+        with self._condition:
+            self.in_flight -= 1
+            if self.adaptive:
+                self._update(latency, congested, key)
+            self._condition.notify_all()
+
+    def _update(self, latency, congested, key):
+        smoothed = self._smoothed_latency.get(key)
+        smoothed = latency if smoothed is None else smoothed + LATENCY_SMOOTHING * (latency - smoothed)
+        self._smoothed_latency[key] = smoothed
+        self._samples[key] = self._samples.get(key, 0) + 1
+        if self._samples[key] >= LATENCY_WARMUP_SAMPLES:
+            best = min(self._best_latency.get(key, smoothed), smoothed)
+            self._best_latency[key] = best
+            congested = congested or smoothed > best * self.latency_tolerance
+        now = time.monotonic()
+        if congested:
+            if now - self._last_decrease >= smoothed:
+                self.limit = max(self.min_concurrency, self.limit * MULTIPLICATIVE_DECREASE)
+                self._last_decrease = now
+                self.decreases += 1
+        else:
+            self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+
+
+class RequestScheduler:
+    # Wraps every API request with rate limiting, an adaptive concurrency window and
+    # retries with full-jitter exponential backoff for 429/5xx/connection errors
+    def __init__(
+        self,
+        max_concurrency,
+        min_concurrency=1,
+        rate_limit=None,
+        burst=None,
+        max_retries=DEFAULT_MAX_RETRIES,
+        backoff_base=DEFAULT_BACKOFF_BASE,
+        backoff_max=DEFAULT_BACKOFF_MAX,
+        adaptive=True
+    ):
+        self.limiter = AdaptiveConcurrencyLimiter(max_concurrency, min_concurrency, adaptive=adaptive)
+        self.bucket = TokenBucket(rate_limit, burst) if rate_limit else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.retries_by_reason = {}
+        self.rate_limited_seconds = 0.0
+        self.concurrency_wait_seconds = 0.0
+        self.backoff_seconds = 0.0
+
+    def call(self, send, key=None, idempotent=True, upload_finished=None):
+        # send() performs one attempt and returns a requests.Response; key groups latencies (e.g. by endpoint)
+        # Non-idempotent requests are only retried on 429, since a 5xx or dropped connection may come after the server acted
+        # upload_finished() gives the monotonic time the request body was fully sent (or None), so the latency
+        # judged for congestion is the server's response time, not how long a large upload took
+        attempt = 0
+        while True:
+            rate_wait = self.bucket.acquire() if self.bucket is not None else 0.0
+            slot_wait = self.limiter.acquire()
+            start = time.monotonic()
+            response, error = None, None
+            try:
+                response = send()
+            except RETRYABLE_EXCEPTIONS as e:
+                error = e
+            finally:
+                end = time.monotonic()
+                sent = upload_finished() if upload_finished is not None else None
+                latency = end - (sent if sent is not None and sent > start else start)
+                failed = error is not None or (response is not None and response.status_code in RETRYABLE_STATUS_CODES)
+                self.limiter.release(latency, congested=failed, key=key)
+            if idempotent:
+                retryable = failed
+            else:
+                retryable = response is not None and response.status_code in NON_IDEMPOTENT_RETRYABLE_STATUS_CODES
+            self._record(rate_wait, slot_wait)
+            if not retryable or attempt >= self.max_retries:
+                if error is not None:
+                    raise error
+                return response
+            reason = type(error).__name__ if error is not None else str(response.status_code)
+            self._backoff(attempt, reason, response)
+            attempt += 1
+
+    def _backoff(self, attempt, reason, response):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        # Honor the server's own hint when it sends one
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after is not None:
+            try:
+                delay = max(delay, min(self.backoff_max, float(retry_after)))
+            except ValueError:
+                pass
+        with self._lock:
+            self.retries += 1
+            self.retries_by_reason[reason] = self.retries_by_reason.get(reason, 0) + 1
+            self.backoff_seconds += delay
+        time.sleep(delay)
+
+    def _record(self, rate_wait, slot_wait):
+        with self._lock:
+            self.requests += 1
+            self.rate_limited_seconds += rate_wait
+            self.concurrency_wait_seconds += slot_wait
+
+    def summary(self):
+        reasons = ', '.join(f"{reason}: {count}" for reason, count in sorted(self.retries_by_reason.items()))
+        return (
+            f"Scheduler: {self.requests} requests, {self.retries} retries" + (f" ({reasons})" if reasons else "") + "\n"
+            f"Scheduler: final concurrency {int(self.limiter.limit)}/{self.limiter.max_concurrency} "
+            f"after {self.limiter.decreases} back-offs; throttled {self.rate_limited_seconds:.1f}s by the rate limit, "
+            f"{self.backoff_seconds:.1f}s in retry backoff, {self.concurrency_wait_seconds:.1f}s waiting for a concurrency slot"
+        )
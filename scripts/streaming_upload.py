@@ -0,0 +1,166 @@
+import os
+import time
+import hashlib
+import threading
+
+from requests.utils import to_key_val_list, guess_filename
+from urllib3 import filepost
+from urllib3.fields import RequestField
+
+
+DEFAULT_UPLOAD_CHUNK_SIZE = 1 << 18
+DEFAULT_UPLOAD_BUDGET_MB = 256
+# Files at or below this size are read once up front and shared by hashing, decoding and upload
+STREAM_THRESHOLD_BYTES = 8 << 20
+
+
+class FileSource:
+    # A large file's contents as get_file_data hands them out: read in chunks when uploaded or hashed, held whole
+    # only once something decodes it. Stands in for the bytes in a files dict; len() is the file size
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self._content = None
+        self._sha256 = None
+
+    def __len__(self):
+        return self.size
+
+    def iter_chunks(self, chunk_size=DEFAULT_UPLOAD_CHUNK_SIZE):
+        if self._content is not None:
+            yield self._content
+            return
+        yield from self._read_chunks(chunk_size)
+
+    def _read_chunks(self, chunk_size):
+        # Exactly size bytes, so a Content-Length computed up front stays true
+        remaining = self.size
+        with open(self.path, 'rb') as f:
+            while remaining:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    raise ValueError(f"{self.path} shrank while it was being read")
+                remaining -= len(chunk)
+                yield chunk
+
+    def read(self):
+        # The whole file, for consumers that decode the image (preprocessing, tiling, dedup, annotation)
+        # Kept and hashed in the same pass, so later decoders, the upload and the cache key don't go back to disk
+        if self._content is None:
+            digest = hashlib.sha256()
+            chunks = []
+            for chunk in self._read_chunks(DEFAULT_UPLOAD_CHUNK_SIZE):
+                digest.update(chunk)
+                chunks.append(chunk)
+            self._content = b''.join(chunks)
+            self._sha256 = digest.hexdigest()
+        return self._content
+
+    def sha256(self):
+        if self._sha256 is None:
+            digest = hashlib.sha256()
+            for chunk in self.iter_chunks():
+                digest.update(chunk)
+            self._sha256 = digest.hexdigest()
+        return self._sha256
+
+
+def read_content(content):
+    # Bytes of a files-dict entry, whether it was read up front or streamed
+    return content.read() if isinstance(content, FileSource) else content
+
+
+class MultipartBody:
+    # multipart/form-data body for a requests-style files dict, byte-for-byte what requests would encode
+    # (same urllib3 field headers and framing) but produced chunk by chunk from FileSource entries
+    # Every iteration starts from the beginning, so a retried request just iterates it again
+    def __init__(self, files, chunk_size=DEFAULT_UPLOAD_CHUNK_SIZE, boundary=None):
+        self.boundary = boundary or filepost.choose_boundary()
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.chunk_size = chunk_size
+        self.parts = []
+        # Mirrors requests.models.RequestEncodingMixin._encode_files
+        for name, value in to_key_val_list(files):
+            filename, content_type, headers = None, None, None
+            if isinstance(value, (tuple, list)):
+                if len(value) == 2:
+                    filename, content = value
+                elif len(value) == 3:
+                    filename, content, content_type = value
+                else:
+                    filename, content, content_type, headers = value
+            else:
+                filename = guess_filename(value) or name
+                content = value
+            if content is None:
+                continue
+            if isinstance(content, str):
+                content = content.encode('utf-8')
+            elif isinstance(content, int):
+                content = str(content).encode('utf-8')
+            elif hasattr(content, 'read') and not isinstance(content, FileSource):
+                content = content.read()
+            field = RequestField(name=name, data=b'', filename=filename, headers=headers)
+            field.make_multipart(content_type=content_type)
+            header = f"--{self.boundary}\r\n".encode('latin-1') + field.render_headers().encode('utf-8')
+            self.parts.append((header, content))
+        if not self.parts:
+            raise ValueError("Files must be provided.")
+        self.trailer = f"--{self.boundary}--\r\n".encode('latin-1')
+        # Monotonic time the last byte was handed to the connection, for timing the server's response alone
+        self.finished_at = None
+        self.length = sum(len(header) + len(content) + 2 for header, content in self.parts) + len(self.trailer)
+
+    def __len__(self):
+        # requests sends this as the Content-Length instead of chunking the body
+        return self.length
+
+    def __iter__(self):
+        self.finished_at = None
+        for header, content in self.parts:
+            yield header
+            if isinstance(content, FileSource):
+                yield from content.iter_chunks(self.chunk_size)
+            else:
+                yield bytes(content)
+            yield b'\r\n'
+        yield self.trailer
+        # Reached once the sender asks for more after writing the trailer
+        self.finished_at = time.monotonic()
+
+
+class UploadBudget:
+    # Caps the bytes of request bodies in flight across every thread sharing a client
+    # A body larger than the whole budget waits until nothing else is in flight, then goes alone
+    def __init__(self, max_bytes):
+        self.max_bytes = max(1, int(max_bytes))
+        self.in_flight = 0
+        self.peak = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self, size):
+        # Blocks until size bytes fit and returns how much of the budget was taken
+        size = min(size, self.max_bytes)
+        start = time.monotonic()
+        with self._condition:
+            if self.in_flight and self.in_flight + size > self.max_bytes:
+                self.waits += 1
+                while self.in_flight and self.in_flight + size > self.max_bytes:
+                    self._condition.wait()
+            self.in_flight += size
+            self.peak = max(self.peak, self.in_flight)
+            self.wait_seconds += time.monotonic() - start
+        return size
+
+    def release(self, size):
+        with self._condition:
+            self.in_flight -= size
+            self._condition.notify_all()
+
+    def summary(self):
+        return (
+            f"Uploads: peak {self.peak / 1e6:.1f} of {self.max_bytes / 1e6:.0f} MB in flight; "
+            f"{self.waits} uploads waited {self.wait_seconds:.1f}s for the budget"
+        )
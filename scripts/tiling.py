@@ -0,0 +1,99 @@
+import os
+import sys
+import math
+import cv2
+import numpy as np
+
+parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_directory)
+from utils import bounded_map
+from preprocessing import encode_frame_data, rescale_detections, DEFAULT_ENCODE_QUALITY
+from nms import class_wise_nms
+from metrics import RunMetrics
+from streaming_upload import read_content
+
+
+DEFAULT_TILE_OVERLAP = 128
+DEFAULT_TILE_CONCURRENCY = 4
+
+
+class TilingOptions:
+    # Splits large images into overlapping tiles detected separately and merged client-side
+    def __init__(
+        self,
+        tile_size=None,
+        overlap=DEFAULT_TILE_OVERLAP,
+        concurrency=DEFAULT_TILE_CONCURRENCY,
+        encode_format=None,
+        encode_quality=DEFAULT_ENCODE_QUALITY,
+        max_side=None
+    ):
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.concurrency = concurrency
+        self.encode_format = encode_format
+        self.encode_quality = encode_quality
+        self.max_side = max_side
+
+    @property
+    def enabled(self):
+        return self.tile_size is not None
+
+    def signature(self):
+        # Tiled and whole-image detections of the same file are cached separately
+        if not self.enabled:
+            return ''
+        return f"tile_size={self.tile_size},overlap={self.overlap},format={self.encode_format},quality={self.encode_quality},max_side={self.max_side}"
+
+
+def tile_origins(length, tile_size, overlap):
+    # Start offsets along one axis: tiles at both edges and spread evenly, overlapping by at least overlap
+    if length <= tile_size:
+        return [0]
+    count = math.ceil((length - tile_size) / (tile_size - overlap)) + 1
+    return [round(index * (length - tile_size) / (count - 1)) for index in range(count)]
+
+def tile_grid(width, height, tile_size, overlap):
+    # (x0, y0, x1, y1) of every tile, row by row
+    # Past half a tile, each extra pixel of overlap multiplies the tile count without covering anything new
+    overlap = min(overlap, tile_size // 2)
+    return [
+        (x0, y0, min(width, x0 + tile_size), min(height, y0 + tile_size))
+        for y0 in tile_origins(height, tile_size, overlap)
+        for x0 in tile_origins(width, tile_size, overlap)
+    ]
+
+def shift_detections(dets, x0, y0):
+    # Maps boxes from tile coordinates to image coordinates
+    if x0 == 0 and y0 == 0:
+        return dets
+    return [
+        {**det, 'tlbr': [det['tlbr'][0] + x0, det['tlbr'][1] + y0, det['tlbr'][2] + x0, det['tlbr'][3] + y0]}
+        for det in dets
+    ]
+
+def detect_tiled(file_data, options, detect, nms_threshold, metrics=None):
+    # detect(files) posts one tile and returns its detections; at most options.concurrency tiles are in flight per image
+    # Returns the merged detections in image coordinates, or None if the image fits in a single tile
+    metrics = metrics if metrics is not None else RunMetrics('tiling')
+    fp, data, image_type = file_data['data']
+    with metrics.stage('tile_decode'):
+        image = cv2.imdecode(np.frombuffer(read_content(data), dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"{fp} could not be decoded")
+    height, width = image.shape[:2]
+    tiles = tile_grid(width, height, options.tile_size, options.overlap)
+    if len(tiles) == 1:
+        return None
+    encode_format = options.encode_format or ('png' if image_type == 'image/png' else 'jpg')
+
+    def detect_tile(tile):
+        x0, y0, x1, y1 = tile
+        with metrics.stage('tile_encode'):
+            tile_data, factors = encode_frame_data(image[y0:y1, x0:x1], f"{fp}@{x0},{y0}", encode_format, options.encode_quality, options.max_side)
+        return shift_detections(rescale_detections(detect(tile_data), factors), x0, y0)
+
+    dets = [det for _, tile_dets in bounded_map(detect_tile, tiles, options.concurrency) for det in tile_dets]
+    # Objects in the overlaps are found by more than one tile
+    with metrics.stage('tile_merge'):
+        return class_wise_nms(dets, nms_threshold)
@@ -2,27 +2,39 @@ import requests
 import os
 import sys
 import hashlib
-import cv2
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(parent_directory)
+from streaming_upload import FileSource
 
 # get the authorization token
-def get_directai_access_token(
+def fetch_directai_token(
     client_id,
     client_secret,
-    auth_endpoint = "https://api.alpha.directai.io/token"
+    auth_endpoint = "https://api.alpha.directai.io/token",
+    session = requests
 ):
     params = {
         "client_id": client_id,
         "client_secret": client_secret
     }
-    response = requests.post(auth_endpoint,params=params)
+    response = session.post(auth_endpoint,params=params)
     if response.status_code != 200:
         raise ValueError("Invalid DirectAI Credentials")
-    return response.json()["access_token"]
+    return response.json()
 
-def get_file_data(fp):
+def get_directai_access_token(
+    client_id,
+    client_secret,
+    auth_endpoint = "https://api.alpha.directai.io/token",
+    session = requests
+):
+    return fetch_directai_token(client_id, client_secret, auth_endpoint, session)["access_token"]
+
+def get_file_data(fp, stream_threshold=None):
     # Open the file in binary mode
     suffix = fp.split('.')[-1].lower()
     
@@ -33,8 +45,12 @@ def get_file_data(fp):
     else:
         raise ValueError(f"{fp} is an unsupported image type")
     
-    with open(fp, 'rb') as f:
-        file_data = f.read()
+    if stream_threshold is not None and os.path.getsize(fp) > stream_threshold:
+        # Read in chunks only when uploaded, hashed or decoded, so concurrent large uploads don't each hold the whole file
+        file_data = FileSource(fp)
+    else:
+        with open(fp, 'rb') as f:
+            file_data = f.read()
 
     # Create the files dictionary
     files = {
@@ -42,6 +58,25 @@ def get_file_data(fp):
     }
     return files
 
+def bounded_map(fn, items, max_in_flight):
+    # Runs fn over items on a thread pool with at most max_in_flight calls running at once
+    # Results are yielded as (item, result) in submission order so outputs stay deterministic
+    max_in_flight = max(1, max_in_flight)
+    executor = ThreadPoolExecutor(max_workers=max_in_flight)
+    pending = deque()
+    try:
+        for item in items:
+            pending.append((item, executor.submit(fn, item)))
+            # Keep a few extra calls queued so one slow request doesn't idle the pool
+            if len(pending) >= 2 * max_in_flight:
+                done_item, future = pending.popleft()
+                yield done_item, future.result()
+        while pending:
+            done_item, future = pending.popleft()
+            yield done_item, future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
 def get_color(class_id):
     # Use a hash function to generate a unique and stable color for each class_id
     hash_object = hashlib.md5(class_id.encode())
@@ -55,6 +90,8 @@ def get_color(class_id):
 
 def display_bounding_boxes(image, dets):
     # image is assumed to be an OpenCV image
+    # cv2 is only imported here, so scripts that never draw don't pay for it at startup
+    import cv2
     colors = {}
     for bbox in dets:
         tlbr = bbox['tlbr']
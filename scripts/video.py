@@ -0,0 +1,191 @@
+import os
+import sys
+import bisect
+import cv2
+
+parent_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_directory)
+from utils import get_file_data, display_bounding_boxes
+from streaming_upload import STREAM_THRESHOLD_BYTES
+from preprocessing import encode_frame_data, DEFAULT_ENCODE_QUALITY
+from nms import box_iou
+
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.m4v', '.webm')
+FRAME_SEPARATOR = '#'
+# Sampling when neither a stride nor an interval is given
+DEFAULT_FRAME_INTERVAL = 1.0
+# Boxes in consecutive sampled frames with at least this IoU are treated as the same object
+INTERPOLATION_MIN_IOU = 0.1
+
+
+class UnreadableVideoError(ValueError):
+    pass
+
+
+def is_video(key):
+    return key.lower().endswith(VIDEO_EXTENSIONS)
+
+def frame_key(key, frame_index):
+    return f"{key}{FRAME_SEPARATOR}{frame_index}"
+
+def split_frame_key(key):
+    # Returns (video key, frame index) for a frame key, or (key, None) for anything else
+    video_key, separator, frame_index = key.rpartition(FRAME_SEPARATOR)
+    if separator and is_video(video_key) and frame_index.isdigit():
+        return video_key, int(frame_index)
+    return key, None
+
+def frame_stride(capture, stride=None, interval=None):
+    if stride is not None:
+        return stride
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    interval = interval if interval is not None else DEFAULT_FRAME_INTERVAL
+    return max(1, round(interval * fps)) if fps and fps > 0 else 1
+
+def iter_video_frames(path, stride=None, interval=None, skip=None):
+    # Yields (frame_index, frame) for every stride-th frame (or one per interval seconds)
+    # Frames in between are only grabbed, not decoded, and so are sampled frames listed in skip
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise UnreadableVideoError(f"{path} could not be opened as a video")
+    try:
+        step = frame_stride(capture, stride, interval)
+        frame_index = 0
+        while capture.grab():
+            if frame_index % step == 0 and (skip is None or frame_index not in skip):
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                yield frame_index, frame
+            frame_index += 1
+    finally:
+        capture.release()
+
+def expand_videos(data_dir, keys, stride=None, interval=None, skip=None, stats=None):
+    # Streams (key, frame) work items: (key, None) for images, (file#frame_index, frame) for sampled video frames
+    # Decoding stays lazy, so only the frames bounded_map has in flight are held in memory
+    # A video that can't be opened is logged and counted in stats instead of ending the run
+    # Frames a resumed run already recorded, grouped by video
+    completed_frames = {}
+    for video_key, frame_index in map(split_frame_key, skip or ()):
+        if frame_index is not None:
+            completed_frames.setdefault(video_key, set()).add(frame_index)
+    for key in keys:
+        if not is_video(key):
+            yield key, None
+            continue
+        try:
+            for frame_index, frame in iter_video_frames(os.path.join(data_dir, key), stride, interval, completed_frames.get(key)):
+                yield frame_key(key, frame_index), frame
+        except UnreadableVideoError as e:
+            print(f"Skipping {key}: {e}", file=sys.stderr)
+            if stats is not None:
+                stats.skipped_unreadable += 1
+
+def load_file_data(data_dir, key, frame=None, encode_format=None, encode_quality=DEFAULT_ENCODE_QUALITY):
+    # get_file_data for images (streamed only past STREAM_THRESHOLD_BYTES); video frames are encoded in memory (in the worker threads) instead
+    if frame is None:
+        return get_file_data(os.path.join(data_dir, key), STREAM_THRESHOLD_BYTES)
+    files, _ = encode_frame_data(frame, os.path.join(data_dir, key), encode_format or 'jpg', encode_quality)
+    return files
+
+
+def match_detections(before, after, min_iou=INTERPOLATION_MIN_IOU):
+    # Greedy same-class matching by IoU between two sampled frames; returns [(i, j), ...]
+    pairs = sorted(
+        (
+            (box_iou(a['tlbr'], b['tlbr']), i, j)
+            for i, a in enumerate(before)
+            for j, b in enumerate(after)
+            if a['class'] == b['class']
+        ),
+        reverse=True
+    )
+    used_before, used_after, matches = set(), set(), []
+    for iou, i, j in pairs:
+        if iou < min_iou:
+            break
+        if i not in used_before and j not in used_after:
+            used_before.add(i)
+            used_after.add(j)
+            matches.append((i, j))
+    return matches
+
+def interpolate_detections(before, after, t):
+    # Detections at fraction t of the way between two sampled frames
+    # Matched boxes move linearly; unmatched ones belong to whichever sampled frame is nearer
+    matches = match_detections(before, after)
+    matched_before = {i for i, _ in matches}
+    matched_after = {j for _, j in matches}
+    dets = []
+    for i, j in matches:
+        a, b = before[i], after[j]
+        dets.append({
+            **a,
+            'tlbr': [x + (y - x) * t for x, y in zip(a['tlbr'], b['tlbr'])],
+            'score': a['score'] + (b['score'] - a['score']) * t
+        })
+    if t < 0.5:
+        dets += [det for i, det in enumerate(before) if i not in matched_before]
+    else:
+        dets += [det for j, det in enumerate(after) if j not in matched_after]
+    return dets
+
+def detections_at(frame_index, keyframes, keyframe_dets):
+    # keyframes is the sorted list of sampled frame indexes
+    position = bisect.bisect_right(keyframes, frame_index)
+    if position == 0:
+        return keyframe_dets[keyframes[0]] if keyframes else []
+    before = keyframes[position - 1]
+    if before == frame_index or position == len(keyframes):
+        return keyframe_dets[before]
+    after = keyframes[position]
+    return interpolate_detections(keyframe_dets[before], keyframe_dets[after], (frame_index - before) / (after - before))
+
+def annotate_video(path, keyframe_dets, output_path):
+    # Writes every frame with boxes interpolated between the sampled frames' detections
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise UnreadableVideoError(f"{path} could not be opened as a video")
+    keyframes = sorted(keyframe_dets)
+    writer = None
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_index = 0
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            if writer is None:
+                height, width = frame.shape[:2]
+                writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+            writer.write(display_bounding_boxes(frame, detections_at(frame_index, keyframes, keyframe_dets)))
+            frame_index += 1
+    finally:
+        capture.release()
+        if writer is not None:
+            writer.release()
+
+
+class KeyframeCollector:
+    # Gathers each video's sampled-frame detections from the (ordered) results stream and
+    # hands them to on_video(video_key, keyframe_dets) once the next key belongs to something else
+    def __init__(self, on_video):
+        self.on_video = on_video
+        self.video_key = None
+        self.keyframe_dets = {}
+
+    def add(self, key, dets):
+        video_key, frame_index = split_frame_key(key)
+        if video_key != self.video_key:
+            self.flush()
+        if frame_index is not None:
+            self.video_key = video_key
+            self.keyframe_dets[frame_index] = dets
+
+    def flush(self):
+        if self.video_key is not None and self.keyframe_dets:
+            self.on_video(self.video_key, self.keyframe_dets)
+        self.video_key = None
+        self.keyframe_dets = {}
@@ -0,0 +1,144 @@
+import json
+import time
+import random
+import asyncio
+import click
+
+from urllib.parse import urlparse
+
+
+DEFAULT_STREAMS = 16
+DEFAULT_FPS = 30.0
+DEFAULT_DURATION = 10.0
+DEFAULT_OBJECTS = 5
+
+
+def tracker_event(tracker_instance_id, frame_id, num_objects, rng):
+    # Shaped like a tracker callback: one frame's tracked boxes
+    return {
+        'tracker_instance_id': tracker_instance_id,
+        'frame_id': frame_id,
+        'timestamp': time.time(),
+        'tracked_objects': [
+            {
+                'track_id': index,
+                'class': rng.choice(['cell phone', 'wallet']),
+                'score': rng.random(),
+                'tlbr': [rng.uniform(0, 600), rng.uniform(0, 400), rng.uniform(600, 1280), rng.uniform(400, 720)]
+            }
+            for index in range(num_objects)
+        ]
+    }
+
+def classifier_event(tracker_instance_id, frame_id, rng):
+    scores = {name: rng.random() for name in ('thumbs up', 'thumbs down', 'peace sign', 'no gesture')}
+    return {
+        'tracker_instance_id': tracker_instance_id,
+        'frame_id': frame_id,
+        'timestamp': time.time(),
+        'scores': scores,
+        'pred': max(scores, key=scores.get)
+    }
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class LoadStats:
+    def __init__(self):
+        self.sent = 0
+        self.acknowledged = 0
+        self.rejected = 0
+        self.failed = 0
+        self.late = 0
+        self.latencies = []
+
+
+async def post(reader, writer, host, path, body):
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.split(b'\r\n')[1:]:
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':', 1)[1])
+    await reader.readexactly(length)
+    return status
+
+async def run_stream(url, stream_index, fps, duration, kind, num_objects, stats):
+    # One keep-alive connection per stream posting frames on a fixed schedule, like a tracker instance
+    parsed = urlparse(url)
+    tracker_instance_id = f"loadgen-{stream_index:04d}"
+    rng = random.Random(stream_index)
+    reader, writer = await asyncio.open_connection(parsed.hostname, parsed.port or 80)
+    interval = 1.0 / fps
+    start = time.monotonic()
+    frame_id = 0
+    try:
+        while True:
+            scheduled = start + frame_id * interval
+            if scheduled - start >= duration:
+                break
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif -delay > interval:
+                # The sink (or this generator) fell a whole frame behind schedule
+                stats.late += 1
+            event = tracker_event(tracker_instance_id, frame_id, num_objects, rng) if kind == 'tracker' else classifier_event(tracker_instance_id, frame_id, rng)
+            body = json.dumps(event).encode()
+            sent = time.perf_counter()
+            stats.sent += 1
+            try:
+                status = await post(reader, writer, parsed.netloc, parsed.path or '/', body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                stats.failed += 1
+                break
+            stats.latencies.append(time.perf_counter() - sent)
+            if status == 200:
+                stats.acknowledged += 1
+            elif status == 503:
+                stats.rejected += 1
+            else:
+                stats.failed += 1
+            frame_id += 1
+    finally:
+        writer.close()
+
+async def run_load(url, streams, fps, duration, kind, num_objects):
+    stats = LoadStats()
+    start = time.monotonic()
+    await asyncio.gather(*(
+        run_stream(url, index, fps, duration, kind, num_objects, stats)
+        for index in range(streams)
+    ))
+    return stats, time.monotonic() - start
+
+
+@click.command()
+@click.option('-u', '--url', default='http://127.0.0.1:8080/webhook', help='Webhook URL to Load')
+@click.option('-s', '--streams', default=DEFAULT_STREAMS, type=click.IntRange(min=1), help='Number of Simulated Streams')
+@click.option('--fps', default=DEFAULT_FPS, type=click.FloatRange(min=0, min_open=True), help='Callbacks per Second per Stream')
+@click.option('--duration', default=DEFAULT_DURATION, type=click.FloatRange(min=0, min_open=True), help='Seconds to Run')
+@click.option('--kind', default='tracker', type=click.Choice(['tracker', 'classifier']), help='Shape of the Simulated Callbacks')
+@click.option('--objects', default=DEFAULT_OBJECTS, type=click.IntRange(min=0), help='Tracked Objects per Tracker Callback')
+def main(url, streams, fps, duration, kind, objects):
+    stats, elapsed = asyncio.run(run_load(url, streams, fps, duration, kind, objects))
+    latencies_ms = sorted(latency * 1000 for latency in stats.latencies)
+    print(
+        f"Load: {stats.sent} callbacks in {elapsed:.1f}s ({stats.acknowledged / elapsed:.0f} acknowledged/s, "
+        f"target {streams * fps:.0f}/s); {stats.rejected} rejected, {stats.failed} failed, {stats.late} sent late"
+    )
+    print(
+        f"Load: acknowledgement latency p50 {percentile(latencies_ms, 0.5):.2f}ms, "
+        f"p99 {percentile(latencies_ms, 0.99):.2f}ms, max {percentile(latencies_ms, 1.0):.2f}ms"
+    )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,399 @@
+import os
+import re
+import json
+import gzip
+import time
+import signal
+import asyncio
+import click
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+
+
+DEFAULT_QUEUE_SIZE = 50000
+DEFAULT_BATCH_SIZE = 2000
+DEFAULT_FLUSH_INTERVAL = 0.5
+DEFAULT_ROTATE_MB = 64
+DEFAULT_ROTATE_SECONDS = 300
+DEFAULT_ENQUEUE_TIMEOUT = 1.0
+DEFAULT_MAX_BODY_KB = 1024
+DEFAULT_REPORT_EVERY = 5.0
+UNKNOWN_INSTANCE = 'unknown'
+# Suffix of files still being written; rotated files get their final name
+PARTIAL_SUFFIX = '.part'
+
+
+def partition_name(tracker_instance_id):
+    # tracker_instance_id comes from the request, so keep it to a safe single path component
+    name = re.sub(r'[^A-Za-z0-9_.-]', '_', str(tracker_instance_id))[:128].lstrip('.')
+    return name or UNKNOWN_INSTANCE
+
+def event_instance_id(payload, query):
+    # The server names the stream in the payload; a ?tracker_instance_id= on the webhook URL also works
+    if isinstance(payload, dict) and payload.get('tracker_instance_id') is not None:
+        return payload['tracker_instance_id']
+    return query.get('tracker_instance_id', [UNKNOWN_INSTANCE])[0]
+
+
+class RotatingEventFile:
+    # Append-only JSONL (optionally gzip) file for one tracker instance, rotated by size and age
+    def __init__(self, directory, compress=True, rotate_bytes=DEFAULT_ROTATE_MB * 1024 * 1024, rotate_seconds=DEFAULT_ROTATE_SECONDS):
+        self.directory = directory
+        self.compress = compress
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.files_written = 0
+        self._file = None
+        self._path = None
+        self._opened = 0.0
+        self._bytes = 0
+        self._sequence = 0
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._opened = time.time()
+        stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime(self._opened))
+        extension = 'jsonl.gz' if self.compress else 'jsonl'
+        while True:
+            self._sequence += 1
+            self._path = os.path.join(self.directory, f"events_{stamp}_{self._sequence:04d}.{extension}")
+            if not os.path.exists(self._path) and not os.path.exists(self._path + PARTIAL_SUFFIX):
+                break
+        # Low compression level: the sink has to keep up with the streams, not win on ratio
+        self._file = gzip.open(self._path + PARTIAL_SUFFIX, 'wb', compresslevel=1) if self.compress else open(self._path + PARTIAL_SUFFIX, 'wb')
+        self._bytes = 0
+
+    def write(self, data):
+        if self._file is None:
+            self._open()
+        self._file.write(data)
+        self._bytes += len(data)
+        if self._bytes >= self.rotate_bytes:
+            self.close()
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def expired(self, now):
+        return self._file is not None and now - self._opened >= self.rotate_seconds
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.close()
+        os.replace(self._path + PARTIAL_SUFFIX, self._path)
+        self.files_written += 1
+        self._file = None
+
+
+class WebhookSink:
+    # Acknowledges callbacks as soon as they are queued; a single writer thread batches them to disk
+    # When the queue stays full for enqueue_timeout the request gets a 503 with Retry-After instead
+    def __init__(
+        self,
+        output_dir,
+        queue_size=DEFAULT_QUEUE_SIZE,
+        batch_size=DEFAULT_BATCH_SIZE,
+        flush_interval=DEFAULT_FLUSH_INTERVAL,
+        compress=True,
+        rotate_mb=DEFAULT_ROTATE_MB,
+        rotate_seconds=DEFAULT_ROTATE_SECONDS,
+        enqueue_timeout=DEFAULT_ENQUEUE_TIMEOUT,
+        max_body_kb=DEFAULT_MAX_BODY_KB
+    ):
+        self.output_dir = output_dir
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compress = compress
+        self.rotate_bytes = int(rotate_mb * 1024 * 1024)
+        self.rotate_seconds = rotate_seconds
+        self.enqueue_timeout = enqueue_timeout
+        self.max_body = int(max_body_kb * 1024)
+        self.queue = None
+        self.partitions = {}
+        self.received = 0
+        self.rejected = 0
+        self.written = 0
+        self.invalid = 0
+        self.bytes_received = 0
+        self.started = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._connections = set()
+        self._stopping = False
+
+    async def start(self, host, port):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._writer_task = asyncio.create_task(self._run_writer())
+        self.server = await asyncio.start_server(self._handle_connection, host, port, backlog=1024)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        # Stop accepting, then drain whatever was acknowledged before closing the files
+        self.server.close()
+        for writer in list(self._connections):
+            writer.close()
+        await self.server.wait_closed()
+        self._stopping = True
+        await self._writer_task
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close_partitions)
+        self._executor.shutdown(wait=True)
+
+    async def _handle_connection(self, reader, writer):
+        self._connections.add(writer)
+        try:
+            while True:
+                request = await read_http_request(reader, writer, self.max_body)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status, payload = await self._dispatch(method, target, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                write_http_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except HttpError as e:
+            write_http_response(writer, e.status, {'message': e.message}, keep_alive=False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, method, target, body):
+        url = urlparse(target)
+        if method == 'GET' and url.path == '/stats':
+            return 200, self.stats()
+        if method != 'POST':
+            return 405, {'message': 'Method Not Allowed'}
+        item = (time.time(), url.path, parse_qs(url.query), body)
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self.queue.put(item), self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                return 503, {'message': 'Sink is saturated, retry later'}
+        if self.started is None:
+            # Sustained rate is measured from the first callback, not from startup
+            self.started = time.monotonic()
+        self.received += 1
+        self.bytes_received += len(body)
+        return 200, {'message': 'OK'}
+
+    async def _run_writer(self):
+        loop = asyncio.get_running_loop()
+        while not (self._stopping and self.queue.empty()):
+            batch = []
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), self.flush_interval))
+            except asyncio.TimeoutError:
+                pass
+            while batch and len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            # File I/O and compression run off the event loop, so acknowledgements keep flowing meanwhile
+            self.written += await loop.run_in_executor(self._executor, self._write_batch, batch)
+
+    def _write_batch(self, batch):
+        grouped = {}
+        for received, path, query, body in batch:
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                payload = body.decode('utf-8', errors='replace')
+                self.invalid += 1
+            record = {'received': received, 'path': path, 'event': payload}
+            line = (json.dumps(record, separators=(',', ':')) + '\n').encode()
+            grouped.setdefault(partition_name(event_instance_id(payload, query)), []).append(line)
+        for name, lines in grouped.items():
+            partition = self.partitions.get(name)
+            if partition is None:
+                partition = self.partitions[name] = RotatingEventFile(
+                    os.path.join(self.output_dir, name), self.compress, self.rotate_bytes, self.rotate_seconds
+                )
+            partition.write(b''.join(lines))
+            partition.flush()
+        # Idle streams still get their files rotated (and renamed) on time
+        now = time.time()
+        for partition in self.partitions.values():
+            if partition.expired(now):
+                partition.close()
+        return len(batch)
+
+    def _close_partitions(self):
+        for partition in self.partitions.values():
+            partition.close()
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9) if self.started is not None else 1.0
+        return {
+            'received': self.received,
+            'written': self.written,
+            'rejected': self.rejected,
+            'invalid': self.invalid,
+            'queued': self.queue.qsize() if self.queue is not None else 0,
+            'bytes_received': self.bytes_received,
+            'instances': len(self.partitions),
+            'events_per_second': self.received / elapsed
+        }
+
+    async def report(self, every):
+        last_received, last_time = 0, time.monotonic()
+        while True:
+            await asyncio.sleep(every)
+            now = time.monotonic()
+            rate = (self.received - last_received) / (now - last_time)
+            last_received, last_time = self.received, now
+            print(self.summary(rate), flush=True)
+
+    def summary(self, recent_rate=None):
+        stats = self.stats()
+        recent = f"{recent_rate:.0f} events/s now, " if recent_rate is not None else ''
+        return (
+            f"Sink: {recent}{stats['events_per_second']:.0f} events/s sustained; {stats['received']} received, "
+            f"{stats['written']} written, {stats['rejected']} rejected, {stats['queued']}/{self.queue_size} queued, "
+            f"{stats['instances']} instances"
+        )
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+LENGTH_DIGITS = {10: '0123456789', 16: '0123456789abcdefABCDEF'}
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large', 503: 'Service Unavailable'}
+
+async def read_http_request(reader, writer, max_body):
+    # Minimal HTTP/1.1 request reader (Content-Length or chunked bodies); None once the client hangs up
+    # Anything malformed is an HttpError(400), so the connection gets a response instead of a traceback
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise HttpError(400, 'Truncated request')
+        return None
+    except asyncio.LimitOverrunError:
+        raise HttpError(400, 'Request head too large')
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, _ = lines[0].split(' ', 2)
+    except ValueError:
+        raise HttpError(400, 'Malformed request line')
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    chunked = headers.get('transfer-encoding', '').lower() == 'chunked'
+    if not chunked:
+        length = parse_length(headers.get('content-length', '0') or '0', 10, 'Content-Length')
+        if length > max_body:
+            raise HttpError(413, 'Payload too large')
+    if headers.get('expect', '').lower() == '100-continue':
+        # curl and others wait for this before sending a large body
+        writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        await writer.drain()
+    if chunked:
+        body = await read_chunked_body(reader, max_body)
+    else:
+        body = await reader.readexactly(length)
+    return method, target, headers, body
+
+def parse_length(value, base, name):
+    # int() alone would accept signs (a negative length), inner whitespace and underscores
+    value = value.strip()
+    if not value or any(c not in LENGTH_DIGITS[base] for c in value):
+        raise HttpError(400, f"Invalid {name}")
+    return int(value, base)
+
+async def read_line(reader):
+    try:
+        return await reader.readuntil(b'\r\n')
+    except asyncio.LimitOverrunError:
+        raise HttpError(400, 'Chunk line too long')
+
+async def read_chunked_body(reader, max_body):
+    chunks = []
+    size = 0
+    while True:
+        chunk_size = parse_length((await read_line(reader)).split(b';')[0].decode('latin-1'), 16, 'chunk size')
+        if chunk_size == 0:
+            # Skip trailers up to the blank line
+            while (await read_line(reader)) != b'\r\n':
+                pass
+            return b''.join(chunks)
+        size += chunk_size
+        if size > max_body:
+            raise HttpError(413, 'Payload too large')
+        chunks.append(await reader.readexactly(chunk_size))
+        if await reader.readexactly(2) != b'\r\n':
+            raise HttpError(400, 'Malformed chunk')
+
+def write_http_response(writer, status, payload, keep_alive=True):
+    body = json.dumps(payload).encode()
+    head = (
+        f"HTTP/1.1 {status} {REASONS.get(status, 'OK')}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        + ("Retry-After: 1\r\n" if status == 503 else '')
+        + ("Connection: keep-alive\r\n" if keep_alive else "Connection: close\r\n")
+        + "\r\n"
+    )
+    writer.write(head.encode() + body)
+
+
+async def serve(sink, host, port, report_every):
+    bound_port = await sink.start(host, port)
+    print(f"Webhook sink listening on http://{host}:{bound_port}, writing to {sink.output_dir}", flush=True)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop_event.set)
+    reporter = asyncio.create_task(sink.report(report_every)) if report_every > 0 else None
+    await stop_event.wait()
+    if reporter is not None:
+        reporter.cancel()
+    print("Draining queued events...", flush=True)
+    await sink.stop()
+    print(sink.summary(), flush=True)
+
+
+@click.command()
+@click.option('--bind', default='127.0.0.1', help='Address to Listen On')
+@click.option('-p', '--port', default=8080, type=int, help='Port to Listen On')
+@click.option('-o', '--output-dir', default='webhook_events', help='Directory for Event Files (one subdirectory per tracker_instance_id)')
+@click.option('--no-compress', is_flag=True, default=False, help='Flag to write plain JSONL instead of gzip')
+@click.option('--rotate-mb', default=DEFAULT_ROTATE_MB, type=click.FloatRange(min=0, min_open=True), help='Rotate Event Files at This Size (MB, before compression)')
+@click.option('--rotate-seconds', default=DEFAULT_ROTATE_SECONDS, type=click.FloatRange(min=0, min_open=True), help='Rotate Event Files After This Many Seconds')
+@click.option('--queue-size', default=DEFAULT_QUEUE_SIZE, type=click.IntRange(min=1), help='Maximum Number of Acknowledged Events Waiting to be Written')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, type=click.IntRange(min=1), help='Maximum Number of Events per Disk Write')
+@click.option('--flush-interval', default=DEFAULT_FLUSH_INTERVAL, type=click.FloatRange(min=0, min_open=True), help='Maximum Seconds an Event Waits Before Being Written')
+@click.option('--enqueue-timeout', default=DEFAULT_ENQUEUE_TIMEOUT, type=click.FloatRange(min=0), help='Seconds to Wait for Queue Space Before Answering 503')
+@click.option('--max-body-kb', default=DEFAULT_MAX_BODY_KB, type=click.FloatRange(min=0, min_open=True), help='Largest Accepted Callback Body (KB)')
+@click.option('--report-every', default=DEFAULT_REPORT_EVERY, type=click.FloatRange(min=0), help='Seconds Between Throughput Reports (0 to disable)')
+def main(bind, port, output_dir, no_compress, rotate_mb, rotate_seconds, queue_size, batch_size, flush_interval, enqueue_timeout, max_body_kb, report_every):
+    sink = WebhookSink(
+        output_dir,
+        queue_size=queue_size,
+        batch_size=batch_size,
+        flush_interval=flush_interval,
+        compress=not no_compress,
+        rotate_mb=rotate_mb,
+        rotate_seconds=rotate_seconds,
+        enqueue_timeout=enqueue_timeout,
+        max_body_kb=max_body_kb
+    )
+    asyncio.run(serve(sink, bind, port, report_every))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from columnar_results import ColumnarResults, write_columnar, write_json, compact_results
+
+
+def round_trip(tmp_path, results, **kwargs):
+    path = str(tmp_path / 'results.col')
+    assert write_columnar(list(results.items()), path, **kwargs) == len(results)
+    return ColumnarResults(path)
+
+
+def test_detection_round_trip(tmp_path):
+    results = {
+        'a.jpg': [{'tlbr': [1.0, 2.0, 30.0, 40.0], 'score': 0.5, 'class': 'cat'}, {'tlbr': [0.0, 0.0, 8.0, 8.0], 'score': 0.25, 'class': 'dog'}],
+        'empty.jpg': [],
+        'sub/b.jpg': [{'tlbr': [5.0, 5.0, 9.0, 9.0], 'score': 0.75, 'class': 'dog'}]
+    }
+    columnar = round_trip(tmp_path, results)
+    assert columnar.kind == 'detection'
+    assert dict(columnar.items()) == results
+    assert columnar.result('sub/b.jpg') == results['sub/b.jpg']
+    assert list(columnar.files_with('dog')) == ['a.jpg', 'sub/b.jpg']
+    assert list(columnar.files_with('dog', min_score=0.5)) == ['sub/b.jpg']
+    with pytest.raises(KeyError):
+        columnar.index_of('missing.jpg')
+
+
+def test_empty_detection_results(tmp_path):
+    columnar = round_trip(tmp_path, {})
+    assert len(columnar) == 0
+    assert list(columnar.files_with()) == []
+
+
+def test_classification_round_trip_with_duplicates(tmp_path):
+    results = {
+        f"image_{index}.jpg": {'scores': {'cat': index / 10, 'dog': 1 - index / 10}, 'pred': 'cat' if index > 5 else 'dog'}
+        for index in range(10)
+    }
+    results['image_3.jpg']['duplicate_of'] = {'representative': 'image_2.jpg', 'distance': 2}
+    duplicates = {'image_7.jpg': {'representative': 'image_6.jpg', 'distance': 4}}
+    columnar = round_trip(tmp_path, results, duplicates=duplicates)
+    expected = json.loads(json.dumps(results))
+    expected['image_7.jpg']['duplicate_of'] = duplicates['image_7.jpg']
+    # Scores are stored as float32
+    for key, result in columnar.items():
+        assert result['pred'] == expected[key]['pred']
+        assert result.get('duplicate_of') == expected[key].get('duplicate_of')
+        assert result['scores'] == pytest.approx(expected[key]['scores'])
+    assert columnar.duplicate_of('image_0.jpg') is None
+    assert list(columnar.files_with('cat', min_score=0.8)) == ['image_8.jpg', 'image_9.jpg']
+
+
+def test_multi_classification_round_trip(tmp_path):
+    results = {
+        f"image_{index}.jpg": {
+            'clf-a': {'scores': {'cat': 0.25, 'dog': 0.75}, 'pred': 'dog'},
+            'clf-b': {'scores': {'indoor': index / 4, 'outdoor': 1 - index / 4}, 'pred': 'indoor' if index > 2 else 'outdoor'}
+        }
+        for index in range(4)
+    }
+    columnar = round_trip(tmp_path, results)
+    assert columnar.kind == 'multi_classification'
+    assert dict(columnar.items()) == results
+    assert list(columnar.files_with('indoor', classifier='clf-b')) == ['image_3.jpg']
+    assert list(columnar.files_with('dog', classifier=0)) == list(results)
+    with pytest.raises(ValueError):
+        columnar.select('dog')
+
+
+def test_unknown_fields_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match='extra'):
+        round_trip(tmp_path, {'a.jpg': {'scores': {'cat': 1.0}, 'pred': 'cat', 'extra': 1}})
+    with pytest.raises(ValueError, match='mask'):
+        round_trip(tmp_path, {'a.jpg': [{'tlbr': [0, 0, 1, 1], 'score': 1.0, 'class': 'cat', 'mask': []}]})
+
+
+def test_mismatched_classes_are_rejected(tmp_path):
+    results = {'a.jpg': {'scores': {'cat': 1.0}, 'pred': 'cat'}, 'b.jpg': {'scores': {'dog': 1.0}, 'pred': 'dog'}}
+    with pytest.raises(ValueError, match='different classes'):
+        round_trip(tmp_path, results)
+
+
+def test_compact_and_convert_back_to_json(tmp_path):
+    records = [
+        ('a.jpg', [{'tlbr': [0.0, 0.0, 4.0, 4.0], 'score': 0.5, 'class': 'cat'}]),
+        ('b.jpg', []),
+        ('a.jpg', [])
+    ]
+    with open(tmp_path / 'results.jsonl', 'w') as f:
+        for key, result in records:
+            f.write(json.dumps({'key': key, 'result': result}) + '\n')
+    assert compact_results(str(tmp_path / 'results.jsonl'), str(tmp_path), 'results', 'columnar') == 2
+    columnar = ColumnarResults(str(tmp_path / 'results.col'))
+    write_json(columnar, str(tmp_path / 'results.json'))
+    # The first record of a key wins, as when compacting straight to JSON
+    with open(tmp_path / 'results.json') as f:
+        assert json.load(f) == {'a.jpg': records[0][1], 'b.jpg': []}
+
+
+def test_arrays_are_aligned(tmp_path):
+    columnar = round_trip(tmp_path, {'a.jpg': {'scores': {'cat': 1.0}, 'pred': 'cat'}})
+    for array in columnar.arrays.values():
+        assert array.ctypes.data % 64 == 0 or array.size == 0
@@ -0,0 +1,69 @@
+import random
+
+import cv2
+import numpy as np
+
+from dedup import HammingIndex, perceptual_hash
+
+
+def flip_bits(value, count, rng, bits=64):
+    for bit in rng.sample(range(bits), count):
+        value ^= 1 << bit
+    return value
+
+
+def brute_force(values, query, radius):
+    matches = [(entry_id, (value ^ query).bit_count()) for entry_id, value in enumerate(values)]
+    matches = [match for match in matches if match[1] <= radius]
+    return min(matches, key=lambda match: match[1]) if matches else None
+
+
+def test_finds_hashes_within_radius():
+    rng = random.Random(0)
+    index = HammingIndex(radius=6)
+    values = [rng.getrandbits(64) for _ in range(2000)]
+    for value in values:
+        index.add(value)
+    assert len(index) == len(values)
+    for distance in range(0, 7):
+        for value in rng.sample(values, 50):
+            match = index.query(flip_bits(value, distance, rng))
+            assert match is not None and match[1] <= distance
+
+
+def test_ignores_hashes_beyond_radius():
+    rng = random.Random(1)
+    index = HammingIndex(radius=4)
+    value = rng.getrandbits(64)
+    index.add(value)
+    for distance in (5, 8, 20):
+        assert index.query(flip_bits(value, distance, rng)) is None
+
+
+def test_agrees_with_brute_force():
+    # Near misses in every block, including radii that aren't a multiple of the block count
+    rng = random.Random(2)
+    for radius in (0, 3, 6, 9):
+        index = HammingIndex(radius=radius)
+        values = [rng.getrandbits(64) for _ in range(300)]
+        for value in values:
+            index.add(value)
+        for _ in range(300):
+            query = flip_bits(rng.choice(values), rng.randint(0, radius + 3), rng)
+            expected = brute_force(values, query, radius)
+            match = index.query(query)
+            assert (match is None) == (expected is None)
+            if match is not None:
+                assert match[1] == expected[1]
+
+
+def test_perceptual_hash_survives_reencoding():
+    rng = np.random.default_rng(3)
+    image = cv2.resize(rng.integers(0, 255, size=(24, 32, 3), dtype=np.uint8), (640, 480), interpolation=cv2.INTER_CUBIC)
+    other = cv2.resize(rng.integers(0, 255, size=(24, 32, 3), dtype=np.uint8), (640, 480), interpolation=cv2.INTER_CUBIC)
+    original, size = perceptual_hash(cv2.imencode('.png', image)[1].tobytes())
+    reencoded, _ = perceptual_hash(cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 70])[1].tobytes())
+    different, _ = perceptual_hash(cv2.imencode('.png', other)[1].tobytes())
+    assert size == (160, 120)
+    assert (original ^ reencoded).bit_count() <= 6
+    assert (original ^ different).bit_count() > 6
@@ -0,0 +1,80 @@
+import os
+import json
+
+from scanner import shard_of
+from merge_shards import ShardMerge, find_shard_dirs
+
+
+class ListWriter:
+    def __init__(self):
+        self.records = []
+
+    def write(self, key, result):
+        self.records.append((key, result))
+
+
+def write_shard(results_dir, index, count, records, results_name='results'):
+    shard_dir = os.path.join(results_dir, f"shard-{index}-of-{count}")
+    os.makedirs(shard_dir)
+    if records is not None:
+        with open(os.path.join(shard_dir, f"{results_name}.jsonl"), 'w') as f:
+            for key, result in records:
+                f.write(json.dumps({'key': key, 'result': result}) + '\n')
+    return shard_dir
+
+
+def split(keys, count):
+    shards = {index: [] for index in range(1, count + 1)}
+    for key in keys:
+        shards[shard_of(key, count)].append((key, {'pred': key}))
+    return shards
+
+
+def test_merge_combines_every_shard(tmp_path):
+    keys = [f"image_{index}.jpg" for index in range(40)]
+    for index, records in split(keys, 3).items():
+        write_shard(str(tmp_path), index, 3, records)
+    shard_dirs, count = find_shard_dirs(str(tmp_path))
+    merge = ShardMerge(shard_dirs, count)
+    writer = ListWriter()
+    merge.merge('results', writer)
+    assert sorted(key for key, _ in writer.records) == sorted(keys)
+    assert merge.duplicates == [] and merge.misplaced == [] and merge.without_results == []
+    assert merge.missing(keys + ['new.jpg']) == ['new.jpg']
+
+
+def test_merge_keeps_the_first_shard_of_a_duplicate(tmp_path):
+    shards = split([f"image_{index}.jpg" for index in range(40)], 2)
+    stray_key, stray_result = shards[2][0]
+    shards[1].append((stray_key, {'pred': 'stale'}))
+    for index, records in shards.items():
+        write_shard(str(tmp_path), index, 2, records)
+    merge = ShardMerge(*find_shard_dirs(str(tmp_path)))
+    writer = ListWriter()
+    merge.merge('results', writer)
+    assert merge.duplicates == [(stray_key, 1, 2)]
+    # Shard 1 is read first, so its copy wins, and it is reported as in the wrong shard
+    assert merge.misplaced == [(stray_key, 1)]
+    assert [result for key, result in writer.records if key == stray_key] == [{'pred': 'stale'}]
+    assert len(writer.records) == 40
+
+
+def test_merge_reports_shards_without_results_and_missing_files(tmp_path):
+    keys = [f"image_{index}.jpg" for index in range(40)]
+    shards = split(keys, 2)
+    write_shard(str(tmp_path), 1, 2, shards[1])
+    write_shard(str(tmp_path), 2, 2, None)
+    merge = ShardMerge(*find_shard_dirs(str(tmp_path)))
+    merge.merge('results', ListWriter())
+    assert merge.without_results == [2]
+    assert sorted(merge.missing(keys)) == sorted(key for key, _ in shards[2])
+
+
+def test_video_frames_count_their_video_as_processed(tmp_path):
+    shard = shard_of('clip.mp4', 2)
+    write_shard(str(tmp_path), shard, 2, [('clip.mp4#3', {'pred': 'a'})])
+    write_shard(str(tmp_path), 3 - shard, 2, [])
+    merge = ShardMerge(*find_shard_dirs(str(tmp_path)))
+    merge.merge('results', ListWriter())
+    assert merge.misplaced == []
+    assert merge.missing(['clip.mp4']) == []
@@ -0,0 +1,77 @@
+import numpy as np
+
+from nms import box_iou, nms_indices, overlap_pairs, nms_from_pairs, class_wise_nms
+
+
+def reference_nms(boxes, scores, iou_threshold, groups):
+    # Textbook greedy NMS, one box at a time
+    keep = []
+    for index in sorted(range(len(boxes)), key=lambda index: -scores[index]):
+        if all(groups[kept] != groups[index] or box_iou(boxes[kept], boxes[index]) <= iou_threshold for kept in keep):
+            keep.append(index)
+    return keep
+
+
+def random_boxes(rng, count, groups=1):
+    # Boxes jittered around a few centers, so there are long suppression chains as well as isolated boxes
+    centers = rng.uniform(0, 200, size=(8, 2))[rng.integers(0, 8, size=count)]
+    corners = centers + rng.normal(0, 6, size=(count, 2))
+    sizes = rng.uniform(10, 40, size=(count, 2))
+    boxes = np.concatenate((corners, corners + sizes), axis=1)
+    return boxes, rng.permutation(count) / count, rng.integers(0, groups, size=count)
+
+
+def test_nms_indices_matches_greedy_reference():
+    rng = np.random.default_rng(0)
+    for iou_threshold in (0.1, 0.3, 0.5, 0.8):
+        boxes, scores, groups = random_boxes(rng, 300, groups=3)
+        assert list(nms_indices(boxes, scores, iou_threshold)) == reference_nms(boxes, scores, iou_threshold, np.zeros(300))
+        assert list(nms_indices(boxes, scores, iou_threshold, groups)) == reference_nms(boxes, scores, iou_threshold, groups)
+
+
+def test_nms_indices_edge_cases():
+    assert len(nms_indices(np.zeros((0, 4)), np.zeros(0), 0.5)) == 0
+    # Identical boxes in different groups never suppress each other; a zero-area box suppresses nothing
+    boxes = np.asarray([[0, 0, 10, 10], [0, 0, 10, 10], [5, 5, 5, 5]], dtype=np.float64)
+    assert list(nms_indices(boxes, np.asarray([0.9, 0.8, 0.7]), 0.5, groups=[0, 1, 0])) == [0, 1, 2]
+    assert list(nms_indices(boxes, np.asarray([0.9, 0.8, 0.7]), 0.5)) == [0, 2]
+
+
+def test_class_wise_nms_keeps_classes_apart():
+    dets = [
+        {'tlbr': [0, 0, 10, 10], 'score': 0.9, 'class': 'cat'},
+        {'tlbr': [1, 1, 10, 10], 'score': 0.8, 'class': 'cat'},
+        {'tlbr': [1, 1, 10, 10], 'score': 0.7, 'class': 'dog'}
+    ]
+    assert class_wise_nms(dets, 0.5) == [dets[0], dets[2]]
+
+
+def test_nms_from_pairs_matches_nms_indices():
+    rng = np.random.default_rng(1)
+    boxes, scores, groups = random_boxes(rng, 400, groups=5)
+    # overlap_pairs wants rows sorted by group, then by descending score
+    order = np.lexsort((-scores, groups))
+    boxes, scores, groups = boxes[order], scores[order], groups[order]
+    for chunk_pairs in (7, 1 << 22):
+        pairs = overlap_pairs(boxes, groups, chunk_pairs=chunk_pairs)
+        for iou_threshold in (0.2, 0.5, 0.7):
+            for min_score in (0.0, 0.5):
+                candidates = scores >= min_score
+                expected = np.zeros(len(boxes), dtype=bool)
+                subset = np.flatnonzero(candidates)
+                expected[subset[nms_indices(boxes[subset], scores[subset], iou_threshold, groups[subset])]] = True
+                assert np.array_equal(nms_from_pairs(candidates, *pairs, iou_threshold), expected)
+
+
+def test_overlap_pairs_lists_every_overlapping_pair_once():
+    rng = np.random.default_rng(2)
+    boxes, scores, groups = random_boxes(rng, 120, groups=2)
+    order = np.lexsort((-scores, groups))
+    boxes, groups = boxes[order], groups[order]
+    firsts, seconds, ious = overlap_pairs(boxes, groups, min_iou=0.1, chunk_pairs=50)
+    expected = {
+        (i, j) for i in range(len(boxes)) for j in range(i + 1, len(boxes))
+        if groups[i] == groups[j] and box_iou(boxes[i], boxes[j]) > 0.1
+    }
+    assert sorted(zip(firsts.tolist(), seconds.tolist())) == sorted(expected)
+    assert np.allclose(ious, [box_iou(boxes[i], boxes[j]) for i, j in zip(firsts, seconds)])
@@ -0,0 +1,41 @@
+import json
+
+from results_writer import load_completed_keys, open_results_writer, iter_jsonl_results, iter_json_results
+
+
+def test_resume_drops_a_truncated_last_line(tmp_path):
+    path = tmp_path / 'results.jsonl'
+    complete = ''.join(json.dumps({'key': key, 'result': {'pred': key}}) + '\n' for key in ('a.jpg', 'b.jpg'))
+    path.write_text(complete + '{"key": "c.jpg", "resu')
+    assert load_completed_keys(str(path)) == {'a.jpg', 'b.jpg'}
+    assert path.read_text() == complete
+
+
+def test_resume_drops_an_unterminated_but_parseable_line(tmp_path):
+    # A line without its newline may be cut short inside a number, so it is never trusted
+    path = tmp_path / 'results.jsonl'
+    complete = json.dumps({'key': 'a.jpg', 'result': []}) + '\n'
+    path.write_text(complete + json.dumps({'key': 'b.jpg', 'result': []}))
+    assert load_completed_keys(str(path)) == {'a.jpg'}
+    assert path.read_text() == complete
+
+
+def test_resumed_writer_appends_valid_lines(tmp_path):
+    path = tmp_path / 'results.jsonl'
+    path.write_text(json.dumps({'key': 'a.jpg', 'result': 1}) + '\n{"key": "b.j')
+    writer, completed = open_results_writer(str(tmp_path), 'results', flush_every=1, resume=True)
+    with writer:
+        writer.write('b.jpg', 2)
+    assert completed == {'a.jpg'}
+    assert list(iter_jsonl_results(str(path))) == [('a.jpg', 1), ('b.jpg', 2)]
+
+
+def test_missing_log_has_no_completed_keys(tmp_path):
+    assert load_completed_keys(str(tmp_path / 'results.jsonl')) == set()
+
+
+def test_json_results_stream_across_chunks(tmp_path):
+    results = {f"image_{index}.jpg": {'scores': {'cat': index / 7}, 'pred': 'cat'} for index in range(50)}
+    path = tmp_path / 'results.json'
+    path.write_text(json.dumps(results))
+    assert dict(iter_json_results(str(path), chunk_size=16)) == results
@@ -0,0 +1,26 @@
+from scanner import shard_of
+
+
+KEYS = [f"dir{index % 7}/image_{index}.jpg" for index in range(5000)]
+
+
+def test_shard_of_is_pinned():
+    # Shards are assigned independently on every node, so the mapping must never change between versions
+    assert shard_of('a/b.jpg', 7) == 2
+    keys = ['img_0.jpg', 'img_1.jpg', 'img_2.jpg', 'img_3.jpg', 'sub/img_4.png', 'clip.mp4']
+    assert [shard_of(key, 4) for key in keys] == [3, 1, 1, 3, 4, 1]
+
+
+def test_shard_of_normalizes_windows_separators():
+    assert shard_of('a\\b.jpg', 7) == shard_of('a/b.jpg', 7)
+
+
+def test_shards_cover_every_key_exactly_once():
+    for count in (1, 2, 3, 8):
+        shards = {index: [] for index in range(1, count + 1)}
+        for key in KEYS:
+            shards[shard_of(key, count)].append(key)
+        assert set(shards) == set(range(1, count + 1))
+        assert sorted(key for keys in shards.values() for key in keys) == sorted(KEYS)
+        # md5 spreads keys evenly, so no shard is starved
+        assert min(len(keys) for keys in shards.values()) > len(KEYS) / count * 0.8
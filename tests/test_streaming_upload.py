@@ -0,0 +1,40 @@
+import requests
+from urllib3 import filepost
+
+from streaming_upload import FileSource, MultipartBody
+
+
+BOUNDARY = '0123456789abcdef0123456789abcdef'
+
+
+def requests_body(files, monkeypatch):
+    # What requests itself sends for this files dict, with the boundary pinned
+    monkeypatch.setattr(filepost, 'choose_boundary', lambda: BOUNDARY)
+    return requests.Request('POST', 'http://localhost/classify', files=files).prepare()
+
+
+def test_body_matches_requests_encoding(tmp_path, monkeypatch):
+    path = tmp_path / 'large image.png'
+    path.write_bytes(bytes(range(256)) * 4099)
+    streamed = {
+        'data': (str(path), FileSource(str(path)), 'image/png'),
+        'config': (None, '{"classifier_configs": []}'),
+        'name': 'café',
+        'count': (None, 3)
+    }
+    encoded = {**streamed, 'data': (str(path), path.read_bytes(), 'image/png')}
+    body = MultipartBody(streamed, chunk_size=1000, boundary=BOUNDARY)
+    prepared = requests_body(encoded, monkeypatch)
+    assert b''.join(body) == prepared.body
+    assert len(body) == len(prepared.body)
+    assert body.content_type == prepared.headers['Content-Type']
+
+
+def test_body_can_be_iterated_again(tmp_path):
+    path = tmp_path / 'image.jpg'
+    path.write_bytes(b'\xff\xd8' * 1000)
+    body = MultipartBody({'data': ('image.jpg', FileSource(str(path)), 'image/jpg')}, chunk_size=64)
+    first = b''.join(body)
+    assert body.finished_at is not None
+    # A retry sends the same bytes
+    assert b''.join(body) == first